@@ -1,12 +1,84 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import os
+import sys
 import logging
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from shared.cache import ResponseCache, etag_matches, snap
+from shared.cluster import parse_bbox
+from shared.geocode import ReverseGeocoder, city_key
+from shared.metrics import PROMETHEUS_CONTENT_TYPE, from_env as metrics_from_env
+from shared.serialize import NDJSON_CONTENT_TYPE, dumps, iter_array, iter_ndjson, wants_ndjson
+from parser import Ingestor
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Events Service")
+# Лента Orgeo: локальный файл или URL, перечитывается раз в ORGEO_REFRESH секунд
+ORGEO_SOURCE = os.environ.get(
+    "ORGEO_SOURCE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "orgeo.json"))
+ORGEO_REFRESH = int(os.environ.get("ORGEO_REFRESH", 3600))
+RESPONSE_CACHE_BYTES = int(os.environ.get("RESPONSE_CACHE_BYTES", 32 * 2 ** 20))
+# Справочник населенных пунктов для города и места проведения по координатам
+GAZETTEER_PATH = os.environ.get(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "settlements.csv"))
+# Колоночный снапшот индекса: при рестарте сервис отвечает сразу, не дожидаясь
+# загрузки ленты. Пустое значение - индекс только в памяти
+EVENTS_SNAPSHOT = os.environ.get(
+    "EVENTS_SNAPSHOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "events.snapshot"))
+
+
+def load_geocoder():
+    try:
+        return ReverseGeocoder.from_file(GAZETTEER_PATH)
+    except OSError as e:
+        logger.warning(f"Gazetteer {GAZETTEER_PATH} is unavailable, cities are not resolved: {str(e)}")
+        return None
+
+
+geocoder = load_geocoder()
+ingestor = Ingestor(geocoder, EVENTS_SNAPSHOT or None)
+# Готовые ответы /api/events, версия данных - из ingestor.state
+response_cache = ResponseCache(RESPONSE_CACHE_BYTES)
+# Замеры запросов и участков; METRICS_ENABLED=0 выключает
+metrics = metrics_from_env('events-service')
+
+
+async def ingest():
+    try:
+        with metrics.span('ingest'):
+            return await asyncio.to_thread(ingestor.run, ORGEO_SOURCE)
+    except Exception as e:
+        logger.error(f"Error ingesting {ORGEO_SOURCE}: {str(e)}")
+        return None
+
+
+async def refresh_events(first_delay=ORGEO_REFRESH):
+    await asyncio.sleep(first_delay)
+    while True:
+        await ingest()
+        await asyncio.sleep(ORGEO_REFRESH)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if len(ingestor.current):
+        # Есть снапшот: отвечаем по нему, лента догружается в фоне
+        refresher = asyncio.create_task(refresh_events(0))
+    else:
+        await ingest()
+        refresher = asyncio.create_task(refresh_events())
+    yield
+    refresher.cancel()
+
+
+app = FastAPI(title="Events Service", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,20 +87,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-MOCK_EVENTS = [
-    {
-        "id": 1, "title": "Московский марафон 2024", "sport": "бег",
-        "description": "Ежегодный осенний марафон через центр Москвы",
-        "date": "2024-09-15", "location": "Москва, Воробьевы горы",
-        "lat": 55.710, "lng": 37.553
-    },
-    {
-        "id": 2, "title": "Ночной велопробег", "sport": "велоспорт",
-        "description": "Ночная велопрогулка по освещенным улицам города",
-        "date": "2024-10-20", "location": "Москва, Парк Горького",
-        "lat": 55.731, "lng": 37.603
-    }
-]
+
+if metrics.enabled:
+    @app.middleware("http")
+    async def time_requests(request: Request, call_next):
+        timer = metrics.begin(request.method)
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Шаблон маршрута, а не путь: параметры не плодят метки
+            route = request.scope.get('route')
+            metrics.finish(timer, status, route.path if route is not None else 'unmatched')
 
 
 @app.get("/")
@@ -38,24 +110,103 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "service": "events"}
-
-
-@app.get("/api/events")
-async def get_events(sport: str = None, lat: float = None, lng: float = None, radius: int = None):
-    events = MOCK_EVENTS.copy()
-
-    if sport:
-        events = [e for e in events if e['sport'] == sport]
+    return {
+        "status": "healthy",
+        "service": "events",
+        "cache": response_cache.stats(),
+        "geocoder": geocoder.stats() if geocoder is not None else None,
+    }
 
-    if lat and lng and radius:
-        events = [e for e in events if calculate_distance(lat, lng, e['lat'], e['lng']) <= radius]
 
-    return events
+def parse_day(value: str) -> float:
+    """YYYY-MM-DD -> epoch начала дня (UTC), как в normalize"""
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
 
 
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    return ((lat1 - lat2) ** 2 + (lon1 - lon2) ** 2) ** 0.5 * 111
+@app.get("/api/events")
+async def get_events(request: Request, sport: str = None, lat: float = None, lng: float = None,
+                     radius: int = None, date_from: str = None, date_to: str = None, q: str = None,
+                     city: str = None, format: str = None):
+    """Мероприятия; date_from / date_to - YYYY-MM-DD, обе границы включаются,
+    q - поиск по названию и описанию (последнее слово - по префиксу),
+    city - город, определенный по координатам (без учета регистра и ё).
+    format=ndjson (или Accept: application/x-ndjson) - потоком по строке
+    на мероприятие, без кэша и сборки ответа в памяти"""
+    try:
+        start = parse_day(date_from) if date_from else None
+        end = parse_day(date_to) + 86400 if date_to else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format")
+
+    # Координаты привязываются к сетке, чтобы соседние запросы делили кэш
+    lat = snap(lat)
+    lng = snap(lng)
+    q = (q or '').strip().lower()
+    city = city_key(city) or None
+
+    def encode(index):
+        for event in index.query(sport, lat, lng, radius, start, end, q, city):
+            yield dumps(event.to_dict())
+
+    if wants_ndjson(request.headers.get('accept'), format):
+        return StreamingResponse(iter_ndjson(encode(ingestor.current)), media_type=NDJSON_CONTENT_TYPE)
+
+    def build(index):
+        return b''.join(iter_array(encode(index)))
+
+    return cached_json(request, ('events', sport, lat, lng, radius, start, end, q, city), build)
+
+
+@app.get("/api/clusters")
+async def get_clusters(request: Request, bbox: str = "-180,-90,180,90", zoom: int = 0):
+    """Кластеры мероприятий для области карты: bbox=west,south,east,north"""
+    try:
+        box = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return cached_json(request, ('clusters', box, zoom), lambda index: index.clusters.clusters(box, zoom))
+
+
+def cached_json(request, key, build):
+    """JSON-ответ из кэша с ETag; build(index) строит данные при промахе -
+    объект или уже закодированный JSON (bytes)"""
+    # Версия и индекс - одна пара, прочитанная до построения ответа:
+    # ответ по новому индексу не попадет в кэш под старой версией
+    version, index = ingestor.state
+    entry = response_cache.get(key, version)
+    if entry is None:
+        with metrics.span('filter'):
+            data = build(index)
+        with metrics.span('serialize'):
+            body = data if isinstance(data, bytes) else dumps(data)
+        entry = response_cache.put(key, body, version)
+
+    if etag_matches(request.headers.get('if-none-match'), entry.etag):
+        response_cache.count_not_modified()
+        return Response(status_code=304, headers={'ETag': entry.etag})
+    return Response(entry.body, media_type='application/json', headers={'ETag': entry.etag})
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Гистограммы запросов и участков в формате Prometheus"""
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/metrics/profile")
+async def get_profile():
+    """Свернутые стеки самых медленных запросов (PROFILE_SLOW_REQUESTS)"""
+    return Response(metrics.render_profile(), media_type="text/plain")
+
+
+@app.post("/api/events/reload")
+async def reload_events():
+    """Перечитать ленту сейчас; в индекс попадают только изменения"""
+    stats = await ingest()
+    if stats is None:
+        return {"status": "error", "message": "Ingestion failed"}
+    return {"status": "success", "data": stats}
 
 
 if __name__ == "__main__":
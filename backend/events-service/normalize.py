@@ -0,0 +1,188 @@
+# backend/events-service/normalize.py
+"""Нормализация записей Orgeo при загрузке: даты, поля, координаты"""
+import re
+from datetime import date, datetime, timedelta, timezone
+
+DAY = 86400
+
+# "01-08.10.2025", "01-11.10.", "07.10.2025 а", "30.09-02.10.2025"
+DATE_RE = re.compile(
+    r'^\s*(\d{1,2})(?:\.(\d{1,2}))?(?:\.(\d{4}|\d{2})(?!\d))?'
+    r'(?:\s*[-–]\s*(\d{1,2})\.(\d{1,2})(?:\.(\d{4}|\d{2})(?!\d))?)?'
+)
+
+# Подвал сайта, который парсер принимает за описание
+BOILERPLATE_RE = re.compile(r'^©\s*\d{4}(-\d{4})?\s+Orgeo')
+# Признаки CSS вместо текста (поле organizer)
+CSS_RE = re.compile(r'[.#][\w-]+\s*\{[^}]*:[^}]*\}')
+
+
+def _year(value):
+    if value is None:
+        return None
+    year = int(value)
+    return year + 2000 if year < 100 else year
+
+
+def _closest_year(day, month, reference):
+    """Год, при котором дата ближе всего к reference (лента - события рядом с сегодня)"""
+    best = None
+    for year in (reference.year - 1, reference.year, reference.year + 1):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            continue
+        if best is None or abs(candidate - reference) < abs(best - reference):
+            best = candidate
+    if best is None:
+        raise ValueError(f"Invalid date {day:02d}.{month:02d}")
+    return best.year
+
+
+def _epoch(day):
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+
+
+def parse_date_range(text, reference=None):
+    """Свободная дата Orgeo -> (начало, конец) в epoch, конец не включается.
+
+    Недостающий год подбирается по reference (date, по умолчанию сегодня).
+    Нераспознанная дата дает (None, None).
+    """
+    match = DATE_RE.match(text or '')
+    if not match:
+        return None, None
+    if reference is None:
+        reference = date.today()
+
+    start_day, start_month, start_year, end_day, end_month, end_year = match.groups()
+    if start_month is None and end_month is None:
+        return None, None
+
+    try:
+        if end_day is None:
+            month = int(start_month)
+            year = _year(start_year) or _closest_year(int(start_day), month, reference)
+            start = end = date(year, month, int(start_day))
+        else:
+            end_month = int(end_month)
+            year = _year(end_year) or _year(start_year) or _closest_year(int(end_day), end_month, reference)
+            end = date(year, end_month, int(end_day))
+            month = int(start_month) if start_month else end_month
+            start = date(_year(start_year) or year, month, int(start_day))
+            if start > end:
+                # "28.12-03.01.2026": начало в предыдущем году
+                start = date(start.year - 1, start.month, start.day)
+    except ValueError:
+        return None, None
+
+    return _epoch(start), _epoch(end + timedelta(days=1))
+
+
+def clean_text(value):
+    """Пустая строка вместо мусора: подвал сайта, CSS, пробелы"""
+    if not value:
+        return ''
+    value = value.strip()
+    if BOILERPLATE_RE.match(value) or CSS_RE.search(value):
+        return ''
+    return value
+
+
+def clean_coordinates(points):
+    """Кортеж (lat, lng) только из корректных точек"""
+    result = []
+    for point in points or ():
+        try:
+            lat = float(point['lat'])
+            lng = float(point['lng'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if -90 <= lat <= 90 and -180 <= lng <= 180 and (lat, lng) not in result:
+            result.append((lat, lng))
+    return tuple(result)
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).date().isoformat()
+
+
+class EventRecord:
+    """Нормализованное мероприятие: типизированные поля без мусора"""
+
+    __slots__ = ('id', 'url', 'title', 'sport', 'description', 'location', 'organizer',
+                 'date', 'starts_at', 'ends_at', 'coordinates', 'city', 'region')
+
+    def __init__(self, id, url, title, sport, description, location, organizer,
+                 date, starts_at, ends_at, coordinates, city=None, region=None):
+        self.id = id
+        self.url = url
+        self.title = title
+        self.sport = sport
+        self.description = description
+        self.location = location
+        self.organizer = organizer
+        self.date = date
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.coordinates = coordinates
+        # Ближайший населенный пункт по координатам (ReverseGeocoder)
+        self.city = city
+        self.region = region
+
+    @property
+    def has_coordinates(self):
+        return bool(self.coordinates)
+
+    def to_dict(self):
+        """Мероприятие в формате ответа /api/events"""
+        lat, lng = self.coordinates[0] if self.coordinates else (None, None)
+        return {
+            "id": self.id,
+            "title": self.title,
+            "sport": self.sport,
+            "description": self.description,
+            "date": self.date,
+            "start_date": _iso(self.starts_at) if self.starts_at is not None else None,
+            "end_date": _iso(self.ends_at - DAY) if self.ends_at is not None else None,
+            "location": self.location,
+            "city": self.city,
+            "region": self.region,
+            "organizer": self.organizer,
+            "url": self.url,
+            "lat": lat,
+            "lng": lng,
+            "coordinates": [{"lat": lat, "lng": lng} for lat, lng in self.coordinates],
+            "has_coordinates": self.has_coordinates,
+        }
+
+
+def normalize_record(record, event_id, reference=None, geocoder=None):
+    """Запись ленты -> EventRecord; выполняется один раз при загрузке.
+
+    geocoder (ReverseGeocoder) определяет город по координатам; им же
+    заполняется пустое место проведения.
+    """
+    raw_date = (record.get('date') or '').strip()
+    starts_at, ends_at = parse_date_range(raw_date, reference)
+    match = DATE_RE.match(raw_date)
+    coordinates = clean_coordinates(record.get('coordinates'))
+    place = geocoder.resolve(coordinates) if geocoder is not None and coordinates else None
+    location = clean_text(record.get('location')) or clean_text(record.get('full_location'))
+
+    return EventRecord(
+        id=event_id,
+        url=record['url'],
+        title=clean_text(record.get('title')),
+        sport=clean_text(record.get('type')) or 'другое',
+        description=clean_text(record.get('description')),
+        location=location or (place.label if place is not None else ''),
+        organizer=clean_text(record.get('organizer')),
+        # Хвосты вроде "07.10.2025 а" отрезаются
+        date=match.group(0).strip() if match and starts_at is not None else raw_date,
+        starts_at=starts_at,
+        ends_at=ends_at,
+        coordinates=coordinates,
+        city=place.name if place is not None else None,
+        region=place.region if place is not None else None,
+    )
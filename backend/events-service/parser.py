@@ -0,0 +1,386 @@
+# backend/events-service/parser.py
+"""Загрузка мероприятий Orgeo: потоковое чтение, дедупликация, дельты"""
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.request
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from shared.cluster import ClusterTree
+from shared.geo import PointArray
+from shared.geocode import city_key
+from shared.search import SearchIndex
+from normalize import normalize_record
+from snapshot import SnapshotIndex, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\r\n'
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """Элементы JSON-массива из текстового потока по одному.
+
+    Держит в памяти только непрочитанный хвост буфера, а не весь файл.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    # start: ждем '[', first: элемент или ']', item: элемент, next: ',' или ']'
+    state = 'start'
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in WHITESPACE:
+            pos += 1
+
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of feed")
+            chunk = stream.read(chunk_size)
+            buffer = chunk
+            pos = 0
+            eof = not chunk
+            continue
+
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise ValueError(f"Feed must be a JSON array, got {char!r}")
+            pos += 1
+            state = 'first'
+        elif state == 'next':
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' at feed offset, got {char!r}")
+            pos += 1
+            state = 'item'
+        elif state == 'first' and char == ']':
+            return
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # Элемент не поместился в буфер: дочитываем
+                if eof:
+                    raise
+                chunk = stream.read(chunk_size)
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                eof = not chunk
+                continue
+            pos = end
+            state = 'next'
+            yield item
+
+
+def open_feed(source):
+    """Текстовый поток ленты: локальный файл или http(s) URL"""
+    if source.startswith(('http://', 'https://')):
+        response = urllib.request.urlopen(source, timeout=30)
+        return io.TextIOWrapper(response, encoding='utf-8')
+    return open(source, 'r', encoding='utf-8')
+
+
+def record_hash(record):
+    """Хэш содержимого записи, не зависящий от порядка ключей"""
+    data = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def event_id(url):
+    """id мероприятия из url: https://orgeo.ru/event/46393 -> "46393" """
+    return url.rstrip('/').rsplit('/', 1)[-1] or url
+
+
+def unique_event_id(url, owners):
+    """id для url, которого еще нет в индексе; owners - id -> url.
+
+    Разные url с одним окончанием (.../event/1 и .../event/1/) получили
+    бы один id и затерли бы друг друга: второму добавляется хэш url.
+    """
+    candidate = event_id(url)
+    if owners.get(candidate, url) != url:
+        candidate = f"{candidate}-{hashlib.blake2b(url.encode('utf-8'), digest_size=4).hexdigest()}"
+    owners[candidate] = url
+    return candidate
+
+
+class EventIndex:
+    """Неизменяемая версия индекса мероприятий (EventRecord).
+
+    Новая версия строится из предыдущей применением только изменившихся
+    записей; запросы в это время читают старую версию. Каждая точка
+    мероприятия - отдельная запись пространственного индекса с ключом
+    (id, номер точки). Город (city_key) ведет в множество id, как вид
+    спорта. Полнотекстовый индекс общий для всех версий и
+    обновляется на месте, поэтому его результаты сверяются с events.
+    Кластеры строятся по первой точке мероприятия - той, что в ответе.
+    """
+
+    def __init__(self, search=None):
+        self.events = {}       # id -> EventRecord
+        self.hashes = {}       # url -> (id, хэш записи)
+        self.by_sport = {}     # вид спорта -> {id, ...}
+        self.by_city = {}      # city_key -> {id, ...}
+        self.points = PointArray()
+        self.clusters = ClusterTree()
+        # Интервалы дат, отсортированные по началу
+        self.starts = np.empty(0)
+        self.ends = np.empty(0)
+        self.dated_ids = []
+        self.max_duration = 0.0
+        self.search = search if search is not None else SearchIndex()
+
+    def __len__(self):
+        return len(self.events)
+
+    def with_changes(self, upserts, removed_urls):
+        """Новая версия: upserts - [(url, хэш, EventRecord)], removed_urls - url"""
+        index = EventIndex(self.search)
+        index.events = dict(self.events)
+        index.hashes = dict(self.hashes)
+        index.by_sport = dict(self.by_sport)
+        index.by_city = dict(self.by_city)
+        index.points = self.points.copy()
+        index.clusters = self.clusters.copy()
+        copied = {}  # (id словаря, ключ) -> (словарь, ключ)
+
+        def ids_of(groups, key):
+            # Множества копируются только для затронутых видов спорта и городов
+            if (id(groups), key) not in copied:
+                groups[key] = set(groups.get(key, ()))
+                copied[id(groups), key] = (groups, key)
+            return groups[key]
+
+        def drop(url):
+            old_id, _ = index.hashes.pop(url)
+            old = index.events.pop(old_id, None)
+            if old is None:
+                return
+            ids_of(index.by_sport, old.sport).discard(old_id)
+            if old.city:
+                ids_of(index.by_city, city_key(old.city)).discard(old_id)
+            for n in range(len(old.coordinates)):
+                index.points.remove((old_id, n))
+            if old.coordinates:
+                index.clusters.remove(*old.coordinates[0], old.sport)
+            index.search.remove(old_id)
+
+        for url in removed_urls:
+            drop(url)
+
+        for url, digest, event in upserts:
+            if url in index.hashes:
+                drop(url)
+            index.hashes[url] = (event.id, digest)
+            index.events[event.id] = event
+            ids_of(index.by_sport, event.sport).add(event.id)
+            if event.city:
+                ids_of(index.by_city, city_key(event.city)).add(event.id)
+            for n, (lat, lng) in enumerate(event.coordinates):
+                index.points.upsert((event.id, n), lat, lng)
+            if event.coordinates:
+                index.clusters.add(*event.coordinates[0], event.sport)
+            index.search.add(event.id, event.title, event.description)
+
+        for groups, key in copied.values():
+            if not groups[key]:
+                del groups[key]
+
+        index._build_date_index()
+        return index
+
+    def _build_date_index(self):
+        dated = sorted(
+            ((event.starts_at, event.ends_at, event.id)
+             for event in self.events.values() if event.starts_at is not None),
+            key=lambda item: item[0]
+        )
+        self.starts = np.array([item[0] for item in dated], dtype=np.float64)
+        self.ends = np.array([item[1] for item in dated], dtype=np.float64)
+        self.dated_ids = [item[2] for item in dated]
+        self.max_duration = float((self.ends - self.starts).max()) if dated else 0.0
+
+    def overlapping(self, date_from=None, date_to=None):
+        """id мероприятий, пересекающихся с [date_from, date_to) (epoch).
+
+        Бинарный поиск по началу ограничивает окно кандидатов, концы
+        внутри окна проверяются одной векторной операцией.
+        """
+        lo = 0
+        hi = len(self.dated_ids)
+        if date_to is not None:
+            hi = int(np.searchsorted(self.starts, date_to, side='left'))
+        if date_from is not None:
+            lo = int(np.searchsorted(self.starts, date_from - self.max_duration, side='left'))
+        if lo >= hi:
+            return []
+
+        if date_from is None:
+            return self.dated_ids[lo:hi]
+        hits = np.flatnonzero(self.ends[lo:hi] > date_from)
+        return [self.dated_ids[lo + n] for n in hits]
+
+    def nearest_points(self, lat, lng, radius):
+        """[(id, distance)] мероприятий в радиусе по ближайшей из их точек"""
+        best = {}
+        for (event_id, _), distance in self.points.within(lat, lng, radius):
+            if distance < best.get(event_id, radius + 1):
+                best[event_id] = distance
+        return sorted(best.items(), key=lambda item: item[1])
+
+    def query(self, sport=None, lat=None, lng=None, radius=None, date_from=None, date_to=None, q=None,
+              city=None):
+        """Мероприятия по виду спорта, городу, радиусу, интервалу дат и тексту q.
+
+        При фильтре по радиусу - по возрастанию расстояния. Генератор:
+        мероприятия выдаются по мере чтения, без общего списка.
+        """
+        matched = self.search.search(q) if q else None
+        in_city = self.by_city.get(city_key(city), ()) if city else None
+
+        if lat is not None and lng is not None and radius:
+            ids = [event_id for event_id, _ in self.nearest_points(lat, lng, radius)]
+        elif date_from is not None or date_to is not None:
+            ids = self.overlapping(date_from, date_to)
+            date_from = date_to = None
+        elif in_city is not None:
+            ids = in_city
+            in_city = None
+        elif matched is not None:
+            ids = matched
+            matched = None
+        elif sport:
+            ids = self.by_sport.get(sport, ())
+            sport = None
+        else:
+            ids = self.events
+
+        in_range = None
+        if date_from is not None or date_to is not None:
+            in_range = set(self.overlapping(date_from, date_to))
+
+        for event_id in ids:
+            if in_city is not None and event_id not in in_city:
+                continue
+            if matched is not None and event_id not in matched:
+                continue
+            if in_range is not None and event_id not in in_range:
+                continue
+            # Поисковый индекс общий для версий: берем только id этой версии
+            event = self.events.get(event_id)
+            if event is not None and (not sport or event.sport == sport):
+                yield event
+
+
+class Ingestor:
+    """Загрузка ленты в EventIndex с атомарной подменой текущей версии.
+
+    С snapshot_path индекс живет в колоночном файле (SnapshotIndex):
+    стартует с прошлого снапшота, каждая загрузка с изменениями пишет
+    новый.
+    """
+
+    def __init__(self, geocoder=None, snapshot_path=None):
+        # (версия, индекс) одной ссылкой: читатель получает пару одним
+        # чтением, версия растет при каждой подмене индекса
+        self.state = (0, SnapshotIndex.open(snapshot_path) if snapshot_path else EventIndex())
+        self.geocoder = geocoder  # ReverseGeocoder: город по координатам
+        self.last_stats = None
+        self._lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self.state[1]
+
+    @property
+    def version(self):
+        return self.state[0]
+
+    def run(self, source):
+        """Прочитать ленту и подменить индекс. Возвращает статистику"""
+        with self._lock:
+            started = time.perf_counter()
+            version, previous = self.state
+            today = date.today()
+
+            seen = set()
+            owners = None  # id -> url, строится при первом новом url
+            upserts = []
+            records = duplicates = added = updated = 0
+
+            with open_feed(source) as stream:
+                for record in iter_json_array(stream):
+                    records += 1
+                    url = record.get('url')
+                    if not url:
+                        continue
+                    if url in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(url)
+
+                    digest = record_hash(record)
+                    known = previous.hashes.get(url)
+                    if known is not None and known[1] == digest:
+                        continue
+                    if known is None:
+                        added += 1
+                        if owners is None:
+                            owners = {old_id: old_url for old_url, (old_id, _) in previous.hashes.items()}
+                        new_id = unique_event_id(url, owners)
+                    else:
+                        updated += 1
+                        new_id = known[0]
+                    upserts.append((url, digest, normalize_record(record, new_id, today, self.geocoder)))
+
+            removed = [url for url in previous.hashes if url not in seen]
+            if upserts or removed:
+                # Подмена ссылки атомарна: запросы видят либо старую, либо новую пару
+                self.state = (version + 1, previous.with_changes(upserts, removed))
+
+            elapsed = time.perf_counter() - started
+            stats = {
+                "source": source,
+                "records": records,
+                "duplicates": duplicates,
+                "added": added,
+                "updated": updated,
+                "removed": len(removed),
+                "unchanged": len(seen) - added - updated,
+                "events": len(self.current),
+                "seconds": round(elapsed, 3),
+                "records_per_sec": round(records / elapsed) if elapsed > 0 else records,
+            }
+            self.last_stats = stats
+
+        logger.info(
+            f"Ingested {records} records from {source} in {elapsed:.3f}s "
+            f"({stats['records_per_sec']} records/s): +{added} ~{updated} -{len(removed)}"
+        )
+        return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    default_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'orgeo.json')
+    # python parser.py [лента] [снапшот]: со вторым аргументом пишет снапшот
+    ingestor = Ingestor()
+    print(json.dumps(ingestor.run(sys.argv[1] if len(sys.argv) > 1 else default_source),
+                     ensure_ascii=False, indent=2))
+    if len(sys.argv) > 2:
+        write_snapshot(sys.argv[2], [
+            (ingestor.current.hashes[event.url][1], event) for event in ingestor.current.events.values()
+        ])
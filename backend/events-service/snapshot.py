@@ -0,0 +1,414 @@
+# backend/events-service/snapshot.py
+"""Колоночный снапшот мероприятий: файл, открываемый через mmap
+
+Загрузка ленты записывает все мероприятия в один файл колонками:
+координаты и даты - массивы float64, виды спорта и места - номера в
+таблицах заголовка, строки - общий блок UTF-8 с массивом смещений.
+При старте файл отображается в память, массивы NumPy смотрят прямо в
+него, поэтому сервис готов за миллисекунды, а реплики на одной машине
+делят страницы через кэш ОС. EventRecord собирается только для
+мероприятий, попавших в ответ.
+
+Формат: MAGIC, длина заголовка (8 байт, little-endian), заголовок JSON,
+затем секции, выровненные по 8 байт; смещения секций - в заголовке.
+"""
+import json
+import logging
+import math
+import mmap
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from shared.cluster import ColumnClusters, tile_fraction
+from shared.geo import points_within
+from shared.geocode import city_key
+from shared.search import SearchIndex
+from shared.wal import atomic_write
+from normalize import EventRecord
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'EVSNAP\x00\x01'
+# Повышается при изменении формата или нормализации: снапшот другой
+# версии не открывается, и лента загружается заново
+FORMAT_VERSION = 1
+ALIGN = 8
+
+STRING_COLUMNS = ('id', 'url', 'digest', 'title', 'description', 'location', 'organizer', 'date')
+# Строк на один вызов records() в query: как кусок потока NDJSON
+RECORD_BATCH = 256
+
+
+def _nan(value):
+    return math.nan if value is None else value
+
+
+def _optional(values):
+    """Массив float -> список, NaN -> None"""
+    missing = np.isnan(values)
+    values = values.astype(object)
+    values[missing] = None
+    return values.tolist()
+
+
+def _encode_strings(values):
+    """Строки -> (смещения int64, блок UTF-8)"""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, b''.join(encoded)
+
+
+def encode_snapshot(entries):
+    """Файл снапшота (bytes) из [(хэш записи, EventRecord)] в порядке строк"""
+    events = [event for _, event in entries]
+    count = len(events)
+
+    sports = {}
+    places = {}
+    sport_codes = np.empty(count, dtype=np.int32)
+    place_codes = np.empty(count, dtype=np.int32)
+    for row, event in enumerate(events):
+        sport_codes[row] = sports.setdefault(event.sport, len(sports))
+        place = (event.city, event.region)
+        place_codes[row] = places.setdefault(place, len(places)) if event.city else -1
+
+    point_offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum([len(event.coordinates) for event in events], out=point_offsets[1:])
+    coordinates = [point for event in events for point in event.coordinates]
+    lats = np.array([lat for lat, _ in coordinates], dtype=np.float64)
+    lngs = np.array([lng for _, lng in coordinates], dtype=np.float64)
+
+    # Кластеры строятся по первой точке мероприятия - той, что в ответе
+    located = [row for row, event in enumerate(events) if event.coordinates]
+    tiles = [tile_fraction(*events[row].coordinates[0]) for row in located]
+
+    starts = np.array([_nan(event.starts_at) for event in events], dtype=np.float64)
+    ends = np.array([_nan(event.ends_at) for event in events], dtype=np.float64)
+    dated = np.flatnonzero(~np.isnan(starts))
+    dated = dated[np.argsort(starts[dated], kind='stable')].astype(np.int32)
+
+    columns = {
+        'sport': sport_codes,
+        'place': place_codes,
+        'starts': starts,
+        'ends': ends,
+        'dated_rows': dated,
+        'dated_starts': starts[dated],
+        'dated_ends': ends[dated],
+        'point_offsets': point_offsets,
+        'point_rows': np.repeat(np.arange(count, dtype=np.int32), np.diff(point_offsets)),
+        'lats': lats,
+        'lngs': lngs,
+        'cos_lats': np.cos(np.radians(lats)),
+        'cluster_rows': np.array(located, dtype=np.int32),
+        'cluster_xs': np.array([x for x, _ in tiles], dtype=np.float64),
+        'cluster_ys': np.array([y for _, y in tiles], dtype=np.float64),
+        'cluster_lats': lats[point_offsets[located]] if located else np.empty(0),
+        'cluster_lngs': lngs[point_offsets[located]] if located else np.empty(0),
+    }
+    digests = [digest for digest, _ in entries]
+    for name in STRING_COLUMNS:
+        values = digests if name == 'digest' else [getattr(event, name) or '' for event in events]
+        columns[f'{name}.offsets'], columns[f'{name}.data'] = _encode_strings(values)
+
+    header = {
+        "version": FORMAT_VERSION,
+        "count": count,
+        "points": len(coordinates),
+        "max_duration": float((ends[dated] - starts[dated]).max()) if len(dated) else 0.0,
+        "sports": list(sports),
+        "places": [list(place) for place in places],
+        "sections": {},
+    }
+    # Смещения секций зависят от длины заголовка: считаем до сходимости
+    base = 0
+    while True:
+        offset = base
+        sections = {}
+        for name, value in columns.items():
+            offset += -offset % ALIGN
+            if isinstance(value, bytes):
+                sections[name] = [offset, 'u1', len(value)]
+                offset += len(value)
+            else:
+                sections[name] = [offset, value.dtype.str, len(value)]
+                offset += value.nbytes
+        header["sections"] = sections
+        encoded_header = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        start = len(MAGIC) + 8 + len(encoded_header)
+        start += -start % ALIGN
+        if start == base:
+            break
+        base = start
+
+    parts = [MAGIC, len(encoded_header).to_bytes(8, 'little'), encoded_header]
+    position = len(MAGIC) + 8 + len(encoded_header)
+    for name, value in columns.items():
+        offset = sections[name][0]
+        parts.append(b'\0' * (offset - position))
+        data = value if isinstance(value, bytes) else value.tobytes()
+        parts.append(data)
+        position = offset + len(data)
+    return b''.join(parts)
+
+
+def write_snapshot(path, entries):
+    """Атомарно записать снапшот [(хэш записи, EventRecord)]"""
+    atomic_write(path, encode_snapshot(entries))
+
+
+class StringColumn:
+    """Строки снапшота: декодируются только запрошенные"""
+
+    __slots__ = ('buffer', 'offsets', 'base')
+
+    def __init__(self, buffer, offsets, base):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.base = base
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def take(self, rows):
+        """Строки с номерами rows (массив NumPy) списком"""
+        buffer = self.buffer
+        base = self.base
+        starts = (self.offsets[rows] + base).tolist()
+        ends = (self.offsets[rows + 1] + base).tolist()
+        return [buffer[start:end].decode('utf-8') for start, end in zip(starts, ends)]
+
+
+class SnapshotIndex:
+    """Версия индекса мероприятий поверх снапшота (интерфейс EventIndex).
+
+    Фильтры считаются векторно по колонкам; полнотекстовый индекс
+    строится при первом поиске, словарь url -> хэш - при первой загрузке
+    ленты. with_changes() пишет новый снапшот по тому же пути и открывает
+    его; открытые запросы дочитывают старый файл - отображение переживает
+    его замену.
+    """
+
+    def __init__(self, path, buffer):
+        self.path = path
+        self._buffer = buffer
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not an events snapshot")
+        header_size = int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], 'little')
+        header = json.loads(bytes(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_size]))
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} has snapshot version {header.get('version')}, expected {FORMAT_VERSION}")
+
+        self.count = header["count"]
+        self.max_duration = header["max_duration"]
+        self.sports = header["sports"]
+        self.places = [tuple(place) for place in header["places"]]
+        self._sport_names = np.array(self.sports + [None], dtype=object)
+        # Код места -1 (без города) попадает на последний элемент - None
+        self._cities = np.array([city for city, _ in self.places] + [None], dtype=object)
+        self._regions = np.array([region for _, region in self.places] + [None], dtype=object)
+        self._sections = header["sections"]
+        self._sport_codes = {sport: code for code, sport in enumerate(self.sports)}
+        self._place_codes = {}
+        for code, (city, _) in enumerate(self.places):
+            self._place_codes.setdefault(city_key(city), []).append(code)
+
+        column = self._column
+        self.sport_codes = column('sport')
+        self.place_codes = column('place')
+        self.starts = column('starts')
+        self.ends = column('ends')
+        self.dated_rows = column('dated_rows')
+        self.dated_starts = column('dated_starts')
+        self.dated_ends = column('dated_ends')
+        self.point_offsets = column('point_offsets')
+        self.point_rows = column('point_rows')
+        self.lats = column('lats')
+        self.lngs = column('lngs')
+        self.cos_lats = column('cos_lats')
+        self.cluster_rows = column('cluster_rows')
+        self.clusters = ColumnClusters(
+            column('cluster_xs'), column('cluster_ys'), column('cluster_lats'), column('cluster_lngs'),
+            self.sport_codes[self.cluster_rows], self.sports)
+        self.strings = {
+            name: StringColumn(buffer, column(f'{name}.offsets'), self._sections[f'{name}.data'][0])
+            for name in STRING_COLUMNS
+        }
+
+        self._lock = threading.Lock()
+        self._search = None
+        self._hashes = None
+
+    def _column(self, name):
+        offset, dtype, length = self._sections[name]
+        return np.frombuffer(self._buffer, dtype=np.dtype(dtype), count=length, offset=offset)
+
+    @classmethod
+    def load(cls, path):
+        """Отобразить снапшот в память; ошибки чтения и формата - ValueError / OSError"""
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(path, buffer)
+        except KeyError as e:
+            raise ValueError(f"missing section {str(e)}") from e
+
+    @classmethod
+    def open(cls, path):
+        """Открыть снапшот при старте; нет файла или он другой версии - пустой индекс"""
+        try:
+            index = cls.load(path)
+        except (OSError, ValueError) as e:
+            # ValueError: пустой файл не отображается или формат другой
+            if os.path.exists(path):
+                logger.warning(f"Ignoring events snapshot {path}: {str(e)}")
+            return cls.empty(path)
+        logger.info(f"Opened events snapshot {path}: {len(index)} events")
+        return index
+
+    @classmethod
+    def empty(cls, path):
+        return cls(path, encode_snapshot([]))
+
+    def __len__(self):
+        return self.count
+
+    def records(self, rows):
+        """EventRecord строк rows; собираются только для отдаваемых мероприятий.
+
+        Каждая колонка читается одной операцией над всеми строками сразу.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return []
+        strings = [self.strings[name].take(rows) for name in STRING_COLUMNS if name != 'digest']
+
+        # Точки всех строк одним массивом: у строки n - counts[n] подряд
+        firsts = self.point_offsets[rows]
+        counts = self.point_offsets[rows + 1] - firsts
+        shifts = np.repeat(firsts - (np.cumsum(counts) - counts), counts)
+        points = shifts + np.arange(int(counts.sum()))
+        pairs = list(zip(self.lats[points].tolist(), self.lngs[points].tolist()))
+        bounds = np.concatenate(([0], np.cumsum(counts))).tolist()
+        coordinates = [tuple(pairs[start:end]) for start, end in zip(bounds, bounds[1:])]
+
+        places = self.place_codes[rows]
+        return list(map(
+            EventRecord, *strings[:3], self._sport_names[self.sport_codes[rows]].tolist(), *strings[3:],
+            _optional(self.starts[rows]), _optional(self.ends[rows]), coordinates,
+            self._cities[places].tolist(), self._regions[places].tolist(),
+        ))
+
+    @property
+    def hashes(self):
+        """url -> (id, хэш записи), как у EventIndex; строится по запросу"""
+        if self._hashes is None:
+            rows = np.arange(self.count)
+            urls, ids, digests = (self.strings[name].take(rows) for name in ('url', 'id', 'digest'))
+            self._hashes = dict(zip(urls, zip(ids, digests)))
+        return self._hashes
+
+    @property
+    def search(self):
+        """Полнотекстовый индекс по номерам строк; строится при первом поиске"""
+        if self._search is None:
+            with self._lock:
+                if self._search is None:
+                    search = SearchIndex()
+                    rows = np.arange(self.count)
+                    titles = self.strings['title'].take(rows)
+                    descriptions = self.strings['description'].take(rows)
+                    for row, (title, description) in enumerate(zip(titles, descriptions)):
+                        search.add(row, title, description)
+                    self._search = search
+        return self._search
+
+    def with_changes(self, upserts, removed_urls):
+        """Новая версия: upserts - [(url, хэш, EventRecord)], removed_urls - url.
+
+        Неизменные строки переносятся в новый файл в прежнем порядке,
+        измененные и новые - в конец, как в EventIndex.
+        """
+        dropped = set(removed_urls)
+        dropped.update(url for url, _, _ in upserts)
+        urls = self.strings['url'].take(np.arange(self.count))
+        kept = np.array([row for row, url in enumerate(urls) if url not in dropped], dtype=np.int64)
+        entries = list(zip(self.strings['digest'].take(kept), self.records(kept)))
+        entries.extend((digest, event) for _, digest, event in upserts)
+        write_snapshot(self.path, entries)
+        # Без подмены на пустой индекс: ошибка оставляет текущую версию
+        return SnapshotIndex.load(self.path)
+
+    def overlapping(self, date_from=None, date_to=None):
+        """Строки, пересекающиеся с [date_from, date_to), по возрастанию начала"""
+        lo = 0
+        hi = len(self.dated_rows)
+        if date_to is not None:
+            hi = int(np.searchsorted(self.dated_starts, date_to, side='left'))
+        if date_from is not None:
+            lo = int(np.searchsorted(self.dated_starts, date_from - self.max_duration, side='left'))
+        if lo >= hi:
+            return self.dated_rows[:0]
+
+        if date_from is None:
+            return self.dated_rows[lo:hi]
+        return self.dated_rows[lo:hi][self.dated_ends[lo:hi] > date_from]
+
+    def nearest_points(self, lat, lng, radius):
+        """(строки, расстояния) мероприятий в радиусе по ближайшей из их точек"""
+        slots, distances = points_within(self.lats, self.lngs, self.cos_lats, lat, lng, radius)
+        order = np.argsort(distances, kind='stable')
+        rows = self.point_rows[slots[order]]
+        # Первое вхождение строки после сортировки - ее ближайшая точка
+        _, first = np.unique(rows, return_index=True)
+        first.sort()
+        return rows[first], distances[order][first]
+
+    def query(self, sport=None, lat=None, lng=None, radius=None, date_from=None, date_to=None, q=None,
+              city=None):
+        """Мероприятия по виду спорта, городу, радиусу, интервалу дат и тексту q.
+
+        При фильтре по радиусу - по возрастанию расстояния, при фильтре
+        по датам - по началу, иначе в порядке загрузки. Генератор: строки
+        отбираются сразу, а EventRecord собираются пачками по
+        RECORD_BATCH по мере чтения.
+        """
+        keep = np.ones(self.count, dtype=bool)
+        if sport:
+            code = self._sport_codes.get(sport)
+            if code is None:
+                return
+            keep &= self.sport_codes == code
+        if city:
+            codes = self._place_codes.get(city_key(city))
+            if not codes:
+                return
+            keep &= np.isin(self.place_codes, codes)
+        if q:
+            matched = self.search.search(q)
+            if matched is not None:
+                in_text = np.zeros(self.count, dtype=bool)
+                in_text[list(matched)] = True
+                keep &= in_text
+
+        dated = date_from is not None or date_to is not None
+        if lat is not None and lng is not None and radius:
+            rows, _ = self.nearest_points(lat, lng, radius)
+            if dated:
+                in_range = np.zeros(self.count, dtype=bool)
+                in_range[self.overlapping(date_from, date_to)] = True
+                keep &= in_range
+        elif dated:
+            rows = self.overlapping(date_from, date_to)
+        else:
+            rows = np.arange(self.count)
+
+        rows = rows[keep[rows]]
+        for start in range(0, len(rows), RECORD_BATCH):
+            yield from self.records(rows[start:start + RECORD_BATCH])
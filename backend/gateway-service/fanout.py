@@ -0,0 +1,134 @@
+# backend/gateway-service/fanout.py
+"""Параллельные запросы к сервисам с таймаутом на каждый источник
+
+Все запросы идут через один httpx.AsyncClient: соединения к сервисам
+держатся открытыми (keep-alive) и переиспользуются между запросами.
+Источник, не ответивший за свой таймаут или ответивший ошибкой, не
+ломает остальные: его данные заменяются None, причина попадает в
+errors. Ответы сервисов не разбираются и не кодируются заново: в
+общий ответ вклеиваются их байты.
+"""
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+
+from shared.serialize import SUCCESS_PREFIX, dumps
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = 100
+# Простаивающих соединений на все сервисы; остальные закрываются
+MAX_KEEPALIVE = 20
+SOURCE_TIMEOUT = 2.0
+
+
+class Source:
+    """GET-запрос к сервису: name - ключ в ответе.
+
+    envelope=True - ответ ровно из полей status и data (envelope() и
+    cached_json() flask_app), в ответ попадает JSON поля data.
+    """
+
+    __slots__ = ('name', 'url', 'params', 'timeout', 'envelope')
+
+    def __init__(self, name, url, params=None, timeout=SOURCE_TIMEOUT, envelope=False):
+        self.name = name
+        self.url = url
+        # None - параметр не передается
+        self.params = {key: value for key, value in (params or {}).items() if value is not None}
+        self.timeout = timeout
+        self.envelope = envelope
+
+
+def unwrap(body):
+    """JSON поля data из ответа {"status": "success", "data": ...}.
+
+    Ответы flask_app кодируются dumps() и начинаются с SUCCESS_PREFIX -
+    тогда data вырезается без разбора; иначе ответ разбирается.
+    """
+    if body.startswith(SUCCESS_PREFIX) and body.endswith(b'}'):
+        return body[len(SUCCESS_PREFIX):-1]
+    data = json.loads(body)
+    if not isinstance(data, dict) or data.get("status") != "success":
+        raise ValueError("unexpected response envelope")
+    return dumps(data.get("data"))
+
+
+class Fanout:
+    """Общий пул соединений и параллельная выборка источников"""
+
+    def __init__(self, client=None, max_connections=MAX_CONNECTIONS, max_keepalive=MAX_KEEPALIVE):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self._client = client
+        self._own_client = client is None
+        # имя источника -> {"ok": n, "timeout": n, "error": n}
+        self.counters = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(SOURCE_TIMEOUT),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_keepalive),
+            )
+        return self._client
+
+    async def close(self):
+        if self._own_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _count(self, name, outcome):
+        counters = self.counters.setdefault(name, {"ok": 0, "timeout": 0, "error": 0})
+        counters[outcome] += 1
+
+    async def fetch(self, source):
+        """(JSON данных в bytes, ошибка) источника; ровно одно из двух - None"""
+        try:
+            # Таймаут на весь запрос целиком, а не на каждую фазу, как в httpx
+            response = await asyncio.wait_for(
+                self.client.get(source.url, params=source.params, headers={"Accept": "application/json"}),
+                source.timeout,
+            )
+            response.raise_for_status()
+            if not response.headers.get('content-type', '').startswith('application/json'):
+                raise ValueError(f"unexpected content type {response.headers.get('content-type')}")
+            data = unwrap(response.content) if source.envelope else response.content
+        except asyncio.TimeoutError:
+            self._count(source.name, "timeout")
+            logger.warning(f"{source.name}: no response from {source.url} in {source.timeout}s")
+            return None, "timeout"
+        except (httpx.HTTPError, ValueError) as e:
+            self._count(source.name, "error")
+            logger.warning(f"{source.name}: {source.url} failed: {str(e)}")
+            return None, str(e) or type(e).__name__
+        self._count(source.name, "ok")
+        return data, None
+
+    async def gather(self, sources):
+        """Все источники одновременно: (JSON данных по имени, ошибки по имени,
+        мс по имени).
+
+        Ответ готов, когда ответил или истек по таймауту последний
+        источник, - не позже самого долгого таймаута.
+        """
+        async def timed(source):
+            started = time.perf_counter()
+            data, error = await self.fetch(source)
+            return data, error, round((time.perf_counter() - started) * 1000, 1)
+
+        results = await asyncio.gather(*(timed(source) for source in sources))
+        data = {}
+        errors = {}
+        timings = {}
+        for source, (value, error, elapsed) in zip(sources, results):
+            data[source.name] = value
+            timings[source.name] = elapsed
+            if error is not None:
+                errors[source.name] = error
+        return data, errors, timings
@@ -0,0 +1,138 @@
+# backend/gateway-service/main.py
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from shared.cache import snap
+from shared.metrics import PROMETHEUS_CONTENT_TYPE, from_env as metrics_from_env
+from shared.serialize import dumps, iter_object
+from fanout import SOURCE_TIMEOUT, Fanout, Source
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Адреса сервисов: тренировки и премиум - flask_app, мероприятия и люди рядом
+TRAININGS_API_URL = os.environ.get("TRAININGS_API_URL", "http://localhost:5000").rstrip('/')
+EVENTS_API_URL = os.environ.get("EVENTS_API_URL", "http://localhost:8001").rstrip('/')
+USERS_API_URL = os.environ.get("USERS_API_URL", "http://localhost:8002").rstrip('/')
+# Секунд на ответ одного источника; опоздавший приходит в ответе как null
+BOOTSTRAP_TIMEOUT = float(os.environ.get("BOOTSTRAP_TIMEOUT", SOURCE_TIMEOUT))
+# Ответы меньше этого размера не сжимаются
+GZIP_MINIMUM_SIZE = 1024
+# Уровень 9 (по умолчанию в Starlette) в 4 раза медленнее 5 при выигрыше в 3% размера
+GZIP_LEVEL = 5
+MAX_RADIUS = 500  # км
+
+# Общий пул соединений к сервисам на все запросы
+fanout = Fanout()
+# Замеры запросов и участков; METRICS_ENABLED=0 выключает
+metrics = metrics_from_env('gateway-service')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await fanout.close()
+
+
+app = FastAPI(title="Gateway Service", lifespan=lifespan)
+
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_LEVEL)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+if metrics.enabled:
+    @app.middleware("http")
+    async def time_requests(request: Request, call_next):
+        timer = metrics.begin(request.method)
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Шаблон маршрута, а не путь: параметры не плодят метки
+            route = request.scope.get('route')
+            metrics.finish(timer, status, route.path if route is not None else 'unmatched')
+
+
+def bootstrap_sources(lat, lng, radius, sport, events_radius):
+    """Запросы, которые index.html делает при открытии карты"""
+    return [
+        Source("trainings", f"{TRAININGS_API_URL}/api/trainings",
+               {"lat": lat, "lng": lng, "radius": radius, "sport": sport}, BOOTSTRAP_TIMEOUT, envelope=True),
+        Source("events", f"{EVENTS_API_URL}/api/events",
+               {"lat": lat, "lng": lng, "radius": events_radius, "sport": sport}, BOOTSTRAP_TIMEOUT),
+        Source("premium", f"{TRAININGS_API_URL}/api/premium-training", None, BOOTSTRAP_TIMEOUT, envelope=True),
+        Source("users", f"{USERS_API_URL}/api/users/nearby",
+               {"lat": lat, "lng": lng, "radius": radius}, BOOTSTRAP_TIMEOUT),
+    ]
+
+
+@app.get("/")
+async def root():
+    return {"message": "Gateway Service is running"}
+
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy", "service": "gateway", "sources": fanout.counters}
+
+
+@app.get("/api/bootstrap")
+async def bootstrap(lat: float, lng: float, radius: int = 10, sport: str = None, events_radius: int = 50):
+    """Все данные для открытия карты одним ответом: тренировки, мероприятия,
+    премиум тренировка и пользователи рядом.
+
+    Сервисы опрашиваются одновременно. Не ответивший за BOOTSTRAP_TIMEOUT
+    источник приходит как null, его ошибка - в errors, а status
+    становится "partial"."""
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        raise HTTPException(status_code=400, detail="lat / lng are out of range")
+    if not 0 < radius <= MAX_RADIUS or not 0 < events_radius <= MAX_RADIUS:
+        raise HTTPException(status_code=400, detail=f"radius must be between 0 and {MAX_RADIUS} km")
+
+    # Привязка к сетке, как в самих сервисах: соседние запросы попадают в их кэш
+    sources = bootstrap_sources(snap(lat), snap(lng), radius, sport or None, events_radius)
+    with metrics.span('fanout'):
+        data, errors, timings = await fanout.gather(sources)
+
+    # Данные сервисов - уже готовый JSON: склеиваются без разбора
+    with metrics.span('serialize'):
+        body = b''.join(iter_object([
+            ("status", dumps("partial" if errors else "success")),
+            ("data", b''.join(iter_object((name, value or b'null') for name, value in data.items()))),
+            ("errors", dumps(errors)),
+            ("timings", dumps(timings)),
+        ]))
+    return Response(body, media_type="application/json", headers={"Cache-Control": "no-store"})
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Гистограммы запросов и участков в формате Prometheus"""
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/metrics/profile")
+async def get_profile():
+    """Свернутые стеки самых медленных запросов (PROFILE_SLOW_REQUESTS)"""
+    return Response(metrics.render_profile(), media_type="text/plain")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.environ.get("PORT", 8080))  # Fly.io использует 8080
+    uvicorn.run(app, host="0.0.0.0", port=port)
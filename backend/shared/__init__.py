@@ -0,0 +1,2 @@
+# backend/shared/__init__.py
+"""Общие модули для flask_app и сервисов SportEvents"""
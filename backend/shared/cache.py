@@ -0,0 +1,126 @@
+# backend/shared/cache.py
+"""Кэш готовых JSON-ответов с версией данных, ETag и LRU-вытеснением"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Шаг привязки координат запроса (~100 м по широте)
+COORDINATE_STEP = 0.001
+# Примерные накладные расходы на запись сверх тела ответа
+ENTRY_OVERHEAD = 256
+
+
+def snap(value, step=COORDINATE_STEP):
+    """Координата, привязанная к сетке с шагом step (None остается None)"""
+    if value is None:
+        return None
+    return round(round(value / step) * step, 6)
+
+
+def make_etag(body):
+    """Сильный ETag по содержимому тела ответа"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """Совпадает ли заголовок If-None-Match с ETag ответа"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Сравнение для If-None-Match слабое: W/"x" совпадает с "x"
+    tags = (tag.strip() for tag in if_none_match.split(','))
+    return any(tag.removeprefix('W/') == etag for tag in tags)
+
+
+class CachedResponse:
+    __slots__ = ('version', 'etag', 'body', 'size')
+
+    def __init__(self, version, etag, body, size):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.size = size
+
+
+class ResponseCache:
+    """LRU-кэш тел ответов, ограниченный суммарным размером.
+
+    version - глобальный счетчик данных: любое изменение вызывает bump(),
+    и записи, построенные на старой версии, больше не отдаются. Для
+    неизменяемых данных вызывающий передает свою версию (например, 0).
+    """
+
+    def __init__(self, max_bytes=32 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.version = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def bump(self):
+        """Отметить изменение данных"""
+        with self._lock:
+            self.version += 1
+
+    def get(self, key, version=None):
+        """Запись для key, если она построена на текущей версии данных"""
+        if version is None:
+            version = self.version
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, version):
+        """Сохранить тело ответа, построенное на данных версии version.
+
+        Версию нужно взять до построения ответа: если данные успели
+        измениться, запись сразу окажется устаревшей.
+        """
+        entry = CachedResponse(version, make_etag(body), body, len(body) + ENTRY_OVERHEAD)
+        # Слишком большие ответы не вытесняют весь кэш
+        if entry.size > self.max_bytes // 4:
+            return entry
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+        return entry
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,207 @@
+# backend/shared/cluster.py
+"""Кластеры маркеров для мелких масштабов карты: иерархическая сетка тайлов"""
+import math
+
+import numpy as np
+
+# Кластеры считаются до этого зума, дальше карта показывает точки
+MAX_ZOOM = 18
+# Ячейка кластера - 1/2^CELL_BITS тайла по каждой оси (64 px при тайле 256 px)
+CELL_BITS = 2
+# Предел широты проекции Web Mercator
+MAX_LATITUDE = 85.05112878
+
+
+def tile_fraction(lat, lng):
+    """Положение точки в Web Mercator, обе координаты в [0, 1)"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lng + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+def _cell_ranges(bbox, scale):
+    """Диапазоны ячеек (x_ranges, y_range) прямоугольника bbox при scale ячеек на ось"""
+    west, south, east, north = bbox
+    x_min, y_min = tile_fraction(north, west)
+    x_max, y_max = tile_fraction(south, east)
+    y_range = (int(y_min * scale), int(y_max * scale))
+    if west <= east:
+        x_ranges = [(int(x_min * scale), int(x_max * scale))]
+    else:
+        x_ranges = [(int(x_min * scale), scale - 1), (0, int(x_max * scale))]
+    return x_ranges, y_range
+
+
+def _cluster(count, sum_lat, sum_lng, sports):
+    return {
+        "count": count,
+        "lat": round(sum_lat / count, 5),
+        "lng": round(sum_lng / count, 5),
+        "sports": sports,
+    }
+
+
+class ClusterTree:
+    """Агрегаты точек по ячейкам для каждого зума от 0 до max_zoom.
+
+    Ячейка уровня z - это тайл зума z + CELL_BITS; в ней хранятся число
+    точек, суммы координат (для центроида) и гистограмма видов спорта.
+    Добавление и удаление обновляют по одной ячейке на уровень, поэтому
+    ответ для любого масштаба собирается из готовых агрегатов. Точки не
+    хранятся: remove() получает те же lat, lng, sport, что и add().
+    """
+
+    def __init__(self, max_zoom=MAX_ZOOM):
+        self.max_zoom = max_zoom
+        # уровень -> {(x, y): [count, sum_lat, sum_lng, {sport: count}]}
+        self._levels = [{} for _ in range(max_zoom + 1)]
+
+    def __len__(self):
+        return sum(cell[0] for cell in self._levels[0].values())
+
+    def copy(self):
+        """Независимая копия (для построения новой версии индекса)"""
+        clone = ClusterTree.__new__(ClusterTree)
+        clone.max_zoom = self.max_zoom
+        clone._levels = [
+            {key: [cell[0], cell[1], cell[2], dict(cell[3])] for key, cell in level.items()}
+            for level in self._levels
+        ]
+        return clone
+
+    def _keys(self, lat, lng):
+        x, y = tile_fraction(lat, lng)
+        for zoom in range(self.max_zoom + 1):
+            scale = 1 << (zoom + CELL_BITS)
+            yield self._levels[zoom], (int(x * scale), int(y * scale))
+
+    def add(self, lat, lng, sport=None):
+        for level, key in self._keys(lat, lng):
+            cell = level.get(key)
+            if cell is None:
+                level[key] = [1, lat, lng, {sport: 1}]
+                continue
+            cell[0] += 1
+            cell[1] += lat
+            cell[2] += lng
+            cell[3][sport] = cell[3].get(sport, 0) + 1
+
+    def remove(self, lat, lng, sport=None):
+        for level, key in self._keys(lat, lng):
+            cell = level.get(key)
+            if cell is None:
+                continue
+            cell[0] -= 1
+            if cell[0] <= 0:
+                del level[key]
+                continue
+            cell[1] -= lat
+            cell[2] -= lng
+            sports = cell[3]
+            sports[sport] = sports.get(sport, 0) - 1
+            if sports[sport] <= 0:
+                del sports[sport]
+
+    def clusters(self, bbox, zoom):
+        """Кластеры в прямоугольнике bbox = (west, south, east, north).
+
+        При west > east прямоугольник пересекает антимеридиан.
+        Возвращает список словарей count, lat, lng, sports.
+        """
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        level = self._levels[zoom]
+        x_ranges, y_range = _cell_ranges(bbox, 1 << (zoom + CELL_BITS))
+
+        span = (y_range[1] - y_range[0] + 1) * sum(high - low + 1 for low, high in x_ranges)
+        if span > len(level):
+            # Мелкий масштаб: непустых ячеек меньше, чем ячеек в прямоугольнике
+            cells = [
+                cell for (x, y), cell in level.items()
+                if y_range[0] <= y <= y_range[1] and any(low <= x <= high for low, high in x_ranges)
+            ]
+        else:
+            cells = []
+            for low, high in x_ranges:
+                for x in range(low, high + 1):
+                    for y in range(y_range[0], y_range[1] + 1):
+                        cell = level.get((x, y))
+                        if cell is not None:
+                            cells.append(cell)
+
+        return [_cluster(count, sum_lat, sum_lng, dict(sports)) for count, sum_lat, sum_lng, sports in cells]
+
+
+class ColumnClusters:
+    """Кластеры по колонкам точек без заранее построенных уровней.
+
+    xs, ys - tile_fraction() точек, codes - номера видов спорта в sports.
+    Каждый запрос за один проход NumPy раскладывает точки прямоугольника
+    по ячейкам зума; ответ тот же, что у ClusterTree с теми же точками.
+    Нужен индексу, открытому из файла: строить ClusterTree при старте
+    значит обойти все точки в Python.
+    """
+
+    def __init__(self, xs, ys, lats, lngs, codes, sports, max_zoom=MAX_ZOOM):
+        self.xs = xs
+        self.ys = ys
+        self.lats = lats
+        self.lngs = lngs
+        self.codes = codes
+        self.sports = sports
+        self.max_zoom = max_zoom
+
+    def __len__(self):
+        return len(self.xs)
+
+    def clusters(self, bbox, zoom):
+        """Кластеры в прямоугольнике bbox = (west, south, east, north)"""
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        scale = 1 << (zoom + CELL_BITS)
+        x_ranges, (y_low, y_high) = _cell_ranges(bbox, scale)
+
+        xs = (self.xs * scale).astype(np.int64)
+        ys = (self.ys * scale).astype(np.int64)
+        in_x = np.zeros(len(xs), dtype=bool)
+        for low, high in x_ranges:
+            in_x |= (xs >= low) & (xs <= high)
+        selected = np.flatnonzero(in_x & (ys >= y_low) & (ys <= y_high))
+        if len(selected) == 0:
+            return []
+
+        cells, inverse = np.unique(xs[selected] * scale + ys[selected], return_inverse=True)
+        counts = np.bincount(inverse)
+        sum_lats = np.bincount(inverse, weights=self.lats[selected])
+        sum_lngs = np.bincount(inverse, weights=self.lngs[selected])
+        # Гистограмма видов спорта: пары (ячейка, вид) -> число точек
+        kinds = max(len(self.sports), 1)
+        pairs, pair_counts = np.unique(inverse * kinds + self.codes[selected], return_counts=True)
+        histograms = [{} for _ in range(len(cells))]
+        for pair, count in zip(pairs.tolist(), pair_counts.tolist()):
+            histograms[pair // kinds][self.sports[pair % kinds]] = count
+
+        return [
+            _cluster(count, sum_lat, sum_lng, sports)
+            for count, sum_lat, sum_lng, sports in zip(counts.tolist(), sum_lats.tolist(),
+                                                       sum_lngs.tolist(), histograms)
+        ]
+
+
+def parse_bbox(value):
+    """Строка "west,south,east,north" (как toBBoxString() в Leaflet) -> кортеж"""
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be 'west,south,east,north'")
+    if not -90 <= south <= north <= 90:
+        raise ValueError("bbox is out of range")
+
+    # Leaflet на мелких зумах отдает долготы за пределами [-180, 180]
+    if east - west >= 360:
+        return -180.0, south, 180.0, north
+    if not -180 <= west <= 180:
+        west = (west + 180) % 360 - 180
+    if not -180 <= east <= 180:
+        east = (east + 180) % 360 - 180
+    return west, south, east, north
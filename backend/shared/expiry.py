@@ -0,0 +1,79 @@
+# backend/shared/expiry.py
+"""Очередь истечения срока: min-heap по заранее вычисленному времени"""
+import heapq
+import time
+from datetime import datetime
+
+
+def parse_timestamp(value):
+    """ISO-строка -> epoch (float). Наивное время считается локальным"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+class ExpiryQueue:
+    """Min-heap (expires_at, item_id) с ленивым удалением.
+
+    schedule() и cancel() работают за O(log n) и O(1), pop_expired()
+    за O(k log n), где k - число истекших записей, а не размер хранилища.
+    Не потокобезопасна: вызывающий код держит свою блокировку; без нее
+    можно звать только due().
+    """
+
+    def __init__(self):
+        self._heap = []
+        # item_id -> актуальный срок; записи в куче с другим сроком устарели
+        self._deadlines = {}
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, item_id):
+        return item_id in self._deadlines
+
+    def schedule(self, item_id, expires_at):
+        """Поставить или перенести срок истечения"""
+        self._deadlines[item_id] = expires_at
+        heapq.heappush(self._heap, (expires_at, item_id))
+
+    def cancel(self, item_id):
+        if self._deadlines.pop(item_id, None) is not None:
+            # Устаревшие записи вычищаются при pop, но не даем куче разрастись
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+                heapq.heapify(self._heap)
+
+    def next_deadline(self):
+        """Ближайший срок или None; снимает устаревшие записи с вершины"""
+        while self._heap:
+            expires_at, item_id = self._heap[0]
+            if self._deadlines.get(item_id) == expires_at:
+                return expires_at
+            heapq.heappop(self._heap)
+        return None
+
+    def due(self, now=None):
+        """Есть ли записи со сроком <= now, O(1).
+
+        Только читает вершину кучи, поэтому вызывается без блокировки,
+        параллельно со schedule(). Может ответить True из-за отмененной
+        записи: ее снимет следующий pop_expired().
+        """
+        heap = self._heap
+        try:
+            expires_at = heap[0][0]
+        except IndexError:
+            return False
+        return expires_at <= (time.time() if now is None else now)
+
+    def pop_expired(self, now=None):
+        """Снять с очереди и вернуть id всех записей со сроком <= now"""
+        if now is None:
+            now = time.time()
+
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, item_id = heapq.heappop(self._heap)
+            if self._deadlines.get(item_id) == expires_at:
+                del self._deadlines[item_id]
+                expired.append(item_id)
+        return expired
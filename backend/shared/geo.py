@@ -0,0 +1,172 @@
+# backend/shared/geo.py
+"""Геодезические расстояния: скалярный и пакетный (NumPy) haversine"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """Расстояние по дуге большого круга между двумя точками (в км)"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def batch_distances(lat, lng, lats, lngs, cos_lats=None):
+    """Расстояния (км) от точки до массива точек за один вызов.
+
+    cos_lats - заранее посчитанные cos(radians(lats)), если есть.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    if cos_lats is None:
+        cos_lats = np.cos(np.radians(lats))
+
+    phi = math.radians(lat)
+    sin_dphi = np.sin(np.radians(lats - lat) * 0.5)
+    sin_dlambda = np.sin(np.radians(lngs - lng) * 0.5)
+    a = sin_dphi * sin_dphi + math.cos(phi) * cos_lats * sin_dlambda * sin_dlambda
+    np.minimum(a, 1.0, out=a)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def bounding_box(lat, lng, radius_km):
+    """Прямоугольник (min_lat, max_lat, min_lng, max_lng), содержащий круг.
+
+    Долготы могут выходить за [-180, 180], если круг пересекает антимеридиан.
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angular)
+    min_lat = lat - dlat
+    max_lat = lat + dlat
+
+    if min_lat <= -90 or max_lat >= 90:
+        # Круг накрывает полюс: годится любая долгота
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+
+    ratio = math.sin(angular) / math.cos(math.radians(lat))
+    if ratio >= 1:
+        return min_lat, max_lat, -180.0, 180.0
+
+    dlng = math.degrees(math.asin(ratio))
+    return min_lat, max_lat, lng - dlng, lng + dlng
+
+
+def in_bounding_box(box, lat, lng):
+    """Попадает ли точка в прямоугольник bounding_box()"""
+    min_lat, max_lat, min_lng, max_lng = box
+    if not min_lat <= lat <= max_lat:
+        return False
+    return (min_lng <= lng <= max_lng
+            or min_lng <= lng - 360 <= max_lng
+            or min_lng <= lng + 360 <= max_lng)
+
+
+class PointArray:
+    """Координаты в непрерывных массивах NumPy с доступом по id.
+
+    Удаление - перестановкой последнего элемента на место удаляемого,
+    поэтому массивы остаются плотными, а порядок слотов не сохраняется.
+    """
+
+    def __init__(self, capacity=1024):
+        self.ids = []
+        self._slots = {}
+        self.lats = np.empty(capacity, dtype=np.float64)
+        self.lngs = np.empty(capacity, dtype=np.float64)
+        self.cos_lats = np.empty(capacity, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, item_id):
+        return item_id in self._slots
+
+    def copy(self):
+        """Независимая копия (для построения новой версии индекса)"""
+        clone = PointArray.__new__(PointArray)
+        clone.ids = list(self.ids)
+        clone._slots = dict(self._slots)
+        clone.lats = self.lats.copy()
+        clone.lngs = self.lngs.copy()
+        clone.cos_lats = self.cos_lats.copy()
+        return clone
+
+    def _grow(self):
+        capacity = max(1024, len(self.lats) * 2)
+        for name in ('lats', 'lngs', 'cos_lats'):
+            array = np.empty(capacity, dtype=np.float64)
+            old = getattr(self, name)
+            array[:len(old)] = old
+            setattr(self, name, array)
+
+    def upsert(self, item_id, lat, lng):
+        """Добавить точку или обновить координаты на месте"""
+        slot = self._slots.get(item_id)
+        if slot is None:
+            slot = len(self.ids)
+            if slot >= len(self.lats):
+                self._grow()
+            self.ids.append(item_id)
+            self._slots[item_id] = slot
+
+        self.lats[slot] = lat
+        self.lngs[slot] = lng
+        self.cos_lats[slot] = math.cos(math.radians(lat))
+
+    def remove(self, item_id):
+        slot = self._slots.pop(item_id, None)
+        if slot is None:
+            return
+
+        last = len(self.ids) - 1
+        if slot != last:
+            moved_id = self.ids[last]
+            self.ids[slot] = moved_id
+            self._slots[moved_id] = slot
+            self.lats[slot] = self.lats[last]
+            self.lngs[slot] = self.lngs[last]
+            self.cos_lats[slot] = self.cos_lats[last]
+        self.ids.pop()
+
+    def within(self, lat, lng, radius_km):
+        """Список (item_id, distance) в радиусе radius_km"""
+        size = len(self.ids)
+        slots, distances = points_within(self.lats[:size], self.lngs[:size], self.cos_lats[:size],
+                                         lat, lng, radius_km)
+        ids = self.ids
+        return [(ids[slot], float(distance)) for slot, distance in zip(slots, distances)]
+
+
+def points_within(lats, lngs, cos_lats, lat, lng, radius_km):
+    """Номера точек массивов в радиусе radius_km и расстояния до них.
+
+    Сначала дешевый отбор по прямоугольнику, затем haversine
+    только для прошедших его точек.
+    """
+    if len(lats) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+
+    mask = (lats >= min_lat) & (lats <= max_lat)
+    if min_lng > -180 or max_lng < 180:
+        lng_mask = (lngs >= min_lng) & (lngs <= max_lng)
+        if min_lng < -180:
+            lng_mask |= lngs >= min_lng + 360
+        if max_lng > 180:
+            lng_mask |= lngs <= max_lng - 360
+        mask &= lng_mask
+
+    slots = np.flatnonzero(mask)
+    if len(slots) == 0:
+        return slots, np.empty(0)
+
+    distances = batch_distances(lat, lng, lats[slots], lngs[slots], cos_lats[slots])
+    hits = distances <= radius_km
+    return slots[hits], distances[hits]
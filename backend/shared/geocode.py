@@ -0,0 +1,133 @@
+# backend/shared/geocode.py
+"""Обратное геокодирование без внешних сервисов: ближайший населенный пункт
+
+Справочник населенных пунктов (CSV: name, region, lat, lng, population)
+загружается в сетку GridIndex; координаты переводятся в город и регион
+за микросекунды. Результаты запоминаются по координатам, округленным до
+QUANTUM градуса: точки одного мероприятия и соседние старты считаются
+один раз.
+"""
+import csv
+import logging
+
+from .spatial import GridIndex
+
+logger = logging.getLogger(__name__)
+
+# Город дальше этого расстояния - уже не "место проведения"
+MAX_DISTANCE_KM = 30
+# Градусов: круг поиска накрывает лишь несколько соседних ячеек
+CELL_SIZE = 0.5
+# ~1 км по широте: шаг округления ключа памяти
+QUANTUM = 0.01
+MEMO_SIZE = 65536
+
+_MISSING = object()
+
+
+def city_key(name):
+    """Ключ города для фильтра: нижний регистр, ё -> е"""
+    return (name or '').strip().lower().replace('ё', 'е')
+
+
+class Place:
+    """Населенный пункт справочника"""
+
+    __slots__ = ('name', 'region', 'lat', 'lng', 'population')
+
+    def __init__(self, name, region, lat, lng, population=0):
+        self.name = name
+        self.region = region
+        self.lat = lat
+        self.lng = lng
+        self.population = population
+
+    @property
+    def label(self):
+        """Подпись места: "Город, Регион" (для городов-регионов - только город)"""
+        if not self.region or self.region == self.name:
+            return self.name
+        return f"{self.name}, {self.region}"
+
+
+def load_places(path):
+    """Населенные пункты из CSV; строки с ошибками пропускаются"""
+    places = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            try:
+                places.append(Place(
+                    row['name'].strip(),
+                    (row.get('region') or '').strip(),
+                    float(row['lat']),
+                    float(row['lng']),
+                    int(row.get('population') or 0),
+                ))
+            except (KeyError, AttributeError, ValueError):
+                continue
+    return places
+
+
+class ReverseGeocoder:
+    """Координаты -> ближайший населенный пункт не дальше max_distance_km.
+
+    Память результатов - словарь по округленным координатам,
+    сбрасывается целиком при переполнении.
+    """
+
+    def __init__(self, places, max_distance_km=MAX_DISTANCE_KM, quantum=QUANTUM, memo_size=MEMO_SIZE):
+        self.places = list(places)
+        self.max_distance_km = max_distance_km
+        self.quantum = quantum
+        self.memo_size = memo_size
+        self._grid = GridIndex(CELL_SIZE)
+        for n, place in enumerate(self.places):
+            self._grid.add(n, place.lat, place.lng)
+        self._memo = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        geocoder = cls(load_places(path), **kwargs)
+        logger.info(f"Loaded {len(geocoder)} places from {path}")
+        return geocoder
+
+    def __len__(self):
+        return len(self.places)
+
+    def lookup(self, lat, lng):
+        """(Place, расстояние в км) или None"""
+        key = (round(lat / self.quantum), round(lng / self.quantum))
+        found = self._memo.get(key, _MISSING)
+        if found is not _MISSING:
+            self.hits += 1
+            return found
+
+        self.misses += 1
+        found = None
+        nearest = self._grid.nearby(key[0] * self.quantum, key[1] * self.quantum, self.max_distance_km)
+        if nearest:
+            n, distance = nearest[0]
+            found = (self.places[n], distance)
+
+        if len(self._memo) >= self.memo_size:
+            self._memo.clear()
+        self._memo[key] = found
+        return found
+
+    def resolve(self, points):
+        """Place для набора точек мероприятия: ближайший к любой из них.
+
+        В ленте встречаются точки с перепутанными lat / lng; такая точка
+        обычно не попадает ни в один город и не мешает остальным.
+        """
+        best = None
+        for lat, lng in points:
+            found = self.lookup(lat, lng)
+            if found is not None and (best is None or found[1] < best[1]):
+                best = found
+        return best[0] if best is not None else None
+
+    def stats(self):
+        return {"places": len(self.places), "memo": len(self._memo), "hits": self.hits, "misses": self.misses}
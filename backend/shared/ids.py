@@ -0,0 +1,144 @@
+# backend/shared/ids.py
+"""Монотонные, упорядоченные по времени id без коллизий
+
+id - 80 бит: 48 бит миллисекунд Unix-времени, 20 бит номера процесса
+и 12 бит счетчика внутри миллисекунды, записанные 16 символами base32
+Кроуфорда. Алфавит идет по возрастанию ASCII, поэтому строки id
+сортируются так же, как время их создания, и годятся как ключ для
+выборки по диапазону: все id после момента t не меньше lower_bound(t).
+
+Номер процесса уникален, только если его выдает общее хранилище
+(lease): случайные 20 бит у двух воркеров могут совпасть.
+"""
+import os
+import threading
+import time
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+TIME_BITS = 48
+WORKER_BITS = 20
+SEQUENCE_BITS = 12
+ID_LENGTH = 16  # 80 бит по 5 бит на символ
+
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+# Секунд аренды номера процесса; продлевается после трети срока
+LEASE_TTL = 60.0
+
+_DECODE = {char: value for value, char in enumerate(ALPHABET)}
+
+
+def encode(value, length=ID_LENGTH):
+    chars = []
+    for _ in range(length):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def decode(code):
+    value = 0
+    for char in code.upper():
+        value = (value << 5) | _DECODE[char]
+    return value
+
+
+def _random_worker():
+    return int.from_bytes(os.urandom(3), 'big') & MAX_WORKER
+
+
+class IdGenerator:
+    """Генератор id с префиксом, потокобезопасный.
+
+    worker - номер процесса (WORKER_ID из окружения). Без него номер
+    арендуется через lease(worker, ttl, limit) -> worker, например
+    SQLiteStorage.lease_worker: хранилище выдает каждому живому процессу
+    свой номер из range(limit) и продлевает аренду worker, если она еще
+    его. Без lease номер случайный - подходит для одного процесса.
+
+    Номер выбирается заново в дочернем процессе после fork, чтобы
+    воркеры не делили последовательность. Если часы отстали, генератор
+    продолжает с последней выданной миллисекунды.
+    """
+
+    def __init__(self, prefix='', worker=None, clock=time.time, lease=None, lease_ttl=LEASE_TTL):
+        if worker is None and os.environ.get('WORKER_ID'):
+            worker = int(os.environ['WORKER_ID'])
+        if worker is not None and not 0 <= worker <= MAX_WORKER:
+            raise ValueError(f"Worker id must be between 0 and {MAX_WORKER}")
+        self.prefix = prefix
+        self.clock = clock
+        self.lease = lease if worker is None else None
+        self.lease_ttl = lease_ttl
+        self._fixed_worker = worker
+        self._worker = self._initial_worker()
+        self._leased_at = None  # time.monotonic() последнего продления
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _initial_worker(self):
+        if self._fixed_worker is not None:
+            return self._fixed_worker
+        # Арендованный номер берется при первом id: хранилище может быть еще не готово
+        return None if self.lease is not None else _random_worker()
+
+    @property
+    def worker(self):
+        return self._worker
+
+    def _renew(self):
+        """Под self._lock: номер процесса с действующей арендой"""
+        now = time.monotonic()
+        if self._leased_at is None or now - self._leased_at > self.lease_ttl / 3:
+            worker = self.lease(self._worker, self.lease_ttl, MAX_WORKER + 1)
+            if not 0 <= worker <= MAX_WORKER:
+                raise ValueError(f"Leased worker id {worker} is out of range")
+            self._worker = worker
+            self._leased_at = now
+
+    def next_id(self, prefix=None):
+        """Следующий id; prefix заменяет префикс генератора (другой вид
+        записей с той же последовательностью)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._worker = self._initial_worker()
+                self._leased_at = None
+                self._last_ms = -1
+            if self.lease is not None:
+                self._renew()
+
+            ms = max(int(self.clock() * 1000), self._last_ms)
+            if ms == self._last_ms:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # Счетчик миллисекунды исчерпан: берем следующую
+                    ms += 1
+                    self._sequence = 0
+            else:
+                self._sequence = 0
+            self._last_ms = ms
+
+            value = (ms << (WORKER_BITS + SEQUENCE_BITS)) | (self._worker << SEQUENCE_BITS) | self._sequence
+        return (self.prefix if prefix is None else prefix) + encode(value)
+
+    def lower_bound(self, timestamp, prefix=None):
+        """Наименьший возможный id, созданный не раньше timestamp (epoch)"""
+        prefix = self.prefix if prefix is None else prefix
+        return prefix + encode(int(timestamp * 1000) << (WORKER_BITS + SEQUENCE_BITS))
+
+    def timestamp(self, generated_id, prefix=None):
+        """Момент создания id (epoch) или None, если id не из генератора"""
+        prefix = self.prefix if prefix is None else prefix
+        if not generated_id.startswith(prefix):
+            return None
+        code = generated_id[len(prefix):]
+        if len(code) != ID_LENGTH:
+            return None
+        try:
+            value = decode(code)
+        except KeyError:
+            return None
+        return (value >> (WORKER_BITS + SEQUENCE_BITS)) / 1000
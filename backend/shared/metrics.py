@@ -0,0 +1,321 @@
+# backend/shared/metrics.py
+"""Замеры запросов по участкам (span), гистограммы и формат Prometheus
+
+Участок кода оборачивается в metrics.span('filter'): время копится в
+текущем запросе и при его завершении попадает в гистограмму с метками
+method и endpoint. Вне запроса (фоновые потоки) они пустые.
+
+Профилировщик медленных запросов по умолчанию выключен: когда он
+включен, отдельный поток раз в interval снимает стеки потоков, занятых
+запросами, и хранит их для самых медленных запросов в свернутом виде
+(формат flamegraph.pl / speedscope).
+"""
+import bisect
+import contextvars
+import heapq
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Границы гистограмм, секунды
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_INTERVAL = 0.005
+MAX_STACK_DEPTH = 64
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current_request = contextvars.ContextVar('current_request', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами; le включительно"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestTimer:
+    """Текущий запрос: начало, накопленное время участков, снятые стеки"""
+
+    __slots__ = ('method', 'endpoint', 'started', 'spans', 'thread_id', 'samples')
+
+    def __init__(self, method, endpoint):
+        self.method = method
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.thread_id = threading.get_ident()
+        self.samples = None
+
+
+class _Span:
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        timer = _current_request.get()
+        if timer is None:
+            self.metrics.observe_span('', '', self.name, elapsed)
+        else:
+            timer.spans[self.name] = timer.spans.get(self.name, 0.0) + elapsed
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Metrics:
+    """Счетчики и гистограммы запросов и участков одного процесса.
+
+    begin() / finish() вызывает обвязка фреймворка вокруг запроса,
+    span() - код обработчиков. При enabled=False span() ничего не
+    замеряет, а обвязку не стоит и подключать.
+    """
+
+    def __init__(self, service, enabled=True, buckets=DEFAULT_BUCKETS, profiler=None):
+        self.service = service
+        self.enabled = enabled
+        self.buckets = buckets
+        self.profiler = profiler
+        self._lock = threading.Lock()
+        # (method, endpoint) -> Histogram
+        self._requests = {}
+        # (method, endpoint, status) -> число
+        self._responses = Counter()
+        # (method, endpoint, span) -> Histogram
+        self._spans = {}
+
+    def span(self, name):
+        """Контекст, замеряющий участок name текущего запроса"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name)
+
+    def begin(self, method, endpoint=None):
+        """Начало запроса; endpoint можно уточнить в finish()"""
+        timer = RequestTimer(method, endpoint)
+        _current_request.set(timer)
+        if self.profiler is not None:
+            self.profiler.attach(timer)
+        return timer
+
+    def finish(self, timer, status, endpoint=None):
+        """Конец запроса: длительность и участки попадают в гистограммы"""
+        elapsed = time.perf_counter() - timer.started
+        _current_request.set(None)
+        if endpoint is not None:
+            timer.endpoint = endpoint
+        endpoint = timer.endpoint or ''
+
+        with self._lock:
+            self._histogram(self._requests, (timer.method, endpoint)).observe(elapsed)
+            self._responses[(timer.method, endpoint, str(status))] += 1
+            for name, spent in timer.spans.items():
+                self._histogram(self._spans, (timer.method, endpoint, name)).observe(spent)
+
+        if self.profiler is not None:
+            self.profiler.detach(timer, elapsed)
+        return elapsed
+
+    def observe_span(self, method, endpoint, name, seconds):
+        with self._lock:
+            self._histogram(self._spans, (method, endpoint, name)).observe(seconds)
+
+    def _histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(self.buckets)
+        return histogram
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        service = f'service="{_escape(self.service)}"'
+        lines = []
+        with self._lock:
+            lines.append('# HELP http_requests_total Completed HTTP requests.')
+            lines.append('# TYPE http_requests_total counter')
+            for key, count in sorted(self._responses.items()):
+                lines.append(f"http_requests_total{_labels(('method', 'endpoint', 'status'), key, service)} {count}")
+
+            self._render_histograms(lines, 'http_request_duration_seconds', 'HTTP request latency.',
+                                    ('method', 'endpoint'), self._requests, service)
+            self._render_histograms(lines, 'span_duration_seconds', 'Time spent in a named span per request.',
+                                    ('method', 'endpoint', 'span'), self._spans, service)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histograms(lines, name, help_text, label_names, table, extra):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, histogram in sorted(table.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                labels = _labels(label_names, key, f'{extra},le="{_number(bound)}"')
+                lines.append(f'{name}_bucket{labels} {cumulative}')
+            labels = _labels(label_names, key, f'{extra},le="+Inf"')
+            lines.append(f'{name}_bucket{labels} {histogram.count}')
+            lines.append(f'{name}_sum{_labels(label_names, key, extra)} {_number(histogram.sum)}')
+            lines.append(f'{name}_count{_labels(label_names, key, extra)} {histogram.count}')
+
+    def render_profile(self):
+        """Стеки самых медленных запросов (пусто, если профилировщик выключен)"""
+        if self.profiler is None:
+            return ''
+        return self.profiler.render()
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, max_depth=MAX_STACK_DEPTH):
+    """Стек от корня к листу через ';', как в свернутом формате flamegraph"""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """Сэмплирующий профилировщик: стеки keep самых медленных запросов.
+
+    Снимки берутся у потока, в котором начался запрос. У асинхронных
+    сервисов один поток обслуживает несколько запросов сразу, и снимок
+    достается всем активным запросам потока.
+    """
+
+    def __init__(self, keep=10, interval=PROFILE_INTERVAL):
+        self.keep = keep
+        self.interval = interval
+        self._lock = threading.Lock()
+        # thread id -> активные запросы потока
+        self._active = {}
+        # min-куча (длительность, порядковый номер, описание, стеки)
+        self._slowest = []
+        self._sequence = itertools.count()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+            self._thread.start()
+
+    def attach(self, timer):
+        timer.samples = Counter()
+        with self._lock:
+            self._active.setdefault(timer.thread_id, []).append(timer)
+
+    def detach(self, timer, elapsed):
+        with self._lock:
+            timers = self._active.get(timer.thread_id)
+            if timers is not None:
+                timers.remove(timer)
+                if not timers:
+                    del self._active[timer.thread_id]
+
+            if not timer.samples:
+                return
+            item = (elapsed, next(self._sequence), f"{timer.method} {timer.endpoint}", timer.samples)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, item)
+            elif elapsed > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+
+    def sample(self):
+        """Снять стеки потоков, занятых запросами"""
+        if not self._active:
+            return
+
+        frames = sys._current_frames()
+        # Под блокировкой: завершенный запрос не получит снимков после detach
+        with self._lock:
+            for thread_id, timers in self._active.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = collapse_stack(frame)
+                for timer in timers:
+                    timer.samples[stack] += 1
+
+    def render(self):
+        """Свернутые стеки: '<запрос>;<кадр>;...;<кадр> <число снимков>'"""
+        with self._lock:
+            slowest = sorted(self._slowest, reverse=True)
+
+        lines = []
+        for elapsed, _, request, samples in slowest:
+            root = f"{request} {elapsed * 1000:.1f}ms".replace(';', ',')
+            for stack, count in samples.most_common():
+                lines.append(f"{root};{stack} {count}")
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def from_env(service):
+    """Metrics по переменным окружения.
+
+    METRICS_ENABLED=0 выключает замеры, PROFILE_SLOW_REQUESTS=N включает
+    профилировщик N самых медленных запросов, PROFILE_INTERVAL_MS - шаг
+    снимков.
+    """
+    enabled = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no', '')
+    keep = int(os.environ.get('PROFILE_SLOW_REQUESTS', 0))
+
+    profiler = None
+    if enabled and keep > 0:
+        interval = float(os.environ.get('PROFILE_INTERVAL_MS', PROFILE_INTERVAL * 1000)) / 1000
+        profiler = SlowRequestProfiler(keep, interval)
+        profiler.start()
+    return Metrics(service, enabled=enabled, profiler=profiler)
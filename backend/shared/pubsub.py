@@ -0,0 +1,228 @@
+# backend/shared/pubsub.py
+"""Рассылка изменений подписчикам по ячейкам их области карты"""
+import asyncio
+import json
+import math
+import threading
+from collections import deque
+
+from .geo import bounding_box, calculate_distance
+
+# Подписки, которым нужно больше ячеек, проверяются при каждой публикации
+MAX_SUBSCRIPTION_CELLS = 256
+
+
+def format_sse(message):
+    """Сообщение в формате text/event-stream"""
+    data = json.dumps(message['data'], ensure_ascii=False, separators=(',', ':'))
+    return f"event: {message['type']}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """Подписка на круг (lat, lng, radius) и, опционально, вид спорта.
+
+    Сообщения копятся в ограниченной очереди: медленный клиент теряет
+    самые старые и получает флаг overflowed, чтобы перезапросить данные.
+    """
+
+    def __init__(self, lat, lng, radius_km, sport=None, max_queue=1000):
+        self.lat = lat
+        self.lng = lng
+        self.radius_km = radius_km
+        self.sport = sport or None
+        self.cells = ()
+        self.overflowed = False
+        self._queue = deque(maxlen=max_queue)
+
+    def covers(self, lat, lng):
+        return calculate_distance(self.lat, self.lng, lat, lng) <= self.radius_km
+
+    def accepts(self, sport):
+        """sport - вид спорта объекта или набор видов (у пользователей)"""
+        if self.sport is None or sport is None:
+            return True
+        if isinstance(sport, (tuple, list, set, frozenset)):
+            return self.sport in sport
+        return self.sport == sport
+
+    def push(self, message):
+        if len(self._queue) == self._queue.maxlen:
+            self.overflowed = True
+        self._queue.append(message)
+        self._notify()
+
+    def _notify(self):
+        pass
+
+    def _pop(self):
+        if self.overflowed:
+            self.overflowed = False
+            return {"type": "overflow", "data": {}}
+        try:
+            return self._queue.popleft()
+        except IndexError:
+            return None
+
+
+class ThreadSubscription(Subscription):
+    """Подписка для потоков (Flask): get() блокирует до сообщения"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._event = threading.Event()
+
+    def _notify(self):
+        self._event.set()
+
+    def get(self, timeout=None):
+        """Следующее сообщение или None по таймауту"""
+        message = self._pop()
+        if message is None:
+            self._event.wait(timeout)
+            self._event.clear()
+            message = self._pop()
+        return message
+
+
+class AsyncSubscription(Subscription):
+    """Подписка для asyncio (FastAPI); создается внутри event loop"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+
+    def _notify(self):
+        # Публикация может прийти из другого потока
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    async def get(self, timeout=None):
+        """Следующее сообщение или None по таймауту"""
+        message = self._pop()
+        if message is None:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._event.clear()
+            message = self._pop()
+        return message
+
+
+class ViewportHub:
+    """Подписки, разложенные по ячейкам сетки cell_size градусов.
+
+    Изменение в точке проверяется только против подписок ее ячейки,
+    а не против всех подключенных клиентов.
+    """
+
+    def __init__(self, cell_size=0.25):
+        self.cell_size = cell_size
+        self._lock = threading.Lock()
+        self._cells = {}
+        self._wide = set()
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def _cells_for(self, subscription):
+        min_lat, max_lat, min_lng, max_lng = bounding_box(
+            subscription.lat, subscription.lng, subscription.radius_km)
+        if max_lng - min_lng >= 360:
+            return None
+
+        i_min, j_min = self._cell(min_lat, min_lng)
+        i_max, j_max = self._cell(max_lat, max_lng)
+        if (i_max - i_min + 1) * (j_max - j_min + 1) > MAX_SUBSCRIPTION_CELLS:
+            return None
+
+        # Долготы за антимеридианом приводятся в [-180, 180)
+        wrap = round(360 / self.cell_size)
+        half = wrap // 2
+        return [
+            (i, (j + half) % wrap - half)
+            for i in range(i_min, i_max + 1)
+            for j in range(j_min, j_max + 1)
+        ]
+
+    def subscribe(self, subscription):
+        cells = self._cells_for(subscription)
+        with self._lock:
+            if cells is None:
+                subscription.cells = None
+                self._wide.add(subscription)
+            else:
+                subscription.cells = cells
+                for cell in cells:
+                    self._cells.setdefault(cell, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription.cells is None:
+                if subscription not in self._wide:
+                    return
+                self._wide.discard(subscription)
+            else:
+                for cell in subscription.cells:
+                    members = self._cells.get(cell)
+                    if members is None or subscription not in members:
+                        continue
+                    members.discard(subscription)
+                    if not members:
+                        del self._cells[cell]
+            subscription.cells = ()
+            self._count -= 1
+
+    def _candidates(self, lat, lng):
+        members = self._cells.get(self._cell(lat, lng))
+        if members:
+            return list(members) + list(self._wide)
+        return list(self._wide)
+
+    def publish(self, event_type, lat, lng, sport, data):
+        """Отправить событие в точке всем подпискам, чей круг ее содержит"""
+        message = {"type": event_type, "data": data}
+        with self._lock:
+            candidates = self._candidates(lat, lng)
+
+        delivered = 0
+        for subscription in candidates:
+            if subscription.accepts(sport) and subscription.covers(lat, lng):
+                subscription.push(message)
+                delivered += 1
+        return delivered
+
+    def publish_move(self, prefix, old, new, sport, data):
+        """Перемещение объекта из old в new (любая из точек может быть None).
+
+        Подписки получают {prefix}_entered, {prefix}_moved или {prefix}_left
+        в зависимости от того, в каких точках объект был в их круге.
+        """
+        with self._lock:
+            candidates = set(self._candidates(*old)) if old else set()
+            if new:
+                candidates.update(self._candidates(*new))
+
+        delivered = 0
+        for subscription in candidates:
+            if not subscription.accepts(sport):
+                continue
+            was_inside = old is not None and subscription.covers(*old)
+            is_inside = new is not None and subscription.covers(*new)
+            if was_inside and is_inside:
+                event_type = f"{prefix}_moved"
+            elif is_inside:
+                event_type = f"{prefix}_entered"
+            elif was_inside:
+                event_type = f"{prefix}_left"
+            else:
+                continue
+            subscription.push({"type": event_type, "data": data})
+            delivered += 1
+        return delivered
@@ -0,0 +1,86 @@
+# backend/shared/roster.py
+"""Участники тренировки: порядок вступления, индекс по user_id, страницы"""
+import bisect
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Разделитель joined_at и user_id в курсоре; в ISO-времени его не бывает
+CURSOR_SEPARATOR = '|'
+
+
+def _key(participant):
+    """Позиция участника в списке: joined_at не уникален, user_id - уникален"""
+    return (participant.get('joined_at') or '', str(participant['user_id']))
+
+
+def encode_cursor(key):
+    joined_at, user_id = key
+    return f"{joined_at}{CURSOR_SEPARATOR}{user_id}"
+
+
+def decode_cursor(cursor):
+    """Курсор -> ключ; курсор из одного joined_at (старый формат) - перед
+    всеми участниками с этим временем"""
+    joined_at, _, user_id = cursor.partition(CURSOR_SEPARATOR)
+    return (joined_at, user_id)
+
+
+class Roster:
+    """Список участников одной тренировки.
+
+    Проверка участия и число участников - O(1) через словарь user_id;
+    список упорядочен по (joined_at, user_id), поэтому страница по курсору
+    ищется бинарным поиском, а не проходом по всему списку.
+    """
+
+    __slots__ = ('_items', '_keys', '_members')
+
+    def __init__(self, participants=()):
+        self._items = []     # участники по возрастанию (joined_at, user_id)
+        self._keys = []      # их ключи, для bisect
+        self._members = {}   # user_id -> участник
+        for participant in participants:
+            self.add(participant)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, user_id):
+        return user_id in self._members
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def to_list(self):
+        return list(self._items)
+
+    def add(self, participant):
+        """Добавить участника, если его еще нет. Возвращает True при добавлении"""
+        user_id = participant['user_id']
+        if user_id in self._members:
+            return False
+
+        self._members[user_id] = participant
+        key = _key(participant)
+        if not self._keys or key > self._keys[-1]:
+            # Обычный случай: участники приходят по времени
+            self._items.append(participant)
+            self._keys.append(key)
+        else:
+            position = bisect.bisect_right(self._keys, key)
+            self._items.insert(position, participant)
+            self._keys.insert(position, key)
+        return True
+
+    def page(self, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Участники после cursor, не больше limit.
+
+        Курсор - "joined_at|user_id" последнего участника предыдущей
+        страницы: участники с одинаковым joined_at не теряются между
+        страницами. Возвращает (участники, курсор следующей страницы или None).
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        start = bisect.bisect_right(self._keys, decode_cursor(cursor)) if cursor else 0
+        items = self._items[start:start + limit]
+        next_cursor = encode_cursor(self._keys[start + limit - 1]) if start + limit < len(self._items) else None
+        return items, next_cursor
@@ -0,0 +1,171 @@
+# backend/shared/search.py
+"""Полнотекстовый поиск: инвертированный индекс со стеммингом и префиксами"""
+import bisect
+import functools
+import re
+import threading
+from array import array
+
+TOKEN_RE = re.compile(r'[0-9a-zа-я]+')
+
+STOP_WORDS = frozenset(
+    'и в во на с со по для к ко от до из за о об у а но или не ни же ли бы то'
+    ' the a an of and or in on at to for'.split()
+)
+
+# Окончания русских слов, от длинных к коротким
+ENDINGS = sorted(
+    set(
+        'ями ами ого его ому ему ыми ими ых их ую юю ая яя ое ее ые ие ой ей ий ый ом ем ам ям ах ях'
+        ' ов ев ью ия ию ть ться тся ла ло ли ет ют ат ят ит ишь ешь им'
+        ' а я о е ы и у ю ь й'.split()
+    ),
+    key=len, reverse=True
+)
+MIN_STEM = 3
+
+# Сколько терминов раскрывает префикс последнего слова запроса
+MAX_PREFIX_TERMS = 64
+
+
+@functools.lru_cache(maxsize=65536)
+def stem(word):
+    """Легкий стеммер: отрезает самое длинное окончание, оставляя >= 3 букв"""
+    if not 'а' <= word[0] <= 'я':
+        return word
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    """Слова текста в нижнем регистре, ё -> е, без стоп-слов"""
+    text = (text or '').lower().replace('ё', 'е')
+    return [token for token in TOKEN_RE.findall(text) if token not in STOP_WORDS]
+
+
+class SearchIndex:
+    """Инвертированный индекс: основа слова -> массив номеров документов.
+
+    Документы нумеруются внутренними int, списки вхождений хранятся в
+    array('I') (4 байта на вхождение), а у слов из одного документа -
+    просто номером. Удаление помечает номер удаленным, списки чистятся
+    пачкой, когда удаленных становится много.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}      # основа -> номер документа или array('I')
+        self._terms = []         # основы для поиска по префиксу
+        self._terms_sorted = True
+        self._doc_keys = []      # номер -> ключ документа (None - удален)
+        self._doc_numbers = {}   # ключ -> номер
+        self._deleted = 0
+
+    def __len__(self):
+        return len(self._doc_numbers)
+
+    def __contains__(self, key):
+        return key in self._doc_numbers
+
+    def add(self, key, *texts):
+        """Проиндексировать документ (повторный add заменяет прежний)"""
+        terms = {stem(token) for text in texts for token in tokenize(text)}
+        with self._lock:
+            self._remove(key)
+            number = len(self._doc_keys)
+            self._doc_keys.append(key)
+            self._doc_numbers[key] = number
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    self._postings[term] = number
+                    self._terms.append(term)
+                    self._terms_sorted = False
+                elif type(postings) is int:
+                    self._postings[term] = array('I', (postings, number))
+                else:
+                    postings.append(number)
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+            if self._deleted > 1024 and self._deleted * 4 > len(self._doc_keys):
+                self._compact()
+
+    def _remove(self, key):
+        number = self._doc_numbers.pop(key, None)
+        if number is not None:
+            self._doc_keys[number] = None
+            self._deleted += 1
+
+    def _compact(self):
+        """Перенумеровать живые документы и выбросить удаленные из списков"""
+        renumber = {}
+        keys = []
+        for number, key in enumerate(self._doc_keys):
+            if key is not None:
+                renumber[number] = len(keys)
+                keys.append(key)
+
+        for term in list(self._postings):
+            postings = [renumber[n] for n in self._numbers(term) if n in renumber]
+            if len(postings) > 1:
+                self._postings[term] = array('I', postings)
+            elif postings:
+                self._postings[term] = postings[0]
+            else:
+                del self._postings[term]
+        self._terms = sorted(self._postings)
+        self._terms_sorted = True
+        self._doc_keys = keys
+        self._doc_numbers = {key: number for number, key in enumerate(keys)}
+        self._deleted = 0
+
+    def _numbers(self, term):
+        postings = self._postings.get(term, ())
+        return (postings,) if type(postings) is int else postings
+
+    def _prefix_numbers(self, prefix):
+        if not self._terms_sorted:
+            # Сортируем лениво: новые основы копятся в конце списка
+            self._terms.sort()
+            self._terms_sorted = True
+
+        start = bisect.bisect_left(self._terms, prefix)
+        numbers = set()
+        for term in self._terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            numbers.update(self._numbers(term))
+        return numbers
+
+    def search(self, query, prefix=True):
+        """Ключи документов, содержащих все слова запроса.
+
+        Последнее слово при prefix=True ищется как начало слова (подсказки
+        при наборе). Пустой запрос дает None - фильтр не применяется.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+
+        with self._lock:
+            sets = []
+            for n, token in enumerate(tokens):
+                term = stem(token)
+                if prefix and n == len(tokens) - 1:
+                    sets.append(self._prefix_numbers(term))
+                else:
+                    sets.append(set(self._numbers(term)))
+
+            sets.sort(key=len)
+            numbers = sets[0]
+            for other in sets[1:]:
+                numbers &= other
+                if not numbers:
+                    break
+
+            keys = self._doc_keys
+            return {keys[n] for n in numbers if keys[n] is not None}
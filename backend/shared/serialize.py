@@ -0,0 +1,106 @@
+# backend/shared/serialize.py
+"""Быстрая сериализация JSON: orjson, если установлен, иначе json
+
+Записи отдаются с дополнительными полями (distance, participants_count)
+без копирования словаря: поля дописываются к уже закодированной записи.
+Большие выборки кодируются по одной записи и могут уходить клиенту
+потоком - JSON-массивом или NDJSON, - не собираясь в памяти целиком.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - зависит от окружения
+    orjson = None
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+# Начало ответа {"status": "success", "data": ...} в кодировке dumps()
+SUCCESS_PREFIX = b'{"status":"success","data":'
+# Сколько закодированных записей склеивается в один кусок потока
+STREAM_CHUNK_RECORDS = 256
+
+if orjson is not None:
+    def dumps(value):
+        """Объект -> JSON в UTF-8 (bytes)"""
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def dumps(value):
+        """Объект -> JSON в UTF-8 (bytes)"""
+        return _encoder.encode(value).encode('utf-8')
+
+
+def dumps_overlay(record, extra):
+    """dict(record, **extra) в JSON, не копируя record.
+
+    Поля extra дописываются в конец объекта. Если ключ уже есть в
+    record, кодируется копия, чтобы в объекте не было повторов.
+    """
+    if not extra:
+        return dumps(record)
+    if not record or any(key in record for key in extra):
+        return dumps(dict(record, **extra))
+
+    body = dumps(record)
+    fields = b','.join(dumps(key) + b':' + dumps(value) for key, value in extra.items())
+    return body[:-1] + b',' + fields + b'}'
+
+
+def iter_array(encoded):
+    """Куски JSON-массива из итератора закодированных элементов"""
+    yield b'['
+    chunk = []
+    first = True
+    for item in encoded:
+        if not first:
+            chunk.append(b',')
+        chunk.append(item)
+        first = False
+        if len(chunk) >= 2 * STREAM_CHUNK_RECORDS:
+            yield b''.join(chunk)
+            chunk = []
+    chunk.append(b']')
+    yield b''.join(chunk)
+
+
+def iter_ndjson(encoded):
+    """Куски NDJSON: по закодированному элементу на строку"""
+    chunk = []
+    for item in encoded:
+        chunk.append(item)
+        chunk.append(b'\n')
+        if len(chunk) >= 2 * STREAM_CHUNK_RECORDS:
+            yield b''.join(chunk)
+            chunk = []
+    if chunk:
+        yield b''.join(chunk)
+
+
+def iter_object(pairs):
+    """Куски JSON-объекта из пар (ключ, закодированное значение)"""
+    yield b'{'
+    chunk = []
+    first = True
+    for key, encoded in pairs:
+        if not first:
+            chunk.append(b',')
+        chunk.append(dumps(str(key)) + b':' + encoded)
+        first = False
+        if len(chunk) >= 2 * STREAM_CHUNK_RECORDS:
+            yield b''.join(chunk)
+            chunk = []
+    chunk.append(b'}')
+    yield b''.join(chunk)
+
+
+def envelope(encoded, prefix=SUCCESS_PREFIX):
+    """Ответ {"status": "success", "data": [...]} из закодированных элементов"""
+    return prefix + b''.join(iter_array(encoded)) + b'}'
+
+
+def wants_ndjson(accept, format_param):
+    """Клиент просит NDJSON: ?format=ndjson или Accept: application/x-ndjson"""
+    if format_param:
+        return format_param == 'ndjson'
+    return bool(accept) and NDJSON_CONTENT_TYPE in accept
@@ -0,0 +1,239 @@
+# backend/shared/spatial.py
+"""Пространственный индекс: сетка фиксированного шага по lat/lng"""
+import heapq
+import math
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_KM, batch_distances, bounding_box, calculate_distance
+
+# Меньше кандидатов дешевле посчитать в цикле, чем собирать массивы
+BATCH_THRESHOLD = 32
+KM_PER_DEGREE = math.radians(EARTH_RADIUS_KM)
+
+
+class GridIndex:
+    """Сетка ячеек cell_size x cell_size градусов с подиндексом по виду спорта.
+
+    Запрос по радиусу смотрит только ячейки, пересекающие описанный
+    вокруг круга прямоугольник; точное расстояние - haversine.
+    """
+
+    def __init__(self, cell_size=0.05):
+        self.cell_size = cell_size
+        # (i, j) -> {sport: {item_id, ...}}
+        self._cells = {}
+        # item_id -> (lat, lng, sport, cell)
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, item_id):
+        return item_id in self._points
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def add(self, item_id, lat, lng, sport=None):
+        """Добавить точку или переместить уже существующую"""
+        cell = self._cell(lat, lng)
+        old = self._points.get(item_id)
+        if old is not None:
+            if old[2] == sport and old[3] == cell:
+                self._points[item_id] = (lat, lng, sport, cell)
+                return
+            self._discard(item_id, old[2], old[3])
+
+        self._points[item_id] = (lat, lng, sport, cell)
+        self._cells.setdefault(cell, {}).setdefault(sport, set()).add(item_id)
+
+    def remove(self, item_id):
+        old = self._points.pop(item_id, None)
+        if old is not None:
+            self._discard(item_id, old[2], old[3])
+
+    def _discard(self, item_id, sport, cell):
+        by_sport = self._cells.get(cell)
+        if by_sport is None:
+            return
+        ids = by_sport.get(sport)
+        if ids is not None:
+            ids.discard(item_id)
+            if not ids:
+                del by_sport[sport]
+        if not by_sport:
+            del self._cells[cell]
+
+    def candidates(self, lat, lng, radius_km, sport=None):
+        """id точек в ячейках, пересекающих прямоугольник вокруг круга"""
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        i_min = math.floor(min_lat / self.cell_size)
+        i_max = math.floor(max_lat / self.cell_size)
+
+        # Прямоугольник может пересекать антимеридиан: до двух диапазонов долгот
+        lng_ranges = [(max(min_lng, -180.0), min(max_lng, 180.0))]
+        if min_lng < -180:
+            lng_ranges.append((min_lng + 360, 180.0))
+        if max_lng > 180:
+            lng_ranges.append((-180.0, max_lng - 360))
+        j_ranges = [
+            (math.floor(low / self.cell_size), math.floor(high / self.cell_size))
+            for low, high in lng_ranges
+        ]
+
+        span = (i_max - i_min + 1) * sum(j_max - j_min + 1 for j_min, j_max in j_ranges)
+        if span > len(self._cells):
+            # Большой радиус: дешевле пройти по непустым ячейкам
+            cells = [
+                by_sport for (i, j), by_sport in self._cells.items()
+                if i_min <= i <= i_max and any(j_min <= j <= j_max for j_min, j_max in j_ranges)
+            ]
+        else:
+            cells = []
+            for i in range(i_min, i_max + 1):
+                for j_min, j_max in j_ranges:
+                    for j in range(j_min, j_max + 1):
+                        by_sport = self._cells.get((i, j))
+                        if by_sport is not None:
+                            cells.append(by_sport)
+
+        for by_sport in cells:
+            if sport:
+                yield from by_sport.get(sport, ())
+            else:
+                for ids in by_sport.values():
+                    yield from ids
+
+    def nearby(self, lat, lng, radius_km, sport=None):
+        """Список (item_id, distance) в радиусе radius_km, по возрастанию расстояния"""
+        points = self._points
+        candidates = list(self.candidates(lat, lng, radius_km, sport))
+
+        if len(candidates) < BATCH_THRESHOLD:
+            result = []
+            for item_id in candidates:
+                point = points[item_id]
+                distance = calculate_distance(lat, lng, point[0], point[1])
+                if distance <= radius_km:
+                    result.append((item_id, distance))
+        else:
+            count = len(candidates)
+            lats = np.fromiter((points[item_id][0] for item_id in candidates), dtype=np.float64, count=count)
+            lngs = np.fromiter((points[item_id][1] for item_id in candidates), dtype=np.float64, count=count)
+            distances = batch_distances(lat, lng, lats, lngs)
+            result = [
+                (candidates[n], float(distances[n]))
+                for n in np.flatnonzero(distances <= radius_km)
+            ]
+
+        result.sort(key=lambda item: item[1])
+        return result
+
+    def nearest(self, lat, lng, k, radius_km, weight=None, max_weight=1.0):
+        """k лучших точек в радиусе: [(item_id, distance)] по возрастанию
+        distance / weight(item_id).
+
+        Ячейки просматриваются кольцами от ячейки запроса наружу. Поиск
+        останавливается, когда нижняя граница расстояния до следующего
+        кольца, деленная на max_weight, хуже k-го найденного, поэтому
+        результат точный, а просмотрено лишь несколько колец вокруг
+        точки. По той же границе пропускаются отдельные ячейки и точки.
+        weight возвращает None для неподходящей точки (расстояние до нее
+        не считается); по умолчанию вес у всех точек 1.
+        """
+        if k <= 0 or not self._points:
+            return []
+        size = self.cell_size
+        ci, cj = self._cell(lat, lng)
+        columns = round(360 / size)
+        first_column = math.floor(-180 / size)
+        rings = columns // 2 + math.ceil(180 / size)
+        points = self._points
+        visited = set()
+        # Куча k лучших по (-оценка): в вершине худший из них
+        best = []
+
+        def visit(cell):
+            by_sport = self._cells.get(cell)
+            if by_sport is None:
+                return
+            if len(best) == k and self._cell_bound(lat, lng, cell) / max_weight >= -best[0][0]:
+                return
+            for ids in by_sport.values():
+                for item_id in ids:
+                    point = points[item_id]
+                    # Разница широт - дешевая нижняя граница расстояния
+                    if len(best) == k and abs(point[0] - lat) * KM_PER_DEGREE / max_weight >= -best[0][0]:
+                        continue
+                    divisor = weight(item_id) if weight is not None else 1.0
+                    if divisor is None:
+                        continue
+                    distance = calculate_distance(lat, lng, point[0], point[1])
+                    if distance > radius_km:
+                        continue
+                    score = distance / divisor
+                    if len(best) < k:
+                        heapq.heappush(best, (-score, distance, item_id))
+                    elif score < -best[0][0]:
+                        heapq.heapreplace(best, (-score, distance, item_id))
+
+        for r in range(rings + 1):
+            if 8 * r > len(self._cells) - len(visited):
+                # Кольцо длиннее, чем осталось непустых ячеек: дешевле пройти по ним
+                for cell in list(self._cells):
+                    if cell not in visited:
+                        visit(cell)
+                break
+
+            for i, j in self._ring(ci, cj, r):
+                cell = (i, (j - first_column) % columns + first_column)
+                if cell not in visited:
+                    visited.add(cell)
+                    visit(cell)
+
+            # Точки за кольцом r дальше r ячеек по широте или по долготе
+            bound = self._ring_bound(lat, r)
+            if bound > radius_km or (len(best) == k and bound / max_weight >= -best[0][0]):
+                break
+
+        best.sort(key=lambda item: (-item[0], item[1]))
+        return [(item_id, distance) for _, distance, item_id in best]
+
+    @staticmethod
+    def _ring(ci, cj, r):
+        """Ячейки на расстоянии ровно r ячеек (по Чебышеву) от (ci, cj)"""
+        if r == 0:
+            yield ci, cj
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield ci - r, j
+            yield ci + r, j
+        for i in range(ci - r + 1, ci + r):
+            yield i, cj - r
+            yield i, cj + r
+
+    def _cell_bound(self, lat, lng, cell):
+        """Нижняя граница расстояния (км) от точки до ячейки"""
+        size = self.cell_size
+        low = cell[0] * size
+        lat_gap = max(low - lat, lat - (low + size), 0.0)
+        west = cell[1] * size
+        lng_gap = 0.0
+        if not west <= lng < west + size:
+            lng_gap = min((west - lng) % 360, (lng - west - size) % 360)
+        max_lat = min(90.0, max(abs(lat), abs(low), abs(low + size)))
+        ratio = math.cos(math.radians(max_lat)) * math.sin(math.radians(min(lng_gap, 180.0)) / 2)
+        by_lng = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, ratio))
+        return max(lat_gap * KM_PER_DEGREE, by_lng)
+
+    def _ring_bound(self, lat, r):
+        """Нижняя граница расстояния (км) до точек вне колец 0..r"""
+        offset = math.radians(r * self.cell_size)
+        by_lat = EARTH_RADIUS_KM * offset
+        # При разнице широт меньше r ячеек точка не ближе к полюсу, чем
+        # на r + 1 ячейку от запроса: cos широты не меньше этого
+        max_lat = min(90.0, abs(lat) + (r + 1) * self.cell_size)
+        ratio = math.cos(math.radians(max_lat)) * math.sin(min(offset, math.pi) / 2)
+        by_lng = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, ratio))
+        return min(by_lat, by_lng)
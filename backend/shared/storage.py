@@ -0,0 +1,617 @@
+# backend/shared/storage.py
+"""Хранилища тренировок, общие для нескольких процессов: SQLite (WAL) и Redis.
+
+Интерфейс тот же, что у ChangeLog: load / append / append_many / compact /
+start_compactor / close, плюс poll - применение изменений, сделанных
+другими процессами. Записи журнала - операции create / join / request /
+remove из flask_app; они идемпотентны, поэтому повторное применение безопасно.
+"""
+import itertools
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Шаг сетки для колонок cell_i / cell_j (как у GridIndex по умолчанию)
+CELL_SIZE = 0.05
+# Сколько секунд хранится лента изменений для отстающих процессов
+CHANGE_RETENTION = 3600
+# Сколько изменений poll применяет за один запрос к хранилищу
+POLL_BATCH = 1000
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trainings (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    sport TEXT,
+    lat REAL NOT NULL,
+    lng REAL NOT NULL,
+    cell_i INTEGER NOT NULL,
+    cell_j INTEGER NOT NULL,
+    expires_at REAL,
+    is_premium INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS trainings_sport ON trainings (sport);
+CREATE INDEX IF NOT EXISTS trainings_expires_at ON trainings (expires_at);
+CREATE INDEX IF NOT EXISTS trainings_cell ON trainings (cell_i, cell_j);
+
+CREATE TABLE IF NOT EXISTS participants (
+    training_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    joined_at TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (training_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS join_requests (
+    id TEXT PRIMARY KEY,
+    training_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS join_requests_training ON join_requests (training_id);
+
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    worker TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_created_at ON changes (created_at);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+
+CREATE TABLE IF NOT EXISTS worker_leases (
+    worker INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+INSERT_TRAINING = (
+    "INSERT OR REPLACE INTO trainings (id, data, sport, lat, lng, cell_i, cell_j, expires_at, is_premium) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_PARTICIPANT = (
+    "INSERT OR IGNORE INTO participants (training_id, user_id, joined_at, data) VALUES (?, ?, ?, ?)"
+)
+DELETE_TRAINING = "DELETE FROM trainings WHERE id = ?"
+DELETE_PARTICIPANTS = "DELETE FROM participants WHERE training_id = ?"
+INSERT_REQUEST = "INSERT OR IGNORE INTO join_requests (id, training_id, data) VALUES (?, ?, ?)"
+DELETE_REQUESTS = "DELETE FROM join_requests WHERE training_id = ?"
+INSERT_CHANGE = "INSERT INTO changes (worker, created_at, record) VALUES (?, ?, ?)"
+SELECT_CHANGES = "SELECT seq, worker, record FROM changes WHERE seq > ? ORDER BY seq LIMIT ?"
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _training_row(training):
+    lat = float(training['lat'])
+    lng = float(training['lng'])
+    return (
+        training['id'], _dumps(training), training.get('sport'), lat, lng,
+        math.floor(lat / CELL_SIZE), math.floor(lng / CELL_SIZE),
+        training.get('expires_at'), 1 if training.get('is_premium') else 0,
+    )
+
+
+def _participant_row(training_id, participant):
+    return (training_id, str(participant['user_id']), participant.get('joined_at'), _dumps(participant))
+
+
+def _request_row(join_request):
+    return (join_request['request_id'], join_request['id'], _dumps(join_request))
+
+
+class _Compactor:
+    """Фоновый поток, раз в interval секунд вызывающий compact"""
+
+    def __init__(self):
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start_compactor(self, get_snapshot, interval=60):
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stopped.wait(interval):
+                try:
+                    self.compact(get_snapshot)
+                except Exception as e:
+                    logger.error(f"Error compacting storage: {str(e)}")
+
+        self._thread = threading.Thread(target=run, name='storage-compactor', daemon=True)
+        self._thread.start()
+
+    def _stop_compactor(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class SQLiteStorage(_Compactor):
+    """Таблицы trainings / participants в SQLite (WAL) + лента изменений.
+
+    Несколько процессов открывают один файл: записи сериализует SQLite,
+    а каждый процесс подтягивает чужие изменения из таблицы changes по
+    возрастанию seq. Соединение одно на поток и процесс (после fork
+    открывается заново), SQL-тексты постоянные, поэтому подготовленные
+    выражения берутся из кэша соединения.
+    """
+
+    def __init__(self, path, state_lock=None, retention=CHANGE_RETENTION):
+        super().__init__()
+        self.path = path
+        self.retention = retention
+        self.state_lock = state_lock or threading.RLock()
+        self._token = uuid.uuid4().hex[:8]
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        self._last_seq = 0
+        self._import_pending = False
+
+        self._connection().executescript(SQLITE_SCHEMA)
+
+    @property
+    def worker(self):
+        """Имя процесса в ленте изменений (свои записи poll пропускает)"""
+        return f"{self._token}:{os.getpid()}"
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, conn, body, immediate=True):
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            result = body(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _meta(self, conn, key, default=None):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _read_state(self, conn):
+        if self._meta(conn, 'initialized') is None:
+            return None, 0
+
+        last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        trimmed = self._meta(conn, 'trimmed_seq', 0)
+        trainings = {
+            training_id: json.loads(data)
+            for training_id, data in conn.execute("SELECT id, data FROM trainings")
+        }
+        participants = {}
+        for training_id, data in conn.execute("SELECT training_id, data FROM participants ORDER BY rowid"):
+            participants.setdefault(training_id, []).append(json.loads(data))
+        requests = [json.loads(data) for data, in conn.execute("SELECT data FROM join_requests ORDER BY id")]
+        return {"trainings": trainings, "participants": participants, "requests": requests}, max(last_seq, trimmed)
+
+    def load(self, restore, apply):
+        """Восстановить состояние из таблиц. True, если база новая:
+        тогда restore(None) выполняет миграцию, а compact() ее сохранит.
+        """
+        conn = self._connection()
+        # Чтение в одной транзакции - согласованный срез таблиц и ленты
+        snapshot, last_seq = self._transaction(conn, self._read_state, immediate=False)
+        with self.state_lock:
+            restore(snapshot)
+            self._last_seq = last_seq
+        self._import_pending = snapshot is None
+        return snapshot is None
+
+    def _apply_sql(self, conn, records):
+        # Подряд идущие операции одного типа - одним executemany
+        for op, group in itertools.groupby(records, key=lambda record: record['op']):
+            group = list(group)
+            if op == 'create':
+                conn.executemany(INSERT_TRAINING, [_training_row(r['training']) for r in group])
+            elif op == 'join':
+                conn.executemany(INSERT_PARTICIPANT, [_participant_row(r['id'], r['participant']) for r in group])
+            elif op == 'request':
+                conn.executemany(INSERT_REQUEST, [_request_row(r['request']) for r in group])
+            elif op == 'remove':
+                ids = [(r['id'],) for r in group]
+                conn.executemany(DELETE_TRAINING, ids)
+                conn.executemany(DELETE_PARTICIPANTS, ids)
+                conn.executemany(DELETE_REQUESTS, ids)
+            else:
+                logger.warning(f"Unknown storage operation: {op}")
+
+    def append(self, op, **fields):
+        self.append_many([dict(fields, op=op)])
+
+    def append_many(self, records):
+        """Записать изменения и ленту одной транзакцией"""
+        if not records:
+            return
+        worker = self.worker
+        now = time.time()
+
+        def write(conn):
+            self._apply_sql(conn, records)
+            conn.executemany(INSERT_CHANGE, [(worker, now, _dumps(record)) for record in records])
+
+        self._transaction(self._connection(), write)
+
+    def poll(self, restore, apply):
+        """Применить изменения других процессов; возвращает их число.
+
+        Если процесс отстал дальше, чем хранится лента, состояние
+        перечитывается целиком.
+        """
+        with self._sync_lock:
+            conn = self._connection()
+            if self._meta(conn, 'trimmed_seq', 0) > self._last_seq:
+                logger.warning("Change feed was trimmed past this worker, reloading storage")
+                self.load(restore, apply)
+                return 0
+
+            applied = 0
+            worker = self.worker
+            while True:
+                rows = conn.execute(SELECT_CHANGES, (self._last_seq, POLL_BATCH)).fetchall()
+                if not rows:
+                    return applied
+                with self.state_lock:
+                    for seq, record_worker, record in rows:
+                        if record_worker != worker:
+                            apply(json.loads(record))
+                            applied += 1
+                        self._last_seq = seq
+                if len(rows) < POLL_BATCH:
+                    return applied
+
+    def lease_worker(self, worker, ttl, limit):
+        """Номер процесса из range(limit), не занятый другими живыми процессами.
+
+        Продлевает аренду worker, если она все еще у этого процесса, иначе
+        берет свободный номер (прежний, если он свободен) на ttl секунд.
+        Аренды истекают сами: номер упавшего процесса освобождается.
+        """
+        owner = self.worker
+
+        def take(conn):
+            now = time.time()
+            conn.execute("DELETE FROM worker_leases WHERE expires_at < ?", (now,))
+            if worker is not None and conn.execute(
+                    "UPDATE worker_leases SET expires_at = ? WHERE worker = ? AND owner = ?",
+                    (now + ttl, worker, owner)).rowcount:
+                return worker
+            conn.execute("DELETE FROM worker_leases WHERE owner = ?", (owner,))
+            taken = {row[0] for row in conn.execute("SELECT worker FROM worker_leases")}
+            free = worker if worker is not None and worker not in taken else \
+                next((n for n in range(limit) if n not in taken), None)
+            if free is None:
+                raise RuntimeError(f"All {limit} worker ids are leased")
+            conn.execute("INSERT INTO worker_leases (worker, owner, expires_at) VALUES (?, ?, ?)",
+                         (free, owner, now + ttl))
+            return free
+
+        return self._transaction(self._connection(), take)
+
+    def compact(self, get_snapshot):
+        """Обрезать старую ленту изменений и давно истекшие тренировки.
+
+        Таблицы всегда актуальны, снапшот нужен только один раз - при
+        миграции в новую базу.
+        """
+        conn = self._connection()
+        cutoff = time.time() - self.retention
+
+        if self._import_pending:
+            with self.state_lock:
+                snapshot = get_snapshot()
+                trainings = [_training_row(t) for t in snapshot.get("trainings", {}).values()]
+                participants = [
+                    _participant_row(training_id, participant)
+                    for training_id, items in snapshot.get("participants", {}).items()
+                    for participant in items
+                ]
+                requests = [_request_row(join_request) for join_request in snapshot.get("requests", ())]
+
+            def import_snapshot(conn):
+                conn.executemany(INSERT_TRAINING, trainings)
+                conn.executemany(INSERT_PARTICIPANT, participants)
+                conn.executemany(INSERT_REQUEST, requests)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('initialized', 1)")
+
+            self._transaction(conn, import_snapshot)
+            self._import_pending = False
+
+        def trim(conn):
+            row = conn.execute("SELECT MAX(seq) FROM changes WHERE created_at < ?", (cutoff,)).fetchone()
+            if row[0] is not None:
+                conn.execute("DELETE FROM changes WHERE seq <= ?", (row[0],))
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('trimmed_seq', ?)", (row[0],))
+            # Страховка на случай, когда тренировка истекла без работающих процессов
+            expired = [row for row in conn.execute(
+                "SELECT id FROM trainings WHERE expires_at < ?", (cutoff,))]
+            conn.executemany(DELETE_TRAINING, expired)
+            conn.executemany(DELETE_PARTICIPANTS, expired)
+            conn.executemany(DELETE_REQUESTS, expired)
+            conn.executemany(INSERT_CHANGE, [
+                (self.worker, time.time(), _dumps({"op": "remove", "id": training_id}))
+                for training_id, in expired
+            ])
+            return len(expired)
+
+        purged = self._transaction(conn, trim)
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        if purged:
+            logger.info(f"Purged {purged} expired trainings from {self.path}")
+
+    def close(self):
+        self._stop_compactor()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            # Номер процесса свободен сразу, а не после истечения аренды
+            conn.execute("DELETE FROM worker_leases WHERE owner = ?", (self.worker,))
+            conn.close()
+        self._local.conn = None
+
+
+class RedisStorage(_Compactor):
+    """Те же данные в Redis: хэши тренировок и участников, Redis Stream как
+    лента изменений, zset по времени удаления, GEO-набор и наборы по виду спорта.
+
+    client - redis.Redis или совместимый с ним объект (например,
+    fakeredis.FakeRedis как локальная замена сервера).
+    """
+
+    def __init__(self, client, prefix='sportevents:', state_lock=None, retention=CHANGE_RETENTION):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self.retention = retention
+        self.state_lock = state_lock or threading.RLock()
+        self._token = uuid.uuid4().hex[:8]
+        self._sync_lock = threading.Lock()
+        self._last_id = '0-0'
+        self._import_pending = False
+        self._leased = None  # (pid, номер процесса) последней аренды
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        import redis
+
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    @property
+    def worker(self):
+        return f"{self._token}:{os.getpid()}"
+
+    def _key(self, *parts):
+        return self.prefix + ':'.join(parts)
+
+    def load(self, restore, apply):
+        """Восстановить состояние. True, если данных еще нет (миграция через compact)"""
+        client = self.client
+        # Позиция ленты берется до чтения данных: изменения, попавшие между
+        # ними, применятся повторно в poll, что для идемпотентных записей безопасно
+        last = client.xrevrange(self._key('changes'), count=1)
+        last_id = last[0][0] if last else b'0-0'
+
+        if not client.exists(self._key('initialized')):
+            with self.state_lock:
+                restore(None)
+                self._last_id = last_id
+            self._import_pending = True
+            return True
+
+        trainings = {
+            training_id.decode(): json.loads(data)
+            for training_id, data in client.hgetall(self._key('trainings')).items()
+        }
+        participants = {}
+        for training_id in trainings:
+            items = [json.loads(data) for data in client.hvals(self._key('participants', training_id))]
+            if items:
+                items.sort(key=lambda participant: participant.get('joined_at') or '')
+                participants[training_id] = items
+        requests = [
+            json.loads(data)
+            for training_id in trainings
+            for data in client.hvals(self._key('requests', training_id))
+        ]
+        requests.sort(key=lambda join_request: join_request['request_id'])
+
+        with self.state_lock:
+            restore({"trainings": trainings, "participants": participants, "requests": requests})
+            self._last_id = last_id
+        self._import_pending = False
+        return False
+
+    def _queue(self, pipe, record):
+        op = record['op']
+        if op == 'create':
+            training = record['training']
+            training_id = training['id']
+            pipe.hset(self._key('trainings'), training_id, _dumps(training))
+            pipe.geoadd(self._key('geo'), (float(training['lng']), float(training['lat']), training_id))
+            pipe.sadd(self._key('sport', training.get('sport') or ''), training_id)
+            if training.get('expires_at') is not None:
+                pipe.zadd(self._key('expiry'), {training_id: training['expires_at']})
+        elif op == 'join':
+            participant = record['participant']
+            pipe.hsetnx(self._key('participants', record['id']), str(participant['user_id']), _dumps(participant))
+        elif op == 'request':
+            join_request = record['request']
+            pipe.hsetnx(self._key('requests', record['id']), join_request['request_id'], _dumps(join_request))
+        elif op == 'remove':
+            self._queue_remove(pipe, record['id'])
+        else:
+            logger.warning(f"Unknown storage operation: {op}")
+
+    def _queue_remove(self, pipe, training_id, sport=None):
+        pipe.hdel(self._key('trainings'), training_id)
+        pipe.delete(self._key('participants', training_id))
+        pipe.delete(self._key('requests', training_id))
+        pipe.zrem(self._key('geo'), training_id)
+        pipe.zrem(self._key('expiry'), training_id)
+        if sport is not None:
+            pipe.srem(self._key('sport', sport), training_id)
+
+    def append(self, op, **fields):
+        self.append_many([dict(fields, op=op)])
+
+    def append_many(self, records):
+        """Изменения и лента - одной транзакцией MULTI/EXEC за один проход по сети"""
+        if not records:
+            return
+        worker = self.worker
+        pipe = self.client.pipeline(transaction=True)
+        for record in records:
+            if record['op'] == 'remove':
+                # Вид спорта нужен, чтобы убрать id из набора по спорту
+                raw = self.client.hget(self._key('trainings'), record['id'])
+                sport = (json.loads(raw).get('sport') or '') if raw else None
+                self._queue_remove(pipe, record['id'], sport)
+            else:
+                self._queue(pipe, record)
+            pipe.xadd(self._key('changes'), {'worker': worker, 'record': _dumps(record)})
+        pipe.execute()
+
+    def _renew_lease(self, key, owner, ttl_ms):
+        """Продлить аренду key, если ее владелец - owner"""
+        import redis
+
+        with self.client.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != owner.encode():
+                    return False
+                pipe.multi()
+                pipe.pexpire(key, ttl_ms)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def lease_worker(self, worker, ttl, limit):
+        """Номер процесса из range(limit), как у SQLiteStorage.lease_worker:
+        ключ worker:<номер> с владельцем и сроком, SET NX занимает свободный"""
+        owner = self.worker
+        ttl_ms = int(ttl * 1000)
+        if worker is not None and self._renew_lease(self._key('worker', str(worker)), owner, ttl_ms):
+            return worker
+        self._release_lease()
+        candidates = range(limit) if worker is None else itertools.chain((worker,), range(limit))
+        for candidate in candidates:
+            if self.client.set(self._key('worker', str(candidate)), owner, nx=True, px=ttl_ms):
+                self._leased = (os.getpid(), candidate)
+                return candidate
+        raise RuntimeError(f"All {limit} worker ids are leased")
+
+    @staticmethod
+    def _stream_id(value):
+        if isinstance(value, bytes):
+            value = value.decode()
+        ms, _, seq = value.partition('-')
+        return int(ms), int(seq or 0)
+
+    def poll(self, restore, apply):
+        """Применить изменения других процессов; возвращает их число"""
+        with self._sync_lock:
+            key = self._key('changes')
+            trimmed = self.client.get(self._key('trimmed'))
+            if trimmed and self._stream_id(trimmed) > self._stream_id(self._last_id):
+                # Непрочитанные записи уже вырезаны XTRIM
+                logger.warning("Change stream was trimmed past this worker, reloading storage")
+                self.load(restore, apply)
+                return 0
+
+            applied = 0
+            worker = self.worker.encode()
+            while True:
+                response = self.client.xread({key: self._last_id}, count=POLL_BATCH)
+                entries = response[0][1] if response else []
+                if not entries:
+                    return applied
+                with self.state_lock:
+                    for entry_id, fields in entries:
+                        if fields[b'worker'] != worker:
+                            apply(json.loads(fields[b'record']))
+                            applied += 1
+                        self._last_id = entry_id
+                if len(entries) < POLL_BATCH:
+                    return applied
+
+    def compact(self, get_snapshot):
+        """Обрезать ленту старше retention и давно истекшие тренировки"""
+        cutoff = time.time() - self.retention
+
+        if self._import_pending:
+            with self.state_lock:
+                snapshot = get_snapshot()
+                records = [{"op": "create", "training": t} for t in snapshot.get("trainings", {}).values()]
+                records += [
+                    {"op": "join", "id": training_id, "participant": participant}
+                    for training_id, items in snapshot.get("participants", {}).items()
+                    for participant in items
+                ]
+                records += [
+                    {"op": "request", "id": join_request['id'], "request": join_request}
+                    for join_request in snapshot.get("requests", ())
+                ]
+            pipe = self.client.pipeline(transaction=True)
+            for record in records:
+                self._queue(pipe, record)
+            pipe.set(self._key('initialized'), 1)
+            pipe.execute()
+            self._import_pending = False
+
+        # Запоминаем последнюю вырезаемую запись: отставшие процессы перечитают данные
+        minid = f"{int(cutoff * 1000)}-0"
+        last_trimmed = self.client.xrevrange(self._key('changes'), max=f"({minid}", count=1)
+        if last_trimmed:
+            self.client.set(self._key('trimmed'), last_trimmed[0][0])
+            self.client.xtrim(self._key('changes'), minid=minid, approximate=False)
+        expired = self.client.zrangebyscore(self._key('expiry'), '-inf', cutoff)
+        if expired:
+            self.append_many([{"op": "remove", "id": training_id.decode()} for training_id in expired])
+            logger.info(f"Purged {len(expired)} expired trainings from Redis")
+
+    def close(self):
+        self._stop_compactor()
+        self._release_lease()
+
+    def _release_lease(self):
+        """Освободить номер, арендованный этим процессом"""
+        if self._leased is not None and self._leased[0] == os.getpid():
+            key = self._key('worker', str(self._leased[1]))
+            if self.client.get(key) == self.worker.encode():
+                self.client.delete(key)
+        self._leased = None
+
+
+def open_storage(url, state_lock=None):
+    """Хранилище по URL: sqlite:///path/to.db или redis://host:6379/0"""
+    if url.startswith('sqlite:///'):
+        return SQLiteStorage(url[len('sqlite:///'):], state_lock=state_lock)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStorage.from_url(url, state_lock=state_lock)
+    raise ValueError(f"Unsupported storage URL: {url}")
@@ -0,0 +1,331 @@
+# backend/shared/wal.py
+"""Журнал изменений (append-only) со снапшотами и фоновой компакцией"""
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _fsync_dir(path):
+    """fsync каталога, чтобы переименование файла пережило сбой питания"""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _current_umask():
+    # Узнать umask можно только сменив его: читается один раз при импорте,
+    # а не при каждой записи, пока другие потоки создают файлы
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _current_umask()
+
+
+def _file_mode(path):
+    """Права для новой версии path: как у текущего файла, без него - как
+    у open() (0o666 без umask). mkstemp создает файл с 0o600"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write(path, data):
+    """Атомарная запись файла: временный файл + fsync + os.replace.
+
+    Имя временного файла уникально: несколько процессов, пишущих один
+    path, не пишут в общий файл, и побеждает целиком одна из версий.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix='.tmp')
+    try:
+        os.fchmod(fd, _file_mode(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(path)
+
+
+class ChangeLog:
+    """Журнал изменений: снапшот + JSON-строки, по одной записи на изменение.
+
+    Каждая запись дописывается в конец лога, поэтому стоимость записи
+    не зависит от объема данных. Компакция переносит накопленные записи
+    в снапшот. Записи должны быть идемпотентными: после сбоя посреди
+    компакции часть лога может быть применена повторно.
+    """
+
+    def __init__(self, snapshot_path, log_path, fsync=True, compact_threshold=1000, state_lock=None):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.rotated_path = f"{log_path}.1"
+        self.fsync = fsync
+        self.compact_threshold = compact_threshold
+
+        # Блокировка состояния владельца: при компакции берется раньше
+        # блокировки лога, в том же порядке, что и при записи изменений
+        self.state_lock = state_lock or threading.RLock()
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._file = None
+        self._pending = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._compactor = None
+
+    def load(self, restore, apply):
+        """Восстановление состояния: restore(snapshot), затем apply(record)
+        для каждой записи лога. snapshot равен None, если его еще нет;
+        тогда возвращается True и снапшот стоит записать через compact().
+        """
+        snapshot = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        restore(snapshot)
+
+        # Сначала ротированный лог (незавершенная компакция), затем текущий
+        for path in (self.rotated_path, self.log_path):
+            self._pending += self._replay(path, apply)
+        return snapshot is None
+
+    def poll(self, restore, apply):
+        """Журнал принадлежит одному процессу: чужих изменений не бывает"""
+        return 0
+
+    def _replay(self, path, apply):
+        if not os.path.exists(path):
+            return 0
+
+        count = 0
+        good_offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Недописанная запись: процесс упал посреди append
+                    logger.warning(f"Truncated record at end of {path}, ignoring")
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Corrupted record at end of {path}, ignoring")
+                    break
+                apply(record)
+                good_offset += len(line)
+                count += 1
+
+        # Отрезаем хвост, чтобы новые записи не склеились с битой строкой
+        if good_offset != os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+
+        return count
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.log_path, 'ab')
+        return self._file
+
+    def append(self, op, **fields):
+        """Дописать одну запись в лог"""
+        self.append_many([dict(fields, op=op)])
+
+    def append_many(self, records):
+        """Дописать несколько записей одной операцией записи на диск"""
+        if not records:
+            return
+        data = b''.join(
+            json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+            for record in records
+        )
+        with self._lock:
+            f = self._open()
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            self._pending += len(records)
+            pending = self._pending
+
+        if pending >= self.compact_threshold:
+            self._wakeup.set()
+
+    def compact(self, get_snapshot):
+        """Записать снапшот и освободить лог.
+
+        get_snapshot() вызывается под state_lock и блокировкой лога.
+        Запись снапшота на диск идет уже без блокировок: новые записи
+        тем временем попадают в свежий лог.
+        """
+        with self._compact_lock:
+            with self.state_lock, self._lock:
+                data = json.dumps(get_snapshot(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                if os.path.exists(self.log_path):
+                    if os.path.exists(self.rotated_path):
+                        # Остался лог прошлой компакции: склеиваем, порядок сохраняется
+                        with open(self.rotated_path, 'ab') as dst, open(self.log_path, 'rb') as src:
+                            dst.write(src.read())
+                        os.remove(self.log_path)
+                    else:
+                        os.replace(self.log_path, self.rotated_path)
+                self._pending = 0
+
+            atomic_write(self.snapshot_path, data)
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+
+        logger.info(f"Change log compacted into {self.snapshot_path}")
+
+    def start_compactor(self, get_snapshot, interval=60):
+        """Фоновая компакция: раз в interval секунд или по порогу записей"""
+        if self._compactor is not None:
+            return
+
+        def run():
+            while not self._stopped.is_set():
+                self._wakeup.wait(interval)
+                self._wakeup.clear()
+                if self._stopped.is_set():
+                    break
+                if self._pending == 0:
+                    continue
+                try:
+                    self.compact(get_snapshot)
+                except Exception as e:
+                    logger.error(f"Error compacting change log: {str(e)}")
+
+        self._compactor = threading.Thread(target=run, name='changelog-compactor', daemon=True)
+        self._compactor.start()
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CommitTicket:
+    """Записи, поставленные в очередь GroupCommit; wait() - до записи на диск"""
+
+    __slots__ = ('records', 'done', 'error', '_committer')
+
+    def __init__(self, committer, records):
+        self.records = records
+        self.done = threading.Event()
+        self.error = None
+        self._committer = committer
+
+    def wait(self):
+        if not self.done.is_set():
+            self._committer._flush_or_wait(self)
+        if self.error is not None:
+            raise self.error
+
+
+class GroupCommit:
+    """Групповая запись в журнал: одновременные писатели - одна запись на диск.
+
+    submit() только ставит записи в очередь, поэтому его можно вызывать
+    под блокировкой состояния: порядок в журнале совпадает с порядком
+    применения изменений. wait() вызывается уже без блокировки. Первый
+    ожидающий ждет window секунд, собирает очередь целиком и пишет ее
+    одним append_many (один fsync / одна транзакция), остальные ждут его.
+    """
+
+    def __init__(self, storage, window=0.002):
+        self.storage = storage
+        self.window = window
+        self._lock = threading.Lock()
+        self._queue = []
+        self._flushing = False
+        self.flushes = 0
+        self.records = 0
+
+    def submit(self, records):
+        ticket = CommitTicket(self, records)
+        if not records:
+            ticket.done.set()
+            return ticket
+        with self._lock:
+            self._queue.append(ticket)
+        return ticket
+
+    def append_many(self, records):
+        """Записать и дождаться записи на диск"""
+        self.submit(records).wait()
+
+    def append(self, op, **fields):
+        self.append_many([dict(fields, op=op)])
+
+    def _flush_or_wait(self, ticket):
+        with self._lock:
+            leader = not self._flushing
+            if leader:
+                self._flushing = True
+
+        if not leader:
+            ticket.done.wait()
+            return
+
+        try:
+            if self.window:
+                time.sleep(self.window)
+            # Пишем, пока очередь не опустеет: пришедшие во время записи
+            # не ждут следующего лидера
+            while True:
+                with self._lock:
+                    batch, self._queue = self._queue, []
+                    if not batch:
+                        self._flushing = False
+                        break
+                self._write(batch)
+        except BaseException:
+            with self._lock:
+                self._flushing = False
+            raise
+
+    def _write(self, batch):
+        records = [record for ticket in batch for record in ticket.records]
+        error = None
+        try:
+            self.storage.append_many(records)
+        except Exception as e:
+            logger.error(f"Group commit of {len(records)} records failed: {str(e)}")
+            error = e
+        self.flushes += 1
+        self.records += len(records)
+        for ticket in batch:
+            ticket.error = error
+            ticket.done.set()
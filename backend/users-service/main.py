@@ -1,16 +1,27 @@
 # backend/users-service/main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
 import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from shared.metrics import PROMETHEUS_CONTENT_TYPE, from_env as metrics_from_env
+from shared.pubsub import AsyncSubscription, ViewportHub, format_sse
+from presence import PresenceStore, sport_key
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Users Service")
 
+# Замеры запросов и участков; METRICS_ENABLED=0 выключает
+metrics = metrics_from_env('users-service')
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -18,7 +29,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-users_storage = {}
+
+if metrics.enabled:
+    @app.middleware("http")
+    async def time_requests(request: Request, call_next):
+        timer = metrics.begin(request.method)
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            # Шаблон маршрута, а не путь: параметры не плодят метки
+            route = request.scope.get('route')
+            metrics.finish(timer, status, route.path if route is not None else 'unmatched')
+
+
+USER_TTL = 7200  # 2 часа без обновлений - пользователь не в сети
+MAX_BATCH_SIZE = 1000  # элементов в одном пакетном запросе
+STREAM_HEARTBEAT = 15  # секунд между keep-alive комментариями в потоке
+MAX_MATCHES = 100  # напарников в одном ответе /api/users/matches
+MAX_MATCH_RADIUS = 500  # км
+
+# Подписчики потока перемещений пользователей
+presence_hub = ViewportHub()
+
+
+def user_payload(user):
+    return {
+        "id": user.user_id,
+        "name": user.username or f"User_{user.user_id}",
+        "lat": user.lat,
+        "lng": user.lng,
+        "comment": user.comment,
+        "sports": list(user.sports)
+    }
+
+
+def on_user_evicted(user):
+    presence_hub.publish_move("user", (user.lat, user.lng), None, user.sports, {"id": user.user_id})
+
+
+users_storage = PresenceStore(ttl=USER_TTL, on_evict=on_user_evicted)
 
 
 class UserLocation(BaseModel):
@@ -30,6 +82,10 @@ class UserLocation(BaseModel):
     sports: Optional[List[str]] = None
 
 
+class UserLocationBatch(BaseModel):
+    locations: List[UserLocation]
+
+
 @app.get("/")
 async def root():
     return {"message": "Users Service is running"}
@@ -37,49 +93,113 @@ async def root():
 
 @app.post("/api/users/location")
 async def update_user_location(location: UserLocation):
-    users_storage[location.user_id] = {
-        "user_id": location.user_id,
-        "username": location.username,
-        "lat": location.lat,
-        "lng": location.lng,
-        "comment": location.comment,
-        "sports": location.sports or [],
-        "last_seen": datetime.now().isoformat(),
-        "is_visible": True
-    }
+    apply_location(location)
     return {"status": "success", "message": "Location updated"}
 
 
+@app.post("/api/users/locations:batch")
+async def update_user_locations(batch: UserLocationBatch):
+    """Несколько обновлений за один запрос; модель проверяет весь пакет
+    до применения, поэтому при ошибке не применяется ничего"""
+    if not batch.locations or len(batch.locations) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch must contain 1 to {MAX_BATCH_SIZE} locations")
+
+    for location in batch.locations:
+        apply_location(location)
+    return {"status": "success", "message": f"Updated {len(batch.locations)} locations"}
+
+
+def apply_location(location):
+    previous = users_storage.get(location.user_id)
+    old_position = (previous.lat, previous.lng) if previous is not None else None
+
+    with metrics.span('update'):
+        user = users_storage.touch(
+            location.user_id,
+            location.username,
+            location.lat,
+            location.lng,
+            comment=location.comment,
+            sports=location.sports or [],
+        )
+    with metrics.span('publish'):
+        presence_hub.publish_move("user", old_position, (user.lat, user.lng), user.sports, user_payload(user))
+
+
 @app.get("/api/users/nearby")
 async def get_nearby_users(lat: float, lng: float, radius: int = 10):
     nearby_users = []
 
-    for user_id, user_data in users_storage.items():
-        last_seen = datetime.fromisoformat(user_data["last_seen"])
-        time_diff = datetime.now() - last_seen
-        if time_diff.total_seconds() > 7200:  # 2 часа
-            continue
-
-        if not user_data.get("is_visible", True):
-            continue
-
-        distance = calculate_distance(lat, lng, user_data["lat"], user_data["lng"])
-        if distance <= radius:
-            nearby_users.append({
-                "id": user_data["user_id"],
-                "name": user_data["username"] or f"User_{user_data['user_id']}",
-                "lat": user_data["lat"],
-                "lng": user_data["lng"],
-                "comment": user_data["comment"],
-                "sports": user_data["sports"],
-                "distance": round(distance, 2)
-            })
+    with metrics.span('filter'):
+        for user, distance in users_storage.nearby(lat, lng, radius):
+            nearby_users.append(dict(user_payload(user), distance=round(distance, 2)))
 
     return nearby_users
 
 
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    return ((lat1 - lat2) ** 2 + (lon1 - lon2) ** 2) ** 0.5 * 111
+@app.get("/api/users/matches")
+async def get_matches(lat: Optional[float] = None, lng: Optional[float] = None, user_id: Optional[int] = None,
+                      sport: Optional[List[str]] = Query(None), k: int = 10, radius: float = 50):
+    """Лучшие k напарников: ближе и с большим числом общих видов спорта.
+
+    sport можно повторять; без него берутся виды спорта и, если не заданы
+    lat / lng, координаты пользователя user_id. Сам user_id в ответ не
+    попадает.
+    """
+    if not 1 <= k <= MAX_MATCHES:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_MATCHES}")
+    if not 0 < radius <= MAX_MATCH_RADIUS:
+        raise HTTPException(status_code=400, detail=f"radius must be between 0 and {MAX_MATCH_RADIUS} km")
+
+    me = users_storage.get(user_id) if user_id is not None else None
+    if lat is None or lng is None:
+        if me is None:
+            raise HTTPException(status_code=400, detail="lat and lng are required for an unknown user")
+        lat, lng = me.lat, me.lng
+    sports = sport if sport else (me.sports if me is not None else ())
+    wanted = {sport_key(name) for name in sports}
+
+    matches = []
+    with metrics.span('filter'):
+        for user, distance, shared in users_storage.matches(lat, lng, sports, k, radius, exclude=user_id):
+            matches.append(dict(
+                user_payload(user),
+                distance=round(distance, 2),
+                shared_sports=[name for name in user.sports if sport_key(name) in wanted] if shared else [],
+            ))
+
+    return matches
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Гистограммы запросов и участков в формате Prometheus"""
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/metrics/profile")
+async def get_profile():
+    """Свернутые стеки самых медленных запросов (PROFILE_SLOW_REQUESTS)"""
+    return Response(metrics.render_profile(), media_type="text/plain")
+
+
+@app.get("/api/users/stream")
+async def stream_nearby_users(request: Request, lat: float, lng: float, radius: float = 10, sport: str = None):
+    """Поток изменений присутствия в области (Server-Sent Events):
+    user_entered / user_moved / user_left"""
+    subscription = presence_hub.subscribe(AsyncSubscription(lat, lng, radius, sport))
+
+    async def generate():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                message = await subscription.get(timeout=STREAM_HEARTBEAT)
+                yield format_sse(message) if message else ": ping\n\n"
+        finally:
+            presence_hub.unsubscribe(subscription)
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 if __name__ == "__main__":
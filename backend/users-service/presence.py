@@ -0,0 +1,223 @@
+# backend/users-service/presence.py
+"""Хранилище присутствия пользователей с вытеснением по TTL"""
+import time
+
+from shared.spatial import GridIndex
+
+# Сколько разных видов спорта получают свой бит; остальные не участвуют в подборе
+MAX_SPORTS = 1024
+# Градусов (~2 км): в плотном центре города в ячейке остаются сотни, а не
+# тысячи пользователей, и поиск k ближайших просматривает меньше точек
+CELL_SIZE = 0.02
+
+
+def sport_key(sport):
+    return (sport or '').strip().lower().replace('ё', 'е')
+
+
+class SportBits:
+    """Вид спорта -> бит, набор видов -> маска (int).
+
+    Биты раздаются по мере появления видов спорта, поэтому пересечение
+    интересов двух пользователей - одно побитовое И, а число общих
+    видов - bit_count().
+    """
+
+    def __init__(self, limit=MAX_SPORTS):
+        self.limit = limit
+        self._bits = {}
+
+    def __len__(self):
+        return len(self._bits)
+
+    def mask(self, sports, assign=True):
+        """Маска набора видов; assign=False не заводит биты для новых видов"""
+        mask = 0
+        for sport in sports:
+            key = sport_key(sport)
+            bit = self._bits.get(key)
+            if bit is None:
+                if not assign or not key or len(self._bits) >= self.limit:
+                    continue
+                bit = self._bits[key] = 1 << len(self._bits)
+            mask |= bit
+        return mask
+
+
+class UserRecord:
+    """Компактная запись пользователя: слоты вместо dict, время - epoch"""
+
+    __slots__ = ('user_id', 'username', 'lat', 'lng', 'comment', 'sports', 'sports_mask',
+                 'last_seen', 'is_visible', 'bucket')
+
+    def __init__(self, user_id, username, lat, lng, comment, sports, last_seen, is_visible=True,
+                 sports_mask=0):
+        self.user_id = user_id
+        self.username = username
+        self.lat = lat
+        self.lng = lng
+        self.comment = comment
+        self.sports = sports
+        self.sports_mask = sports_mask
+        self.last_seen = last_seen
+        self.is_visible = is_visible
+        self.bucket = None
+
+
+class PresenceStore:
+    """Пользователи онлайн: записи, сетка координат и корзины по времени.
+
+    Пользователь лежит в корзине минуты своего последнего обновления.
+    Корзины старше ttl удаляются целиком вместе с записями и точками
+    в индексе, поэтому вытеснение стоит O(число вытесненных), а память
+    не растет от пользователей, которые давно ушли.
+    """
+
+    def __init__(self, ttl=7200, bucket_seconds=60, clock=time.time, on_evict=None):
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.bucket_seconds = bucket_seconds
+        self.clock = clock
+        self._records = {}
+        self._index = GridIndex(CELL_SIZE)
+        self.sport_bits = SportBits()
+        # номер корзины -> {user_id, ...}
+        self._buckets = {}
+        self._oldest_bucket = None
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, user_id):
+        return user_id in self._records
+
+    def get(self, user_id):
+        return self._records.get(user_id)
+
+    def touch(self, user_id, username, lat, lng, comment=None, sports=(), is_visible=True):
+        """Создать или обновить пользователя на месте"""
+        now = self.clock()
+        self.evict(now)
+
+        record = self._records.get(user_id)
+        sports = tuple(sports)
+        sports_mask = self.sport_bits.mask(sports)
+        if record is None:
+            record = UserRecord(user_id, username, lat, lng, comment, sports, now, is_visible, sports_mask)
+            self._records[user_id] = record
+        else:
+            record.username = username
+            record.lat = lat
+            record.lng = lng
+            record.comment = comment
+            record.sports = sports
+            record.sports_mask = sports_mask
+            record.last_seen = now
+            record.is_visible = is_visible
+
+        self._index.add(user_id, lat, lng)
+        self._rebucket(record, int(now // self.bucket_seconds))
+        return record
+
+    def _rebucket(self, record, bucket):
+        if record.bucket == bucket:
+            return
+        if record.bucket is not None:
+            members = self._buckets.get(record.bucket)
+            if members is not None:
+                members.discard(record.user_id)
+                if not members:
+                    del self._buckets[record.bucket]
+
+        record.bucket = bucket
+        self._buckets.setdefault(bucket, set()).add(record.user_id)
+        if self._oldest_bucket is None or bucket < self._oldest_bucket:
+            self._oldest_bucket = bucket
+
+    def remove(self, user_id):
+        record = self._records.pop(user_id, None)
+        if record is None:
+            return
+        self._index.remove(user_id)
+        members = self._buckets.get(record.bucket)
+        if members is not None:
+            members.discard(user_id)
+            if not members:
+                del self._buckets[record.bucket]
+
+    def evict(self, now=None):
+        """Удалить пользователей, не обновлявшихся дольше ttl. Возвращает их число"""
+        if self._oldest_bucket is None:
+            return 0
+        if now is None:
+            now = self.clock()
+
+        # Корзина целиком старше ttl, если истек ее последний момент
+        last_expired = int((now - self.ttl) // self.bucket_seconds) - 1
+        if last_expired < self._oldest_bucket:
+            return 0
+
+        evicted = 0
+        if last_expired - self._oldest_bucket > len(self._buckets):
+            # Долгий простой: быстрее пройти по существующим корзинам
+            expired = [bucket for bucket in self._buckets if bucket <= last_expired]
+        else:
+            expired = range(self._oldest_bucket, last_expired + 1)
+
+        for bucket in expired:
+            for user_id in self._buckets.pop(bucket, ()):
+                record = self._records.pop(user_id)
+                self._index.remove(user_id)
+                evicted += 1
+                if self.on_evict is not None:
+                    self.on_evict(record)
+
+        self._oldest_bucket = min(self._buckets) if self._buckets else None
+        return evicted
+
+    def nearby(self, lat, lng, radius_km):
+        """Список (record, distance) видимых пользователей в радиусе"""
+        now = self.clock()
+        self.evict(now)
+
+        result = []
+        for user_id, distance in self._index.nearby(lat, lng, radius_km):
+            record = self._records[user_id]
+            # Последняя, еще не вытесненная корзина может частично устареть
+            if now - record.last_seen > self.ttl or not record.is_visible:
+                continue
+            result.append((record, distance))
+        return result
+
+    def matches(self, lat, lng, sports=(), k=10, radius_km=50, exclude=None):
+        """Лучшие k напарников: [(record, distance, общих видов спорта)].
+
+        Оценка - расстояние, деленное на 1 + число общих видов спорта:
+        напарник с двумя общими видами в 6 км равен напарнику с одним в
+        4 км. Если sports заданы, нужен хотя бы один общий вид. Поиск -
+        кольцами сетки от точки запроса, без обхода всех пользователей.
+        """
+        now = self.clock()
+        self.evict(now)
+
+        mask = self.sport_bits.mask(sports, assign=False)
+        if sports and not mask:
+            # Такой вид спорта не указал никто
+            return []
+        records = self._records
+        ttl = self.ttl
+
+        def weight(user_id):
+            record = records[user_id]
+            if user_id == exclude or not record.is_visible or now - record.last_seen > ttl:
+                return None
+            if not mask:
+                return 1
+            shared = (record.sports_mask & mask).bit_count()
+            return 1 + shared if shared else None
+
+        result = []
+        for user_id, distance in self._index.nearest(lat, lng, k, radius_km, weight, 1 + mask.bit_count()):
+            record = records[user_id]
+            result.append((record, distance, (record.sports_mask & mask).bit_count()))
+        return result
@@ -0,0 +1,185 @@
+# benchmarks/bench_bootstrap.py
+"""Открытие карты: один /api/bootstrap против отдельных запросов к сервисам
+
+Поднимает в одном процессе flask_app (HTTP на 127.0.0.1), events-service
+и users-service (ASGI в памяти) и gateway-service поверх них. Каждому
+сервису добавляется задержка сети --delay мс. Печатает задержку
+bootstrap против последовательных запросов и размер ответа.
+Совпадение данных и частичные ответы проверяет tests/test_bootstrap.py.
+
+Запуск: python benchmarks/bench_bootstrap.py [задержка сервиса, мс]
+"""
+import asyncio
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+
+import httpx
+
+from shared.cache import snap
+
+from bench_ingest import generate_feed
+
+MOSCOW = (55.7558, 37.6173)
+TRAININGS = 500
+USERS = 2000
+EVENTS = 5000
+REQUESTS = 30
+SPORTS = ['бег', 'велоспорт', 'лыжи', 'йога', 'плавание', 'футбол']
+
+
+def load_module(name, path):
+    """Импорт main.py сервиса под уникальным именем: у сервисов оно совпадает"""
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    sys.path.remove(os.path.dirname(path))
+    return module
+
+
+def delayed_asgi(app, delay):
+    """ASGI-приложение, отвечающее на delay секунд позже (сеть до сервиса)"""
+    async def wrapper(scope, receive, send):
+        if scope['type'] == 'http':
+            await asyncio.sleep(delay)
+        await app(scope, receive, send)
+    return wrapper
+
+
+def delayed_wsgi(app, delay):
+    """WSGI-приложение, отвечающее на delay секунд позже"""
+    def wrapper(environ, start_response):
+        time.sleep(delay)
+        return app(environ, start_response)
+    return wrapper
+
+
+def start_flask(directory, delay):
+    """flask_app в потоке с тренировками вокруг Москвы"""
+    from werkzeug.serving import make_server
+
+    os.chdir(directory)
+    os.environ.pop('STORAGE_URL', None)
+    sys.path.insert(0, ROOT)
+    import flask_app
+
+    rng = random.Random(1)
+    start = datetime.now() + timedelta(hours=2)
+    trainings = [{
+        "user_id": n + 1, "user_name": f"user{n}", "title": f"Тренировка {n}", "sport": rng.choice(SPORTS),
+        "lat": MOSCOW[0] + rng.gauss(0, 0.05), "lng": MOSCOW[1] + rng.gauss(0, 0.08),
+        "start_time": start.isoformat(),
+    } for n in range(TRAININGS)]
+    client = flask_app.app.test_client()
+    response = client.post('/api/trainings:batch', json={"trainings": trainings})
+    if response.status_code != 200:
+        raise RuntimeError(f"Cannot create trainings: {response.get_data(as_text=True)}")
+
+    server = make_server('127.0.0.1', 0, delayed_wsgi(flask_app.app, delay), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_events(directory):
+    os.environ['EVENTS_SNAPSHOT'] = ''
+    events = load_module('events_main', os.path.join(ROOT, 'backend', 'events-service', 'main.py'))
+    feed = os.path.join(directory, 'orgeo.json')
+    generate_feed(feed, EVENTS, random.Random(2))
+    events.ingestor.run(feed)
+    return events
+
+
+async def start_users(delay):
+    users = load_module('users_main', os.path.join(ROOT, 'backend', 'users-service', 'main.py'))
+    rng = random.Random(3)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=users.app), base_url='http://users') as client:
+        for first in range(0, USERS, 1000):
+            response = await client.post('/api/users/locations:batch', json={"locations": [{
+                "user_id": n, "lat": MOSCOW[0] + rng.gauss(0, 0.05), "lng": MOSCOW[1] + rng.gauss(0, 0.08),
+                "sports": rng.sample(SPORTS, 2),
+            } for n in range(first, min(first + 1000, USERS))]})
+            response.raise_for_status()
+    return users
+
+
+async def direct(client, gateway, lat, lng, radius, events_radius):
+    """Те же источники отдельными запросами, один за другим, как index.html"""
+    results = {}
+    for source in gateway.bootstrap_sources(lat, lng, radius, None, events_radius):
+        response = await client.get(source.url, params=source.params)
+        response.raise_for_status()
+        data = response.json()
+        results[source.name] = data["data"] if source.envelope else data
+    return results
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(delay):
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            flask_server = start_flask(directory, delay)
+            events = start_events(directory)
+            users = await start_users(delay)
+
+            os.environ['TRAININGS_API_URL'] = f"http://127.0.0.1:{flask_server.server_port}"
+            os.environ['EVENTS_API_URL'] = 'http://events'
+            os.environ['USERS_API_URL'] = 'http://users'
+            gateway = load_module('gateway_main', os.path.join(ROOT, 'backend', 'gateway-service', 'main.py'))
+            from fanout import Fanout
+
+            upstream = httpx.AsyncClient(mounts={
+                'http://events': httpx.ASGITransport(app=delayed_asgi(events.app, delay)),
+                'http://users': httpx.ASGITransport(app=delayed_asgi(users.app, delay)),
+            })
+            gateway.fanout = Fanout(client=upstream)
+            front = httpx.AsyncClient(transport=httpx.ASGITransport(app=gateway.app), base_url='http://gateway')
+
+            # Координаты на сетке snap(): gateway передает сервисам такие же
+            lat, lng = MOSCOW[0] + 0.0002, MOSCOW[1] - 0.0003
+            params = {"lat": lat, "lng": lng, "radius": 10, "events_radius": 50}
+            response = await front.get('/api/bootstrap', params=params, headers={"Accept-Encoding": "gzip"})
+            response.raise_for_status()
+            payload = response.json()
+            sizes = (len(response.content), response.num_bytes_downloaded)
+
+            bootstrap_ms = []
+            direct_ms = []
+            for _ in range(REQUESTS):
+                started = time.perf_counter()
+                (await front.get('/api/bootstrap', params=params)).raise_for_status()
+                bootstrap_ms.append((time.perf_counter() - started) * 1000)
+                started = time.perf_counter()
+                await direct(upstream, gateway, snap(lat), snap(lng), 10, 50)
+                direct_ms.append((time.perf_counter() - started) * 1000)
+
+            await front.aclose()
+            await upstream.aclose()
+        finally:
+            os.chdir(ROOT)
+
+    print(f"service delay {delay * 1000:.0f} ms, {REQUESTS} requests, status {payload['status']}")
+    print(f"{'sequential':>12}: p50 {percentile(direct_ms, 0.5):7.1f} ms  p99 {percentile(direct_ms, 0.99):7.1f} ms")
+    print(f"{'bootstrap':>12}: p50 {percentile(bootstrap_ms, 0.5):7.1f} ms  p99 {percentile(bootstrap_ms, 0.99):7.1f} ms")
+    print(f"payload {sizes[0] / 1024:.0f} KB, gzip {sizes[1] / 1024:.0f} KB, source timings {payload['timings']} ms")
+
+
+def main(delay_ms):
+    asyncio.run(run(delay_ms / 1000))
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 30)
@@ -0,0 +1,60 @@
+# benchmarks/bench_cluster.py
+"""Размер ответа и задержка /api/clusters на видах карты разного масштаба
+
+Запуск: python benchmarks/bench_cluster.py [размеры...]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from shared.cluster import ClusterTree
+
+from bench_spatial import CITIES, SPORTS
+
+# Вид карты 1600x900 px: ширина и высота в градусах на зуме 0
+VIEW_WIDTH = 360 * 1600 / 256
+VIEW_HEIGHT = 170 * 900 / 256
+ZOOMS = [3, 5, 8, 11, 14]
+QUERIES = 50
+
+
+def view(lat, lng, zoom):
+    half_width = min(VIEW_WIDTH / 2 ** zoom, 360) / 2
+    half_height = min(VIEW_HEIGHT / 2 ** zoom, 170) / 2
+    return (max(lng - half_width, -180), max(lat - half_height, -85),
+            min(lng + half_width, 180), min(lat + half_height, 85))
+
+
+def main(sizes):
+    rng = random.Random(42)
+    print(f"{'points':>8} {'build, s':>9} {'zoom':>5} {'clusters':>9} {'payload, KB':>12} {'query, ms':>10}")
+
+    for size in sizes:
+        points = []
+        for _ in range(size):
+            lat, lng = rng.choice(CITIES)
+            points.append((lat + rng.uniform(-0.5, 0.5), lng + rng.uniform(-0.8, 0.8), rng.choice(SPORTS)))
+
+        started = time.perf_counter()
+        tree = ClusterTree()
+        for point in points:
+            tree.add(*point)
+        build = time.perf_counter() - started
+
+        for zoom in ZOOMS:
+            centers = [rng.choice(CITIES) for _ in range(QUERIES)]
+            started = time.perf_counter()
+            results = [tree.clusters(view(lat, lng, zoom), zoom) for lat, lng in centers]
+            query_ms = (time.perf_counter() - started) / QUERIES * 1000
+
+            clusters = max(len(result) for result in results)
+            payload = max(len(json.dumps(result, ensure_ascii=False).encode('utf-8')) for result in results)
+            print(f"{size:>8} {build:>9.2f} {zoom:>5} {clusters:>9} {payload / 1024:>12.1f} {query_ms:>10.3f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000])
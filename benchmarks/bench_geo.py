@@ -0,0 +1,67 @@
+# benchmarks/bench_geo.py
+"""Пакетный haversine (NumPy) против поэлементного цикла
+
+Запуск: python benchmarks/bench_geo.py [размеры...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from shared.geo import PointArray, batch_distances, calculate_distance
+
+MOSCOW = (55.7558, 37.6173)
+RADIUS_KM = 10
+REPEATS = 5
+
+
+def flat_distance(lat1, lon1, lat2, lon2):
+    """Прежняя формула: плоская земля без поправки на широту"""
+    return ((lat1 - lat2) ** 2 + (lon1 - lon2) ** 2) ** 0.5 * 111
+
+
+def per_item_loop(points, lat, lng, radius, distance_fn):
+    return [n for n, (p_lat, p_lng) in enumerate(points) if distance_fn(lat, lng, p_lat, p_lng) <= radius]
+
+
+def best_of(fn):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(sizes):
+    lat, lng = MOSCOW
+    # 10 км на восток от центра Москвы: старая формула дает почти вдвое больше
+    east = (lat, lng + 10 / (111.195 * 0.5634))
+    print(f"Moscow, 10 km east: haversine {calculate_distance(lat, lng, *east):.2f} km, "
+          f"flat {flat_distance(lat, lng, *east):.2f} km")
+    print()
+
+    rng = random.Random(42)
+    print(f"{'points':>9} {'flat loop, ms':>14} {'haversine loop, ms':>19} "
+          f"{'batch, ms':>10} {'bbox+batch, ms':>15}")
+
+    for size in sizes:
+        points = [(lat + rng.uniform(-10, 10), lng + rng.uniform(-20, 20)) for _ in range(size)]
+        array = PointArray()
+        for n, (p_lat, p_lng) in enumerate(points):
+            array.upsert(n, p_lat, p_lng)
+        lats = array.lats[:size]
+        lngs = array.lngs[:size]
+        cos_lats = array.cos_lats[:size]
+
+        flat_ms = best_of(lambda: per_item_loop(points, lat, lng, RADIUS_KM, flat_distance))
+        loop_ms = best_of(lambda: per_item_loop(points, lat, lng, RADIUS_KM, calculate_distance))
+        batch_ms = best_of(lambda: batch_distances(lat, lng, lats, lngs, cos_lats) <= RADIUS_KM)
+        bbox_ms = best_of(lambda: array.within(lat, lng, RADIUS_KM))
+        print(f"{size:>9} {flat_ms:>14.2f} {loop_ms:>19.2f} {batch_ms:>10.2f} {bbox_ms:>15.2f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 100000, 1000000])
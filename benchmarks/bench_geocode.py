@@ -0,0 +1,81 @@
+# benchmarks/bench_geocode.py
+"""Обратное геокодирование: полный перебор справочника против сетки и памяти
+
+Сверяет результат сетки с перебором (завершается с ошибкой при
+расхождении) и печатает время одного запроса: без памяти (разные точки)
+и с памятью (повторные точки, как у стартов одного района).
+
+Запуск: python benchmarks/bench_geocode.py [запросы]
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+
+from shared.geo import calculate_distance
+from shared.geocode import MAX_DISTANCE_KM, ReverseGeocoder, load_places
+
+GAZETTEER = os.path.join(ROOT, 'backend', 'events-service', 'settlements.csv')
+
+
+def full_scan(places, lat, lng):
+    best = None
+    for place in places:
+        distance = calculate_distance(lat, lng, place.lat, place.lng)
+        if distance <= MAX_DISTANCE_KM and (best is None or distance < best[1]):
+            best = (place, distance)
+    return best
+
+
+def measure(fn, points):
+    start = time.perf_counter()
+    for lat, lng in points:
+        fn(lat, lng)
+    return (time.perf_counter() - start) / len(points) * 1e6
+
+
+def main(count):
+    rng = random.Random(42)
+    places = load_places(GAZETTEER)
+
+    # Половина точек - рядом с городами, половина - где угодно в России
+    points = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            place = rng.choice(places)
+            points.append((place.lat + rng.uniform(-0.3, 0.3), place.lng + rng.uniform(-0.5, 0.5)))
+        else:
+            points.append((rng.uniform(42, 70), rng.uniform(20, 180)))
+
+    # Без округления: сетка должна давать ровно тот же город, что перебор
+    exact = ReverseGeocoder(places, quantum=1e-9, memo_size=1)
+    mismatches = 0
+    for lat, lng in points[:2000]:
+        expected = full_scan(places, lat, lng)
+        found = exact.lookup(lat, lng)
+        if (expected and expected[0]) is not (found and found[0]):
+            mismatches += 1
+
+    scan_us = measure(lambda lat, lng: full_scan(places, lat, lng), points[:2000])
+    cold_us = measure(exact.lookup, points)
+    geocoder = ReverseGeocoder(places)
+    warm_points = [rng.choice(points[:count // 10 or 1]) for _ in range(count)]
+    warm_us = measure(geocoder.lookup, warm_points)
+    resolved = sum(1 for lat, lng in points if exact.lookup(lat, lng) is not None)
+
+    print(f"{len(places)} places, {count} queries, {resolved / count:.0%} resolved within {MAX_DISTANCE_KM} km")
+    print(f"{'full scan':>12} {scan_us:>8.1f} us/query")
+    print(f"{'grid':>12} {cold_us:>8.1f} us/query")
+    print(f"{'grid + memo':>12} {warm_us:>8.1f} us/query  {geocoder.stats()}")
+
+    if mismatches:
+        print(f"FAIL: grid and full scan disagree on {mismatches} points")
+        sys.exit(1)
+    print("OK: grid matches full scan")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,61 @@
+# benchmarks/bench_ids.py
+"""Скорость генератора id: потоки и процессы на общем IdGenerator
+
+Каждый процесс запускает несколько потоков на общем IdGenerator (как
+воркер flask_app) и печатает, сколько id в секунду они выдают вместе.
+Отсутствие коллизий проверяет tests/test_ids.py.
+
+Запуск: python benchmarks/bench_ids.py [процессы] [потоки] [id на поток]
+"""
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from shared.ids import IdGenerator
+
+PREFIX = 'training_'
+
+
+def generate(threads, per_thread):
+    """Id всех потоков одного процесса, по списку на поток"""
+    generator = IdGenerator(PREFIX)
+    results = [None] * threads
+    barrier = threading.Barrier(threads)
+
+    def run(n):
+        barrier.wait()
+        results[n] = [generator.next_id() for _ in range(per_thread)]
+
+    workers = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
+
+
+def main(processes, threads, per_thread):
+    started = time.time()
+    with multiprocessing.get_context('spawn').Pool(processes) as pool:
+        per_process = pool.starmap(generate, [(threads, per_thread)] * processes)
+    # fork: дочерние процессы наследуют генератор родителя
+    generator = IdGenerator(PREFIX)
+    generator.next_id()
+    with multiprocessing.get_context('fork').Pool(processes) as pool:
+        per_process += pool.starmap(generate, [(threads, per_thread)] * processes)
+    finished = time.time()
+
+    batches = [ids for process in per_process for ids in process]
+    total = sum(len(ids) for ids in batches)
+    elapsed = finished - started
+    print(f"{2 * processes} processes x {threads} threads: {total} ids in {elapsed:.2f} s "
+          f"({total / elapsed:,.0f} ids/s)")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [4, 8, 20000][len(args):]))
@@ -0,0 +1,84 @@
+# benchmarks/bench_ingest.py
+"""Пропускная способность загрузки ленты Orgeo через локальный HTTP-сервер
+
+Генерирует синтетическую ленту, отдает ее заглушкой на 127.0.0.1 и
+загружает дважды: полностью и после изменения 1% записей.
+
+Запуск: python benchmarks/bench_ingest.py [размеры...]
+"""
+import functools
+import http.server
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, os.path.join(ROOT, 'backend', 'events-service'))
+
+from parser import Ingestor
+
+SAMPLE_FEED = os.path.join(ROOT, 'backend', 'events-service', 'orgeo.json')
+
+
+def generate_feed(path, size, rng, changed=0.0):
+    """Синтетическая лента: записи orgeo.json с новыми url и координатами"""
+    with open(SAMPLE_FEED, 'r', encoding='utf-8') as f:
+        samples = json.load(f)
+
+    # Отдельный генератор, чтобы изменения не сдвигали выбор образцов
+    changes = random.Random(0)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for n in range(size):
+            record = dict(rng.choice(samples))
+            record['url'] = f"https://orgeo.ru/event/{100000 + n}"
+            record['coordinates'] = [{"lat": 43 + (n % 997) * 0.02, "lng": 30 + (n % 991) * 0.1}]
+            if changed and changes.random() < changed:
+                record['title'] += ' (перенос)'
+            if n:
+                f.write(',\n')
+            json.dump(record, f, ensure_ascii=False)
+        f.write('\n]')
+
+
+def serve(directory):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def main(sizes):
+    print(f"{'records':>9} {'pass':>8} {'seconds':>8} {'records/s':>10} {'changed':>8}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = serve(directory)
+        url = f"http://127.0.0.1:{server.server_port}/feed.json"
+        try:
+            for size in sizes:
+                ingestor = Ingestor()
+                path = os.path.join(directory, 'feed.json')
+
+                generate_feed(path, size, random.Random(size))
+                for name, changed in (('full', None), ('unchanged', None), ('1% delta', 0.01)):
+                    if changed:
+                        generate_feed(path, size, random.Random(size), changed=changed)
+                    stats = ingestor.run(url)
+                    print(f"{size:>9} {name:>8} {stats['seconds']:>8.3f} {stats['records_per_sec']:>10} "
+                          f"{stats['added'] + stats['updated'] + stats['removed']:>8}")
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 100000])
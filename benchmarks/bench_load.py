@@ -0,0 +1,454 @@
+# benchmarks/bench_load.py
+"""Нагрузочный тест трех HTTP-сервисов на синтетических данных
+
+Каждый сервис поднимается внутри отдельного процесса (тестовый клиент
+Flask / FastAPI, без сети), наполняется тренировками, пользователями или
+лентой Orgeo заданного размера и получает смесь запросов, похожую на
+настоящую: обновление карты, создание тренировки, присоединение,
+обновление местоположения, поиск рядом. По каждому endpoint считаются
+p50/p95/p99, пропускная способность и рост RSS.
+
+Результаты пишутся в JSON, чтобы сравнивать коммиты между собой:
+
+    python benchmarks/bench_load.py 1000 100000 --output before.json
+    python benchmarks/bench_load.py 1000 100000 --baseline before.json
+
+Нужны зависимости всех сервисов и httpx (для тестового клиента FastAPI).
+
+Запуск: python benchmarks/bench_load.py [размеры...] [--requests N] [--services ...]
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SERVICES = ['flask', 'events', 'users']
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_spatial import CITIES, SPORTS
+
+REQUESTS = 2000
+WARMUP = 100
+REGRESSION_THRESHOLD = 1.2  # p95 медленнее базы в 1.2 раза - регрессия
+
+
+def rss_kb():
+    """Текущий RSS процесса в КБ (пиковый, если /proc недоступен)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS отдает байты, Linux - килобайты
+        return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def percentile(ordered, fraction):
+    """Перцентиль по рангу для отсортированного списка"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def around_city(rng, spread=0.3):
+    lat, lng = rng.choice(CITIES)
+    return lat + rng.uniform(-spread, spread), lng + rng.uniform(-spread, spread)
+
+
+def load_module(name, path):
+    """Импорт main.py сервиса под уникальным именем: у сервисов оно совпадает"""
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class Traffic:
+    """Клиент сервиса с ETag-кэшем, как у браузера, и общим состоянием смеси"""
+
+    def __init__(self, client, rng):
+        self.client = client
+        self.rng = rng
+        self.etags = {}
+        self.training_ids = []
+        self.user_ids = 0
+
+    def get(self, url):
+        headers = {}
+        if url in self.etags:
+            headers['If-None-Match'] = self.etags[url]
+        response = self.client.get(url, headers=headers)
+        etag = response.headers.get('ETag')
+        if etag:
+            self.etags[url] = etag
+        return response
+
+    def post(self, url, payload):
+        return self.client.post(url, json=payload)
+
+
+# Сервис flask_app: тренировки
+
+def training_record(n, rng, now):
+    lat, lng = around_city(rng, 0.5)
+    start = now + timedelta(hours=rng.randint(1, 72))
+    return {
+        "id": f"training_seed_{n}",
+        "user_id": n,
+        "title": f"{rng.choice(SPORTS).capitalize()} в парке #{n}",
+        "description": "Синтетическая тренировка для нагрузочного теста",
+        "sport": rng.choice(SPORTS),
+        "lat": lat,
+        "lng": lng,
+        "start_time": start.isoformat(),
+        "end_time": (start + timedelta(hours=2)).isoformat(),
+        "comment": "",
+        "auto_accept": True,
+        "created_at": now.isoformat(),
+        "user_name": f"User_{n}",
+        "user_photo": None,
+        "is_premium": False,
+    }
+
+
+def setup_flask(size, rng):
+    os.environ.pop('STORAGE_URL', None)
+    flask_app = load_module('flask_app', os.path.join(ROOT, 'flask_app.py'))
+
+    now = datetime.now()
+    with flask_app.storage_lock:
+        for n in range(size):
+            training = training_record(n, rng, now)
+            flask_app.put_training(training)
+            flask_app.add_participant(training['id'], {
+                "user_id": n, "user_name": training['user_name'], "user_photo": None,
+                "joined_at": training['created_at'],
+            })
+
+    traffic = Traffic(flask_app.app.test_client(), rng)
+    traffic.training_ids = [f"training_seed_{n}" for n in range(size)]
+    traffic.user_ids = size
+    return traffic, None
+
+
+def flask_map_refresh(traffic):
+    lat, lng = around_city(traffic.rng)
+    return traffic.get(f"/api/trainings?lat={lat:.4f}&lng={lng:.4f}&radius=5")
+
+
+def flask_clusters(traffic):
+    lat, lng = around_city(traffic.rng)
+    zoom = traffic.rng.choice([5, 8, 11])
+    half = 90 / 2 ** zoom
+    return traffic.get(f"/api/clusters?bbox={lng - 2 * half:.3f},{lat - half:.3f},"
+                       f"{lng + 2 * half:.3f},{lat + half:.3f}&zoom={zoom}")
+
+
+def flask_create_training(traffic):
+    rng = traffic.rng
+    traffic.user_ids += 1
+    lat, lng = around_city(rng, 0.5)
+    start = datetime.now() + timedelta(hours=rng.randint(1, 72))
+    response = traffic.post("/api/trainings", {
+        "user_id": traffic.user_ids,
+        "user_name": f"User_{traffic.user_ids}",
+        "title": "Новая тренировка",
+        "sport": rng.choice(SPORTS),
+        "lat": lat,
+        "lng": lng,
+        "start_time": start.isoformat(),
+        "end_time": (start + timedelta(hours=1)).isoformat(),
+    })
+    if response.status_code == 200:
+        traffic.training_ids.append(response.get_json()['training_id'])
+    return response
+
+
+def flask_join(traffic):
+    rng = traffic.rng
+    user_id = rng.randint(1, traffic.user_ids)
+    return traffic.post(f"/api/trainings/{rng.choice(traffic.training_ids)}/join",
+                        {"user_id": user_id, "user_name": f"User_{user_id}"})
+
+
+def flask_participants(traffic):
+    return traffic.get(f"/api/trainings/{traffic.rng.choice(traffic.training_ids)}/participants")
+
+
+def flask_location(traffic):
+    lat, lng = around_city(traffic.rng)
+    return traffic.post("/api/users/location",
+                        {"user_id": traffic.rng.randint(1, traffic.user_ids), "lat": lat, "lng": lng})
+
+
+# Сервис events-service: мероприятия Orgeo
+
+def setup_events(size, rng):
+    from bench_ingest import generate_feed
+
+    feed = os.path.join(os.getcwd(), 'feed.json')
+    generate_feed(feed, size, rng)
+    os.environ['ORGEO_SOURCE'] = feed
+    os.environ['ORGEO_REFRESH'] = str(10 ** 9)
+    # Индекс в памяти: снапшот по умолчанию лежит в каталоге сервиса, и
+    # настоящий events-service отдавал бы после прогона тестовые мероприятия
+    os.environ['EVENTS_SNAPSHOT'] = ''
+
+    from fastapi.testclient import TestClient
+
+    events = load_module('events_main', os.path.join(ROOT, 'backend', 'events-service', 'main.py'))
+    # Контекст запускает lifespan: начальная загрузка ленты
+    client = TestClient(events.app)
+    client.__enter__()
+    return Traffic(client, rng), lambda: client.__exit__(None, None, None)
+
+
+def events_map_refresh(traffic):
+    lat, lng = around_city(traffic.rng, 10)
+    return traffic.get(f"/api/events?lat={lat:.4f}&lng={lng:.4f}&radius=100")
+
+
+def events_by_sport(traffic):
+    sport = traffic.rng.choice(['бег', 'ориентирование', 'туризм', 'велоспорт'])
+    return traffic.get(f"/api/events?sport={sport}&date_from=2025-01-01&date_to=2025-12-31")
+
+
+def events_search(traffic):
+    return traffic.get(f"/api/events?q={traffic.rng.choice(['кубок', 'первенство', 'кросс', 'ориентир'])}")
+
+
+def events_clusters(traffic):
+    zoom = traffic.rng.choice([3, 5, 8])
+    return traffic.get(f"/api/clusters?bbox=20,40,60,65&zoom={zoom}")
+
+
+# Сервис users-service: присутствие пользователей
+
+def setup_users(size, rng):
+    from fastapi.testclient import TestClient
+
+    users = load_module('users_main', os.path.join(ROOT, 'backend', 'users-service', 'main.py'))
+    for user_id in range(size):
+        lat, lng = around_city(rng, 0.5)
+        users.users_storage.touch(user_id, f"User_{user_id}", lat, lng, sports=[rng.choice(SPORTS)])
+
+    traffic = Traffic(TestClient(users.app), rng)
+    traffic.user_ids = size
+    return traffic, None
+
+
+def users_location(traffic):
+    lat, lng = around_city(traffic.rng, 0.5)
+    user_id = traffic.rng.randrange(traffic.user_ids)
+    return traffic.post("/api/users/location", {
+        "user_id": user_id, "username": f"User_{user_id}", "lat": lat, "lng": lng,
+        "sports": [traffic.rng.choice(SPORTS)],
+    })
+
+
+def users_nearby(traffic):
+    lat, lng = around_city(traffic.rng)
+    return traffic.get(f"/api/users/nearby?lat={lat:.4f}&lng={lng:.4f}&radius=10")
+
+
+# Смеси запросов: (операция, вес, функция)
+MIXES = {
+    'flask': (setup_flask, [
+        ('map_refresh', 45, flask_map_refresh),
+        ('clusters', 10, flask_clusters),
+        ('create_training', 5, flask_create_training),
+        ('join', 15, flask_join),
+        ('participants', 5, flask_participants),
+        ('location_update', 20, flask_location),
+    ]),
+    'events': (setup_events, [
+        ('map_refresh', 50, events_map_refresh),
+        ('by_sport', 20, events_by_sport),
+        ('search', 15, events_search),
+        ('clusters', 15, events_clusters),
+    ]),
+    'users': (setup_users, [
+        ('location_update', 60, users_location),
+        ('nearby', 40, users_nearby),
+    ]),
+}
+
+
+def run_service(service, size, requests, warmup, seed):
+    """Прогон одного сервиса; выполняется в отдельном процессе"""
+    setup, mix = MIXES[service]
+    rng = random.Random(seed)
+
+    # Логи и print сервисов на каждый запрос мешают отчету и замеру
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        # flask_app пишет снапшот и журнал в текущий каталог
+        os.chdir(directory)
+        rss_start = rss_kb()
+        started = time.perf_counter()
+        traffic, teardown = setup(size, rng)
+        seed_seconds = time.perf_counter() - started
+        rss_seeded = rss_kb()
+
+        names = [name for name, _, _ in mix]
+        weights = [weight for _, weight, _ in mix]
+        operations = {name: fn for name, _, fn in mix}
+        for name in rng.choices(names, weights, k=warmup):
+            operations[name](traffic)
+
+        latencies = {name: [] for name in names}
+        errors = dict.fromkeys(names, 0)
+        rss_growth = dict.fromkeys(names, 0)
+        started = time.perf_counter()
+        for name in rng.choices(names, weights, k=requests):
+            before = rss_kb()
+            request_started = time.perf_counter()
+            response = operations[name](traffic)
+            latencies[name].append(time.perf_counter() - request_started)
+            rss_growth[name] += max(rss_kb() - before, 0)
+            if response.status_code >= 400:
+                errors[name] += 1
+        wall = time.perf_counter() - started
+
+        if teardown is not None:
+            teardown()
+
+    endpoints = {}
+    for name in names:
+        ordered = sorted(latencies[name])
+        total = sum(ordered)
+        endpoints[name] = {
+            "count": len(ordered),
+            "errors": errors[name],
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 3) if ordered else None,
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 3) if ordered else None,
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 3) if ordered else None,
+            "mean_ms": round(total / len(ordered) * 1000, 3) if ordered else None,
+            "throughput_rps": round(len(ordered) / total, 1) if total else None,
+            "rss_growth_kb": rss_growth[name],
+        }
+
+    return {
+        "size": size,
+        "requests": requests,
+        "seed_seconds": round(seed_seconds, 3),
+        "throughput_rps": round(requests / wall, 1) if wall else None,
+        "rss_kb": {"start": rss_start, "seeded": rss_seeded, "end": rss_kb()},
+        "endpoints": endpoints,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results):
+    print(f"{'service':>8} {'size':>8} {'endpoint':>16} {'count':>6} {'err':>4} {'p50, ms':>8} "
+          f"{'p95, ms':>8} {'p99, ms':>8} {'req/s':>8} {'RSS+, KB':>9}")
+    for run in results['runs']:
+        for name, stats in run['endpoints'].items():
+            if not stats['count']:
+                continue
+            print(f"{run['service']:>8} {run['size']:>8} {name:>16} {stats['count']:>6} {stats['errors']:>4} "
+                  f"{stats['p50_ms']:>8.3f} {stats['p95_ms']:>8.3f} {stats['p99_ms']:>8.3f} "
+                  f"{stats['throughput_rps']:>8.0f} {stats['rss_growth_kb']:>9}")
+        print(f"{run['service']:>8} {run['size']:>8} {'total':>16} seed {run['seed_seconds']:.2f} s, "
+              f"{run['throughput_rps']:.0f} req/s, RSS {run['rss_kb']['end'] // 1024} MB")
+
+
+def compare(results, baseline, threshold):
+    """Сравнение p95 с базовым прогоном; возвращает число регрессий"""
+    previous = {(run['service'], run['size'], name): stats
+                for run in baseline['runs'] for name, stats in run['endpoints'].items()}
+    regressions = 0
+
+    print(f"\nbaseline {baseline.get('commit') or '?'}")
+    print(f"{'service':>8} {'size':>8} {'endpoint':>16} {'p95 was':>8} {'p95 now':>8} {'ratio':>6}")
+    for run in results['runs']:
+        for name, stats in run['endpoints'].items():
+            old = previous.get((run['service'], run['size'], name))
+            if not old or not old.get('p95_ms') or not stats['p95_ms']:
+                continue
+            ratio = stats['p95_ms'] / old['p95_ms']
+            flag = ' !' if ratio > threshold else ''
+            regressions += bool(flag)
+            print(f"{run['service']:>8} {run['size']:>8} {name:>16} {old['p95_ms']:>8.3f} "
+                  f"{stats['p95_ms']:>8.3f} {ratio:>5.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sizes', nargs='*', type=int, default=[1000, 100000],
+                        help="число тренировок / пользователей / мероприятий")
+    parser.add_argument('--services', default=','.join(SERVICES))
+    parser.add_argument('--requests', type=int, default=REQUESTS)
+    parser.add_argument('--warmup', type=int, default=WARMUP)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="JSON с результатами (по умолчанию bench_load-<коммит>.json)")
+    parser.add_argument('--baseline', help="JSON прошлого прогона для сравнения p95")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    services = [service.strip() for service in args.services.split(',') if service.strip()]
+    unknown = set(services) - set(MIXES)
+    if unknown:
+        parser.error(f"unknown services: {', '.join(sorted(unknown))}")
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "runs": [],
+    }
+
+    # Отдельный процесс на прогон: модули сервисов держат состояние
+    # на уровне модуля, а RSS не смешивается между сервисами
+    context = multiprocessing.get_context('spawn')
+    for service in services:
+        for size in args.sizes:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                run = pool.submit(run_service, service, size, args.requests, args.warmup, args.seed).result()
+            results['runs'].append(dict(run, service=service))
+
+    print_report(results)
+
+    output = args.output or f"bench_load-{(commit or 'nogit')[:12]}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nresults: {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/bench_matches.py
+"""Подбор напарников: кольцевой поиск k лучших против перебора радиуса
+
+Заполняет PresenceStore пользователями вокруг крупных городов, сверяет
+результат matches() с перебором всех пользователей в радиусе
+(завершается с ошибкой при расхождении) и печатает p50 / p99 задержки.
+
+Запуск: python benchmarks/bench_matches.py [пользователи] [k]
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, os.path.join(ROOT, 'backend', 'users-service'))
+
+from presence import PresenceStore
+
+CITIES = [
+    (55.7558, 37.6173),   # Москва
+    (59.9343, 30.3351),   # Санкт-Петербург
+    (56.8389, 60.6057),   # Екатеринбург
+    (55.0084, 82.9357),   # Новосибирск
+    (55.7963, 49.1088),   # Казань
+    (48.4802, 135.0719),  # Хабаровск
+    (44.5622, 38.0848),   # Геленджик
+]
+SPORTS = ['бег', 'велоспорт', 'лыжи', 'йога', 'плавание', 'футбол', 'теннис', 'скалолазание',
+          'волейбол', 'баскетбол', 'триатлон', 'ориентирование']
+RADIUS = 50
+QUERIES = 500
+CHECKED = 50
+
+
+def populate(size, rng):
+    store = PresenceStore(ttl=10 ** 9)
+    for user_id in range(size):
+        lat, lng = rng.choice(CITIES)
+        store.touch(user_id, None, lat + rng.gauss(0, 0.15), lng + rng.gauss(0, 0.25),
+                    sports=rng.sample(SPORTS, rng.randint(0, 3)))
+    return store
+
+
+def brute_force(store, lat, lng, sports, k, exclude):
+    """Все пользователи в радиусе, отсортированные по той же оценке"""
+    mask = store.sport_bits.mask(sports, assign=False)
+    scored = []
+    for record, distance in store.nearby(lat, lng, RADIUS):
+        if record.user_id == exclude:
+            continue
+        shared = (record.sports_mask & mask).bit_count()
+        if mask and not shared:
+            continue
+        scored.append((distance / (1 + shared), record.user_id))
+    scored.sort()
+    return scored[:k]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main(size, k):
+    rng = random.Random(42)
+    started = time.perf_counter()
+    store = populate(size, rng)
+    print(f"{size} users loaded in {time.perf_counter() - started:.1f} s")
+
+    queries = []
+    for _ in range(QUERIES):
+        lat, lng = rng.choice(CITIES)
+        sports = rng.sample(SPORTS, rng.randint(0, 2))
+        queries.append((lat + rng.gauss(0, 0.15), lng + rng.gauss(0, 0.25), sports, rng.randrange(size)))
+
+    problems = 0
+    for lat, lng, sports, exclude in queries[:CHECKED]:
+        expected = brute_force(store, lat, lng, sports, k, exclude)
+        found = store.matches(lat, lng, sports, k, RADIUS, exclude)
+        scores = [distance / (1 + shared) for _, distance, shared in found]
+        # Равные оценки могут идти в другом порядке: сравниваются оценки
+        if len(scores) != len(expected) or any(abs(a - b[0]) > 1e-9 for a, b in zip(scores, expected)):
+            problems += 1
+
+    timings = {}
+    for name, run in (
+        ('radius scan', lambda q: brute_force(store, q[0], q[1], q[2], k, q[3])),
+        ('rings', lambda q: store.matches(q[0], q[1], q[2], k, RADIUS, q[3])),
+    ):
+        latencies = []
+        for query in queries[:CHECKED] if name == 'radius scan' else queries:
+            start = time.perf_counter()
+            run(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        timings[name] = latencies
+        print(f"{name:>12}: p50 {percentile(latencies, 0.5):8.3f} ms  p99 {percentile(latencies, 0.99):8.3f} ms")
+
+    if problems:
+        print(f"FAIL: {problems} of {CHECKED} queries differ from the radius scan")
+        sys.exit(1)
+    print(f"OK: top-{k} matches agree with the radius scan")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [1000000, 10][len(args):]))
@@ -0,0 +1,65 @@
+# benchmarks/bench_search.py
+"""Память и задержка полнотекстового индекса на синтетических документах
+
+Запуск: python benchmarks/bench_search.py [размеры...]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from shared.search import SearchIndex
+
+WORDS = (
+    'утренняя вечерняя пробежка тренировка забег марафон полумарафон кросс велопробег '
+    'йога плавание лыжная гонка ориентирование первенство чемпионат кубок города области '
+    'парк набережная стадион лес горы новичков профессионалов группа клуб сборы фестиваль '
+    'москва петербург казань хабаровск новосибирск екатеринбург геленджик сочи '
+    'осенний зимний весенний летний ночной детский студенческий открытый'
+).split()
+QUERIES = ['марафон', 'пробежка парк', 'чемпионат хабар', 'йога', 'ночной велопр', 'кубок города каз']
+
+
+def document(rng):
+    title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 6)))
+    description = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 15)))
+    # Уникальное слово на документ раздувает словарь, как реальные названия
+    return title + f" N{rng.randrange(10 ** 6)}", description
+
+
+def build_index(documents):
+    index = SearchIndex()
+    for n, (title, description) in enumerate(documents):
+        index.add(n, title, description)
+    return index
+
+
+def main(sizes):
+    print(f"{'docs':>9} {'index, MB':>10} {'build, s':>9} {'query, ms':>10}")
+    for size in sizes:
+        rng = random.Random(size)
+        documents = [document(rng) for _ in range(size)]
+
+        started = time.perf_counter()
+        index = build_index(documents)
+        build = time.perf_counter() - started
+
+        # Память меряется отдельной сборкой: tracemalloc сильно замедляет
+        tracemalloc.start()
+        traced = build_index(documents)
+        memory = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+        del traced
+
+        started = time.perf_counter()
+        for query in QUERIES:
+            index.search(query)
+        query_ms = (time.perf_counter() - started) / len(QUERIES) * 1000
+        print(f"{size:>9} {memory:>10.1f} {build:>9.2f} {query_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,194 @@
+# benchmarks/bench_snapshot.py
+"""Колоночный снапшот мероприятий против индекса в памяти
+
+Загружает синтетическую ленту в EventIndex и в SnapshotIndex, затем
+догружает ленту с 1% измененных записей. Сверяет ответы query() и
+кластеры обеих версий (завершается с ошибкой при расхождении) и в
+отдельных процессах меряет холодный старт: открытие снапшота против
+загрузки ленты, время до первого ответа и пиковую память.
+
+Запуск: python benchmarks/bench_snapshot.py [размер]
+"""
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, os.path.join(ROOT, 'backend', 'events-service'))
+
+from parser import Ingestor
+from snapshot import SnapshotIndex
+from shared.geo import calculate_distance
+from shared.geocode import ReverseGeocoder
+
+from bench_ingest import generate_feed
+
+GAZETTEER = os.path.join(ROOT, 'backend', 'events-service', 'settlements.csv')
+DAY = 86400
+BBOXES = [((-180, -85, 180, 85), 2), ((25, 40, 60, 60), 5), ((35, 50, 40, 55), 9), ((170, -10, -170, 10), 4)]
+
+
+def queries(rng, index):
+    """Запросы всех видов: по одному фильтру и в сочетаниях"""
+    events = list(index.events.values())
+    sample = [rng.choice(events) for _ in range(10)]
+    dated = sorted(event.starts_at for event in events if event.starts_at is not None)
+    found = [{}]
+    for event in sample:
+        lat, lng = event.coordinates[0] if event.coordinates else (55.75, 37.62)
+        middle = rng.choice(dated)
+        words = event.title.split()
+        found += [
+            {"sport": event.sport},
+            {"city": (event.city or 'москва').upper()},
+            {"q": words[0] if words else 'бег'},
+            {"lat": lat, "lng": lng, "radius": rng.choice([5, 50, 300])},
+            {"date_from": middle - 10 * DAY, "date_to": middle + 10 * DAY},
+            {"date_from": middle},
+            {"date_to": middle},
+            {"lat": lat, "lng": lng, "radius": 200, "date_from": middle - 30 * DAY, "sport": event.sport},
+            {"city": event.city, "q": words[-1] if words else 'бег', "date_to": middle + 90 * DAY},
+        ]
+    found += [{"sport": "керлинг"}, {"city": "Атлантида"}, {"q": "zzzz"}, {"lat": 0.0, "lng": 0.0, "radius": 10}]
+    return found
+
+
+def order_key(params, event, origin):
+    """Ключ, по которому упорядочен ответ; None - порядок не задан"""
+    if "radius" in params:
+        return round(min(origin(lat, lng) for lat, lng in event.coordinates), 9)
+    if "date_from" in params or "date_to" in params:
+        return event.starts_at
+    return None
+
+
+def compare(expected_index, actual_index, params):
+    """Описание расхождения или None"""
+    expected = list(expected_index.query(**params))
+    actual = list(actual_index.query(**params))
+    if {e.id for e in expected} != {e.id for e in actual}:
+        return f"{params}: {len(expected)} vs {len(actual)} events"
+    by_id = {e.id: e.to_dict() for e in expected}
+    if any(by_id[e.id] != e.to_dict() for e in actual):
+        return f"{params}: records differ"
+
+    origin = lambda lat, lng: calculate_distance(params.get("lat"), params.get("lng"), lat, lng)
+    if expected and order_key(params, expected[0], origin) is not None:
+        # Равные ключи могут идти в другом порядке: сравниваются ключи
+        if [order_key(params, e, origin) for e in expected] != [order_key(params, e, origin) for e in actual]:
+            return f"{params}: order differs"
+    return None
+
+
+def compare_clusters(expected_index, actual_index, bbox, zoom):
+    def normalized(clusters):
+        return sorted((c["count"], sorted(c["sports"].items()), c["lat"], c["lng"]) for c in clusters)
+
+    expected = normalized(expected_index.clusters.clusters(bbox, zoom))
+    actual = normalized(actual_index.clusters.clusters(bbox, zoom))
+    if len(expected) != len(actual) or any(
+        a[:2] != b[:2] or abs(a[2] - b[2]) > 1e-4 or abs(a[3] - b[3]) > 1e-4 for a, b in zip(expected, actual)
+    ):
+        return f"clusters {bbox} zoom {zoom}: {len(expected)} vs {len(actual)}"
+    return None
+
+
+def peak_rss_kb():
+    """Пик RSS процесса. ru_maxrss в Linux переживает exec и показывает
+    пик родителя, поэтому сначала читается VmHWM"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def startup(mode, path):
+    """Холодный старт в этом процессе: печатает JSON с замерами"""
+    started = time.perf_counter()
+    geocoder = ReverseGeocoder.from_file(GAZETTEER)
+    if mode == 'snapshot':
+        index = SnapshotIndex.open(path)
+    else:
+        ingestor = Ingestor(geocoder)
+        ingestor.run(path)
+        index = ingestor.current
+    ready = time.perf_counter() - started
+    events = list(index.query(lat=55.75, lng=37.62, radius=100))
+    first = time.perf_counter() - started
+    print(json.dumps({
+        "events": len(index),
+        "ready_s": round(ready, 3),
+        "first_answer_s": round(first, 3),
+        "answered": len(events),
+        "max_rss_mb": round(peak_rss_kb() / 1024),
+    }))
+
+
+def run_startup(mode, path):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--startup', mode, path],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(size):
+    rng = random.Random(42)
+    geocoder = ReverseGeocoder.from_file(GAZETTEER)
+    with tempfile.TemporaryDirectory() as directory:
+        feed = os.path.join(directory, 'orgeo.json')
+        changed_feed = os.path.join(directory, 'orgeo-changed.json')
+        snapshot = os.path.join(directory, 'events.snapshot')
+        generate_feed(feed, size, random.Random(1))
+        generate_feed(changed_feed, size, random.Random(1), changed=0.01)
+
+        memory = Ingestor(geocoder)
+        columns = Ingestor(geocoder, snapshot)
+        print(f"{'run':>18} {'memory, s':>10} {'snapshot, s':>12}")
+        for name, source in (('full', feed), ('1% changed', changed_feed)):
+            timings = [ingestor.run(source)["seconds"] for ingestor in (memory, columns)]
+            print(f"{name:>18} {timings[0]:>10.2f} {timings[1]:>12.2f}")
+        print(f"snapshot file: {os.path.getsize(snapshot) / 2 ** 20:.1f} MB, {len(columns.current)} events")
+
+        # Снапшот, открытый заново, должен давать те же ответы
+        reopened = SnapshotIndex.open(snapshot)
+        checks = queries(rng, memory.current)
+        problems = []
+        for params in checks:
+            problems.append(compare(memory.current, reopened, params))
+        for bbox, zoom in BBOXES:
+            problems.append(compare_clusters(memory.current, reopened, bbox, zoom))
+        problems = [problem for problem in problems if problem]
+        for name, index in (('memory', memory.current), ('snapshot', reopened)):
+            started = time.perf_counter()
+            answered = sum(sum(1 for _ in index.query(**params)) for params in checks)
+            elapsed = time.perf_counter() - started
+            print(f"{name:>18}: {len(checks)} queries in {elapsed * 1000:.0f} ms, "
+                  f"{elapsed / max(answered, 1) * 1e6:.1f} us per returned event")
+
+        print(f"{'cold start':>18} {'ready, s':>10} {'first answer, s':>16} {'max RSS, MB':>12}")
+        for mode, path in (('ingest', changed_feed), ('snapshot', snapshot)):
+            stats = run_startup(mode, path)
+            print(f"{mode:>18} {stats['ready_s']:>10.3f} {stats['first_answer_s']:>16.3f} {stats['max_rss_mb']:>12}")
+
+    if problems:
+        for problem in problems[:10]:
+            print(f"  {problem}")
+        print(f"FAIL: {len(problems)} answers differ between the snapshot and the in-memory index")
+        sys.exit(1)
+    print("OK: snapshot answers match the in-memory index")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['--startup']:
+        startup(sys.argv[2], sys.argv[3])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,82 @@
+# benchmarks/bench_spatial.py
+"""Задержка запроса тренировок поблизости: полный перебор против сетки
+
+Запуск: python benchmarks/bench_spatial.py [размеры...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from shared.geo import calculate_distance
+from shared.spatial import GridIndex
+
+# Центры городов, вокруг которых разбрасываются тренировки
+CITIES = [
+    (55.7558, 37.6173),   # Москва
+    (59.9343, 30.3351),   # Санкт-Петербург
+    (56.8389, 60.6057),   # Екатеринбург
+    (55.0084, 82.9357),   # Новосибирск
+    (55.7963, 49.1088),   # Казань
+    (48.4802, 135.0719),  # Хабаровск
+    (44.5622, 38.0848),   # Геленджик
+]
+SPORTS = ['бег', 'велоспорт', 'лыжи', 'йога', 'плавание', 'футбол']
+QUERIES = 200
+
+
+def generate(size, rng):
+    points = {}
+    for n in range(size):
+        lat, lng = rng.choice(CITIES)
+        points[f"training_{n}"] = {
+            "lat": lat + rng.uniform(-0.5, 0.5),
+            "lng": lng + rng.uniform(-0.8, 0.8),
+            "sport": rng.choice(SPORTS),
+        }
+    return points
+
+
+def full_scan(points, lat, lng, radius, sport):
+    result = []
+    for training_id, training in points.items():
+        if sport and training['sport'] != sport:
+            continue
+        distance = calculate_distance(lat, lng, training['lat'], training['lng'])
+        if distance <= radius:
+            result.append((training_id, distance))
+    return result
+
+
+def measure(fn, queries):
+    start = time.perf_counter()
+    for query in queries:
+        fn(*query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main(sizes):
+    rng = random.Random(42)
+    print(f"{'size':>8} {'sport':>6} {'scan, ms':>10} {'grid, ms':>10} {'speedup':>8}")
+
+    for size in sizes:
+        points = generate(size, rng)
+        index = GridIndex()
+        for training_id, training in points.items():
+            index.add(training_id, training['lat'], training['lng'], training['sport'])
+
+        for sport in ('', 'бег'):
+            queries = []
+            for _ in range(QUERIES):
+                lat, lng = rng.choice(CITIES)
+                queries.append((lat + rng.uniform(-0.3, 0.3), lng + rng.uniform(-0.3, 0.3), 5, sport))
+
+            scan_ms = measure(lambda *q: full_scan(points, *q), queries)
+            grid_ms = measure(index.nearby, queries)
+            print(f"{size:>8} {sport or '-':>6} {scan_ms:>10.3f} {grid_ms:>10.3f} {scan_ms / grid_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
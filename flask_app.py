@@ -1,10 +1,31 @@
 # flask_app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 from datetime import datetime, timedelta
+import bisect
 import logging
 import json
 import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from shared.cache import ResponseCache, etag_matches, snap
+from shared.cluster import ClusterTree, parse_bbox
+from shared.expiry import ExpiryQueue, parse_timestamp
+from shared.geo import PointArray
+from shared.ids import IdGenerator
+from shared.metrics import PROMETHEUS_CONTENT_TYPE, from_env as metrics_from_env
+from shared.pubsub import ThreadSubscription, ViewportHub, format_sse
+from shared.roster import DEFAULT_PAGE_SIZE, Roster
+from shared.search import SearchIndex
+from shared.serialize import NDJSON_CONTENT_TYPE, dumps, dumps_overlay, envelope, iter_ndjson, iter_object, \
+    wants_ndjson
+from shared.spatial import GridIndex
+from shared.storage import open_storage
+from shared.wal import ChangeLog, GroupCommit
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -13,15 +34,99 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# Файлы для хранения данных
+# Замеры запросов и участков; METRICS_ENABLED=0 выключает,
+# PROFILE_SLOW_REQUESTS=N включает профилировщик медленных запросов
+metrics = metrics_from_env('flask_app')
+
+if metrics.enabled:
+    @app.before_request
+    def start_request_timer():
+        # Шаблон маршрута, а не путь: id тренировок не плодят метки
+        g.request_timer = metrics.begin(request.method, request.url_rule.rule if request.url_rule else 'unmatched')
+
+    @app.after_request
+    def finish_request_timer(response):
+        timer = g.pop('request_timer', None)
+        if timer is not None:
+            metrics.finish(timer, response.status_code)
+        return response
+
+
+# Файлы для хранения данных: снапшот + журнал изменений (один процесс)
+SNAPSHOT_FILE = 'snapshot.json'
+CHANGELOG_FILE = 'changes.log'
+# Общее хранилище для нескольких воркеров: sqlite:///trainings.db или
+# redis://localhost:6379/0. Без него - журнал в файлах выше
+STORAGE_URL = os.environ.get('STORAGE_URL')
+COMPACT_INTERVAL = 60  # секунд между фоновыми компакциями
+SWEEP_INTERVAL = 60  # секунд между фоновыми проходами очистки
+STREAM_HEARTBEAT = 15  # секунд между keep-alive комментариями в потоке
+# Поток /api/trainings/stream держит синхронный воркер на каждого
+# клиента, поэтому включается явно: TRAININGS_STREAM=1 при сервере с
+# потоками или gevent, где воркеров хватает на всех подписчиков
+TRAININGS_STREAM = os.environ.get('TRAININGS_STREAM', '0').lower() not in ('0', 'false', 'no', '')
+RESPONSE_CACHE_BYTES = 32 * 2 ** 20  # предел памяти кэша ответов
+GROUP_COMMIT_WINDOW = 0.002  # секунд на сбор одновременных записей в одну
+MAX_BATCH_SIZE = 1000  # элементов в одном пакетном запросе
+REQUEST_PREFIX = 'request_'  # id запросов на участие, из той же последовательности, что и тренировки
+
+TRAINING_REQUIRED_FIELDS = ['user_id', 'user_name', 'title', 'sport', 'lat', 'lng', 'start_time']
+
+# Тренировка удаляется через 1 день после окончания, а при некорректной
+# дате - через 2 дня после создания
+EXPIRY_DELAY = timedelta(days=1).total_seconds()
+INVALID_DATE_EXPIRY_DELAY = timedelta(days=2).total_seconds()
+
+# Файлы старого формата (полная перезапись), читаются только для миграции
 TRAININGS_FILE = 'trainings.json'
 PARTICIPANTS_FILE = 'participants.json'
 
 # Хранилища данных
 trainings_storage = {}
-training_participants = {}
+training_participants = {}  # id тренировки -> Roster
 user_locations = {}
 
+
+# Индексы поверх trainings_storage: обычные тренировки в сетке,
+# премиум показываются без фильтра по расстоянию
+training_index = GridIndex()
+premium_training_ids = set()
+# id из training_ids по возрастанию, то есть по времени создания
+training_order = []
+# Запросы на участие в тренировках без авто-принятия: id запроса -> запрос,
+# id запросов по возрастанию и id тренировки -> {user_id: id запроса}
+join_requests = {}
+request_order = []
+training_requests = {}
+training_expiry = ExpiryQueue()
+training_search = SearchIndex()
+# Агрегаты для /api/clusters, включая премиум
+training_clusters = ClusterTree()
+
+# Подписчики потока изменений тренировок
+training_hub = ViewportHub()
+
+storage_lock = threading.RLock()
+if STORAGE_URL:
+    storage = open_storage(STORAGE_URL, state_lock=storage_lock)
+    worker_lease = storage.lease_worker
+else:
+    # Журнал в файлах пишет один процесс: случайного номера достаточно
+    storage = ChangeLog(SNAPSHOT_FILE, CHANGELOG_FILE, state_lock=storage_lock)
+    worker_lease = None
+
+# id тренировок упорядочены по времени создания и не повторяются
+# между потоками и воркерами (WORKER_ID или номер, арендованный в хранилище)
+training_ids = IdGenerator('training_', lease=worker_lease)
+# Записи ставятся в очередь под storage_lock, а на диск попадают после
+# ее снятия: одновременные запросы делят одну запись (fsync / транзакцию)
+committer = GroupCommit(storage, window=GROUP_COMMIT_WINDOW)
+
+# Готовые ответы GET-запросов; версия растет при каждом изменении тренировок
+response_cache = ResponseCache(RESPONSE_CACHE_BYTES)
+# Версия для неизменных данных (MOCK_EVENTS, PREMIUM_TRAINING)
+STATIC_VERSION = -1
+
 # Mock данные мероприятий
 MOCK_EVENTS = [
     {
@@ -38,6 +143,15 @@ MOCK_EVENTS = [
     }
 ]
 
+# Координаты мероприятий для пакетного расчета расстояний
+mock_event_points = PointArray()
+mock_event_search = SearchIndex()
+mock_event_clusters = ClusterTree()
+for event in MOCK_EVENTS:
+    mock_event_points.upsert(event['id'], event['lat'], event['lng'])
+    mock_event_search.add(event['id'], event['title'], event['description'])
+    mock_event_clusters.add(event['lat'], event['lng'], event['sport'])
+
 # Премиум тренировка (только одна)
 PREMIUM_TRAINING = {
     "id": "premium_1",
@@ -58,77 +172,267 @@ PREMIUM_TRAINING = {
 }
 
 
-def load_data():
-    """Загрузка данных из файлов"""
-    global trainings_storage, training_participants
+def restore_snapshot(snapshot):
+    """Восстановление хранилищ из снапшота"""
+    global trainings_storage, training_participants, training_index, training_expiry, training_search, \
+        training_clusters
 
-    try:
-        # Загрузка тренировок
+    if snapshot is None:
+        snapshot = {"trainings": {}, "participants": {}}
+
+        # Миграция со старого формата
         if os.path.exists(TRAININGS_FILE):
             with open(TRAININGS_FILE, 'r', encoding='utf-8') as f:
-                trainings_storage = json.load(f)
-
-        # Загрузка участников
+                snapshot["trainings"] = json.load(f)
         if os.path.exists(PARTICIPANTS_FILE):
             with open(PARTICIPANTS_FILE, 'r', encoding='utf-8') as f:
-                training_participants = json.load(f)
+                snapshot["participants"] = json.load(f)
+
+    trainings_storage = {}
+    training_participants = {
+        training_id: Roster(participants)
+        for training_id, participants in snapshot.get("participants", {}).items()
+    }
+    training_index = GridIndex()
+    training_expiry = ExpiryQueue()
+    training_search = SearchIndex()
+    training_clusters = ClusterTree()
+    premium_training_ids.clear()
+    training_order.clear()
+    join_requests.clear()
+    request_order.clear()
+    training_requests.clear()
+    response_cache.bump()
+
+    for training in snapshot.get("trainings", {}).values():
+        put_training(training)
+    for join_request in snapshot.get("requests", ()):
+        if join_request['id'] in trainings_storage:
+            put_request(join_request)
+
+
+def apply_change(record):
+    """Применение записи журнала к хранилищам.
+
+    Записи других воркеров (sync_storage) публикуются в training_hub так
+    же, как свои: подписчики этого воркера видят все изменения."""
+    op = record['op']
+    training_id = record['id']
+
+    if op == 'create':
+        training = record['training']
+        created = training_id not in trainings_storage
+        put_training(training)
+        if created and not training.get('is_premium'):
+            training_hub.publish('training_created', training['lat'], training['lng'], training.get('sport'),
+                                 dict(training, participants_count=participants_count(training_id)))
+    elif op == 'join':
+        training = trainings_storage.get(training_id)
+        if training is None:
+            # Тренировка уже удалена: не создаем для нее пустой список участников
+            logger.debug(f"Skipping join for unknown training {training_id}")
+            return
+        participant = record['participant']
+        if add_participant(training_id, participant) and not training.get('is_premium'):
+            training_hub.publish('participant_joined', training['lat'], training['lng'], training.get('sport'), {
+                "id": training_id,
+                "participant": participant,
+                "participants_count": participants_count(training_id)
+            })
+    elif op == 'request':
+        training = trainings_storage.get(training_id)
+        if training is None:
+            logger.debug(f"Skipping join request for unknown training {training_id}")
+            return
+        if put_request(record['request']):
+            publish_request(training, record['request'])
+    elif op == 'remove':
+        training = trainings_storage.get(training_id)
+        drop_training(training_id)
+        if training is not None:
+            training_hub.publish('training_expired', training['lat'], training['lng'],
+                                 training.get('sport'), {"id": training_id})
+    else:
+        logger.warning(f"Unknown change log operation: {op}")
+
+
+def put_training(training):
+    """Добавить тренировку в хранилище и индексы"""
+    training_id = training['id']
+    old = trainings_storage.get(training_id)
+    if old is not None:
+        training_clusters.remove(old['lat'], old['lng'], old.get('sport'))
+    elif training_ids.timestamp(training_id) is not None:
+        bisect.insort(training_order, training_id)
+    trainings_storage[training_id] = training
+    response_cache.bump()
+    if training_id not in training_participants:
+        training_participants[training_id] = Roster()
+    training_search.add(training_id, training.get('title'), training.get('description'))
+    training_clusters.add(training['lat'], training['lng'], training.get('sport'))
+
+    if training.get('is_premium'):
+        premium_training_ids.add(training_id)
+        return
+
+    training_index.add(training_id, training['lat'], training['lng'], training.get('sport'))
+
+    # Время удаления разбирается один раз и хранится в записи
+    if 'expires_at' not in training:
+        training['expires_at'] = training_expires_at(training)
+    if training['expires_at'] is not None:
+        training_expiry.schedule(training_id, training['expires_at'])
+
+
+def drop_training(training_id):
+    """Удалить тренировку из хранилища и индексов"""
+    training = trainings_storage.pop(training_id, None)
+    if training is not None:
+        training_clusters.remove(training['lat'], training['lng'], training.get('sport'))
+        remove_sorted(training_order, training_id)
+    for request_id in training_requests.pop(training_id, {}).values():
+        join_requests.pop(request_id, None)
+        remove_sorted(request_order, request_id)
+    response_cache.bump()
+    training_participants.pop(training_id, None)
+    training_index.remove(training_id)
+    training_expiry.cancel(training_id)
+    training_search.remove(training_id)
+    premium_training_ids.discard(training_id)
+
+
+def remove_sorted(items, value):
+    """Убрать value из отсортированного списка, если он там есть"""
+    position = bisect.bisect_left(items, value)
+    if position < len(items) and items[position] == value:
+        del items[position]
+
+
+def put_request(join_request):
+    """Добавить запрос на участие, если от этого пользователя его еще нет.
+    Возвращает True при добавлении"""
+    request_id = join_request['request_id']
+    by_user = training_requests.setdefault(join_request['id'], {})
+    user_key = str(join_request['participant']['user_id'])
+    if user_key in by_user or request_id in join_requests:
+        return False
+    by_user[user_key] = request_id
+    join_requests[request_id] = join_request
+    bisect.insort(request_order, request_id)
+    return True
+
+
+def add_participant(training_id, participant):
+    """Добавить участника, если его еще нет. Возвращает True при добавлении"""
+    roster = training_participants.get(training_id)
+    if roster is None:
+        roster = training_participants[training_id] = Roster()
+
+    if not roster.add(participant):
+        return False
+    response_cache.bump()
+    return True
+
+
+def participants_count(training_id):
+    roster = training_participants.get(training_id)
+    return len(roster) if roster is not None else 0
+
+
+def storage_snapshot():
+    """Текущее состояние для записи снапшота"""
+    return {
+        "trainings": trainings_storage,
+        "participants": {training_id: roster.to_list() for training_id, roster in training_participants.items()},
+        "requests": [join_requests[request_id] for request_id in request_order],
+    }
+
+
+def load_data():
+    """Загрузка данных: снапшот + журнал изменений"""
+    try:
+        with storage_lock:
+            fresh = storage.load(restore_snapshot, apply_change)
+
+        # Хранилище пустое (или старый формат): сразу записываем снапшот
+        if fresh:
+            save_data()
 
         logger.info("Data loaded successfully")
 
     except Exception as e:
+        # Не продолжаем с пустым хранилищем: компакция затерла бы данные на диске
         logger.error(f"Error loading data: {str(e)}")
-        trainings_storage = {}
-        training_participants = {}
+        raise
 
 
 def save_data():
-    """Сохранение данных в файлы"""
+    """Компакция: полный снапшот данных, журнал изменений очищается"""
     try:
-        # Сохранение тренировок
-        with open(TRAININGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(trainings_storage, f, ensure_ascii=False, indent=2)
-
-        # Сохранение участников
-        with open(PARTICIPANTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(training_participants, f, ensure_ascii=False, indent=2)
-
+        storage.compact(storage_snapshot)
         logger.info("Data saved successfully")
 
     except Exception as e:
         logger.error(f"Error saving data: {str(e)}")
 
 
-def cleanup_old_trainings():
-    """Очистка тренировок старше 1 дня после окончания"""
-    current_time = datetime.now()
-    training_ids_to_remove = []
+def sync_storage():
+    """Применить изменения, сделанные другими воркерами (общее хранилище)"""
+    try:
+        storage.poll(restore_snapshot, apply_change)
+    except Exception as e:
+        logger.error(f"Error syncing storage: {str(e)}")
+
 
-    for training_id, training_data in trainings_storage.items():
-        # Пропускаем премиум тренировки
-        if training_data.get('is_premium'):
-            continue
+def training_expires_at(training):
+    """Момент удаления тренировки (epoch) или None"""
+    end_time_str = training.get('end_time') or training.get('start_time')
+    if not end_time_str:
+        return None
 
-        end_time_str = training_data.get('end_time') or training_data.get('start_time')
-        if end_time_str:
+    try:
+        return parse_timestamp(end_time_str) + EXPIRY_DELAY
+    except ValueError as e:
+        logger.warning(f"Invalid date format for training {training['id']}: {e}")
+        # Время создания есть в id; старые id - по created_at
+        created = training_ids.timestamp(training['id'])
+        if created is None:
+            created = parse_timestamp(training['created_at'])
+        return created + INVALID_DATE_EXPIRY_DELAY
+
+
+def cleanup_old_trainings():
+    """Очистка тренировок старше 1 дня после окончания, O(число истекших)"""
+    if not training_expiry.due():
+        return
+
+    with storage_lock:
+        records = []
+        for training_id in training_expiry.pop_expired():
+            training = trainings_storage.get(training_id)
+            drop_training(training_id)
+            records.append({"op": "remove", "id": training_id})
+            logger.info(f"Removed old training: {training_id}")
+
+            if training is not None:
+                training_hub.publish('training_expired', training['lat'], training['lng'],
+                                     training.get('sport'), {"id": training_id})
+        ticket = committer.submit(records)
+    with metrics.span('persist'):
+        ticket.wait()
+
+
+def start_expiry_sweeper(interval=SWEEP_INTERVAL):
+    """Фоновая очистка, чтобы истекшие тренировки удалялись и без запросов"""
+    def run():
+        while True:
+            time.sleep(interval)
             try:
-                end_time = datetime.fromisoformat(end_time_str.replace('Z', '+00:00'))
-                # Удаляем если прошло более 1 дня после окончания
-                if current_time - end_time > timedelta(days=1):
-                    training_ids_to_remove.append(training_id)
-            except ValueError as e:
-                logger.warning(f"Invalid date format for training {training_id}: {e}")
-                # Если дата некорректна, удаляем если создана более 2 дней назад
-                created_at = datetime.fromisoformat(training_data['created_at'].replace('Z', '+00:00'))
-                if current_time - created_at > timedelta(days=2):
-                    training_ids_to_remove.append(training_id)
-
-    for training_id in training_ids_to_remove:
-        trainings_storage.pop(training_id, None)
-        training_participants.pop(training_id, None)
-        logger.info(f"Removed old training: {training_id}")
-
-    if training_ids_to_remove:
-        save_data()
+                cleanup_old_trainings()
+            except Exception as e:
+                logger.error(f"Error cleaning up trainings: {str(e)}")
+
+    threading.Thread(target=run, name='expiry-sweeper', daemon=True).start()
 
 
 # Загружаем данные при старте
@@ -136,9 +440,36 @@ load_data()
 
 # Добавляем премиум тренировку если её нет
 if 'premium_1' not in trainings_storage:
-    trainings_storage['premium_1'] = PREMIUM_TRAINING
-    training_participants['premium_1'] = []
-    save_data()
+    with storage_lock:
+        put_training(PREMIUM_TRAINING)
+        storage.append('create', id='premium_1', training=PREMIUM_TRAINING)
+
+# Фоновая компакция журнала в снапшот
+storage.start_compactor(storage_snapshot, interval=COMPACT_INTERVAL)
+start_expiry_sweeper()
+
+
+def cached_json(key, build, version=None):
+    """JSON-ответ из кэша с ETag; build() строит данные при промахе -
+    объект или уже закодированный JSON (bytes).
+
+    version=None - текущая версия данных тренировок.
+    """
+    entry = response_cache.get(key, version)
+    if entry is None:
+        # Версию берем до построения: изменение во время build сделает запись устаревшей
+        if version is None:
+            version = response_cache.version
+        with metrics.span('filter'):
+            data = build()
+        with metrics.span('serialize'):
+            body = data if isinstance(data, bytes) else dumps(data)
+        entry = response_cache.put(key, body, version)
+
+    if etag_matches(request.headers.get('If-None-Match'), entry.etag):
+        response_cache.count_not_modified()
+        return Response(status=304, headers={'ETag': entry.etag})
+    return Response(entry.body, mimetype='application/json', headers={'ETag': entry.etag})
 
 
 @app.route('/')
@@ -151,19 +482,29 @@ def get_events():
     """API мероприятий"""
     try:
         sport = request.args.get('sport')
-        lat = request.args.get('lat', type=float)
-        lng = request.args.get('lng', type=float)
+        # Координаты привязываются к сетке, чтобы соседние запросы делили кэш
+        lat = snap(request.args.get('lat', type=float))
+        lng = snap(request.args.get('lng', type=float))
         radius = request.args.get('radius', type=int)
+        query = request.args.get('q', '').strip().lower()
+
+        def build():
+            events = MOCK_EVENTS.copy()
 
-        events = MOCK_EVENTS.copy()
+            matched = mock_event_search.search(query) if query else None
+            if matched is not None:
+                events = [e for e in events if e['id'] in matched]
 
-        if sport:
-            events = [e for e in events if e['sport'] == sport]
+            if lat and lng and radius:
+                nearby_ids = {event_id for event_id, _ in mock_event_points.within(lat, lng, radius)}
+                events = [e for e in events if e['id'] in nearby_ids]
 
-        if lat and lng and radius:
-            events = [e for e in events if calculate_distance(lat, lng, e['lat'], e['lng']) <= radius]
+            if sport:
+                events = [e for e in events if e['sport'] == sport]
 
-        return jsonify({"status": "success", "data": events})
+            return {"status": "success", "data": events}
+
+        return cached_json(('events', lat, lng, radius, sport, query), build, STATIC_VERSION)
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -172,41 +513,127 @@ def get_events():
 def get_trainings():
     """Получить тренировки поблизости"""
     try:
-        lat = request.args.get('lat', type=float)
-        lng = request.args.get('lng', type=float)
+        lat = snap(request.args.get('lat', type=float))
+        lng = snap(request.args.get('lng', type=float))
         radius = request.args.get('radius', default=5, type=int)
         sport = request.args.get('sport', '')
+        query = request.args.get('q', '').strip().lower()
 
-        # Очистка старых тренировок
-        cleanup_old_trainings()
+        # Снимаем только истекшие к этому моменту тренировки (обычно ни одной)
+        with metrics.span('cleanup'):
+            sync_storage()
+            cleanup_old_trainings()
 
-        nearby_trainings = []
+        # Большие выборки - потоком NDJSON, без кэша и сборки ответа в памяти
+        if wants_ndjson(request.headers.get('Accept'), request.args.get('format')):
+            matches = find_trainings(lat, lng, radius, sport, query)
+            return Response(iter_ndjson(encode_trainings(matches)), mimetype=NDJSON_CONTENT_TYPE)
 
-        for training_id, training_data in trainings_storage.items():
-            # Фильтр по виду спорта
-            if sport and training_data.get('sport') != sport:
-                continue
+        return cached_json(('trainings', lat, lng, radius, sport, query),
+                           lambda: envelope(encode_trainings(find_trainings(lat, lng, radius, sport, query))))
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def find_trainings(lat, lng, radius, sport, query):
+    """Пары (id, расстояние): премиум тренировки и обычные в радиусе"""
+    matches = []
 
-            # Для премиум тренировок не применяем фильтр по расстоянию
-            if training_data.get('is_premium'):
-                training_data_copy = training_data.copy()
-                training_data_copy['distance'] = 0
-                training_data_copy['participants_count'] = len(training_participants.get(training_id, []))
-                nearby_trainings.append(training_data_copy)
+    with storage_lock:
+        # Поиск по названию и описанию, None - без фильтра
+        matched = training_search.search(query) if query else None
+
+        # Для премиум тренировок не применяем фильтр по расстоянию
+        for training_id in premium_training_ids:
+            if sport and trainings_storage[training_id].get('sport') != sport:
+                continue
+            if matched is not None and training_id not in matched:
                 continue
+            matches.append((training_id, 0))
+
+        # Обычные тренировки: только ячейки сетки, пересекающие радиус
+        if lat and lng:
+            for training_id, distance in training_index.nearby(lat, lng, radius, sport):
+                if matched is not None and training_id not in matched:
+                    continue
+                matches.append((training_id, round(distance, 2)))
+
+    return matches
+
+
+def encode_trainings(matches):
+    """JSON найденных тренировок по одной, с distance и participants_count.
+
+    Поля дописываются при кодировании, запись не копируется. Блокировка
+    берется на каждую запись, а не на весь поток: тренировки, удаленные
+    после поиска, пропускаются.
+    """
+    for training_id, distance in matches:
+        with storage_lock:
+            training = trainings_storage.get(training_id)
+            encoded = None if training is None else dumps_overlay(
+                training, {"distance": distance, "participants_count": participants_count(training_id)})
+        if encoded is not None:
+            yield encoded
+
+
+@app.route('/api/clusters', methods=['GET'])
+def get_clusters():
+    """Кластеры маркеров для области карты: bbox=west,south,east,north, zoom,
+    layer=trainings (по умолчанию) или events"""
+    try:
+        bbox = parse_bbox(request.args.get('bbox', '-180,-90,180,90'))
+        zoom = request.args.get('zoom', default=0, type=int)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-            # Фильтр по расстоянию для обычных тренировок
-            if lat and lng:
-                distance = calculate_distance(lat, lng, training_data["lat"], training_data["lng"])
-                if distance <= radius:
-                    training_data_copy = training_data.copy()
-                    training_data_copy['distance'] = round(distance, 2)
-                    training_data_copy['participants_count'] = len(training_participants.get(training_id, []))
-                    nearby_trainings.append(training_data_copy)
+    layer = request.args.get('layer', 'trainings')
+    if layer == 'events':
+        return cached_json(('clusters', layer, bbox, zoom),
+                           lambda: {"status": "success", "data": mock_event_clusters.clusters(bbox, zoom)},
+                           STATIC_VERSION)
+    if layer != 'trainings':
+        return jsonify({"status": "error", "message": f"Unknown layer: {layer}"}), 400
 
-        return jsonify({"status": "success", "data": nearby_trainings})
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+    sync_storage()
+
+    def build():
+        with storage_lock:
+            return {"status": "success", "data": training_clusters.clusters(bbox, zoom)}
+
+    return cached_json(('clusters', layer, bbox, zoom), build)
+
+
+@app.route('/api/trainings/stream', methods=['GET'])
+def stream_trainings():
+    """Поток изменений тренировок в области (Server-Sent Events).
+
+    Выключен, пока не задан TRAININGS_STREAM: тогда 404, и клиент
+    обновляет список запросами."""
+    if not TRAININGS_STREAM:
+        return jsonify({"status": "error", "message": "Trainings stream is disabled"}), 404
+
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius = request.args.get('radius', default=5, type=float)
+    sport = request.args.get('sport', '')
+
+    if lat is None or lng is None:
+        return jsonify({"status": "error", "message": "lat and lng are required"}), 400
+
+    subscription = training_hub.subscribe(ThreadSubscription(lat, lng, radius, sport))
+
+    def generate():
+        try:
+            yield ": connected\n\n"
+            while True:
+                message = subscription.get(timeout=STREAM_HEARTBEAT)
+                yield format_sse(message) if message else ": ping\n\n"
+        finally:
+            training_hub.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/api/trainings', methods=['POST'])
@@ -214,42 +641,20 @@ def create_training():
     """Создать новую тренировку"""
     try:
         data = request.get_json()
-        print("Received training data:", data)
+        logger.debug(f"Received training data: {data}")
 
         # Валидация данных
-        required_fields = ['user_id', 'title', 'sport', 'lat', 'lng', 'start_time']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({"status": "error", "message": f"Missing required field: {field}"}), 400
+        error = validate_training(data)
+        if error:
+            return jsonify({"status": "error", "message": error}), 400
 
-        training_id = f"training_{int(datetime.now().timestamp())}"
+        training_id = training_ids.next_id()
+        training_data = make_training(training_id, data)
 
-        training_data = {
-            "id": training_id,
-            "user_id": data['user_id'],
-            "title": data['title'],
-            "description": data.get('description', ''),
-            "sport": data['sport'],
-            "lat": float(data['lat']),
-            "lng": float(data['lng']),
-            "start_time": data['start_time'],
-            "end_time": data.get('end_time'),
-            "comment": data.get('comment', ''),
-            "auto_accept": data.get('auto_accept', True),
-            "created_at": datetime.now().isoformat(),
-            "user_name": data['user_name'],
-            "user_photo": data.get('user_photo'),
-            "is_premium": False
-        }
-
-        trainings_storage[training_id] = training_data
-        training_participants[training_id] = []
-
-        # Автоматически добавляем создателя как участника
-        join_training(training_id, data['user_id'], data['user_name'], data.get('user_photo'))
-
-        # Сохраняем данные
-        save_data()
+        with storage_lock:
+            ticket = committer.submit(insert_training(training_data))
+        with metrics.span('persist'):
+            ticket.wait()
 
         logger.info(f"Training created successfully: {training_id}")
 
@@ -265,12 +670,114 @@ def create_training():
         return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
 
 
+@app.route('/api/trainings:batch', methods=['POST'])
+def create_trainings_batch():
+    """Создать несколько тренировок: {"trainings": [...]}.
+
+    Сначала проверяются все элементы; при любой ошибке не создается
+    ни одна тренировка. Все тренировки пишутся одной записью журнала.
+    """
+    try:
+        items, error = batch_items(request.get_json(silent=True), 'trainings')
+        if error:
+            return jsonify({"status": "error", "message": error}), 400
+
+        errors = [{"index": n, "message": message}
+                  for n, message in enumerate(map(validate_training, items)) if message]
+        if errors:
+            return jsonify({"status": "error", "message": "Validation failed", "errors": errors}), 400
+
+        trainings = [make_training(training_ids.next_id(), data) for data in items]
+
+        with storage_lock:
+            records = []
+            for training_data in trainings:
+                records.extend(insert_training(training_data))
+            ticket = committer.submit(records)
+        with metrics.span('persist'):
+            ticket.wait()
+
+        logger.info(f"Created {len(trainings)} trainings in a batch")
+
+        return jsonify({
+            "status": "success",
+            "training_ids": [training['id'] for training in trainings],
+            "data": trainings
+        })
+
+    except Exception as e:
+        logger.error(f"Error creating trainings batch: {str(e)}")
+        return jsonify({"status": "error", "message": f"Server error: {str(e)}"}), 500
+
+
+def batch_items(data, key):
+    """Список элементов пакета из тела запроса и сообщение об ошибке"""
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, f"Field '{key}' must be a non-empty list"
+    if len(items) > MAX_BATCH_SIZE:
+        return None, f"At most {MAX_BATCH_SIZE} items per batch"
+    return items, None
+
+
+def validate_training(data):
+    """Сообщение об ошибке в данных тренировки или None"""
+    if not isinstance(data, dict):
+        return "Training must be an object"
+    for field in TRAINING_REQUIRED_FIELDS:
+        if not data.get(field):
+            return f"Missing required field: {field}"
+    try:
+        float(data['lat'])
+        float(data['lng'])
+    except (TypeError, ValueError):
+        return "Fields lat and lng must be numbers"
+    return None
+
+
+def make_training(training_id, data):
+    """Запись тренировки из проверенных данных запроса"""
+    return {
+        "id": training_id,
+        "user_id": data['user_id'],
+        "title": data['title'],
+        "description": data.get('description', ''),
+        "sport": data['sport'],
+        "lat": float(data['lat']),
+        "lng": float(data['lng']),
+        "start_time": data['start_time'],
+        "end_time": data.get('end_time'),
+        "comment": data.get('comment', ''),
+        "auto_accept": data.get('auto_accept', True),
+        "created_at": datetime.now().isoformat(),
+        "user_name": data['user_name'],
+        "user_photo": data.get('user_photo'),
+        "is_premium": False
+    }
+
+
+def insert_training(training_data):
+    """Под storage_lock: тренировка и ее создатель-участник. Возвращает записи журнала"""
+    training_id = training_data['id']
+    put_training(training_data)
+    records = [{"op": "create", "id": training_id, "training": training_data}]
+
+    # Автоматически добавляем создателя как участника
+    records.extend(add_join(training_id, training_data['user_id'], training_data['user_name'],
+                            training_data['user_photo'], notify=False))
+
+    training_hub.publish('training_created', training_data['lat'], training_data['lng'], training_data['sport'],
+                         dict(training_data, participants_count=participants_count(training_id)))
+    return records
+
+
 @app.route('/api/trainings/<training_id>/join', methods=['POST'])
 def join_training_endpoint(training_id):
     """Присоединиться к тренировке"""
     try:
         data = request.get_json()
 
+        sync_storage()
         if training_id not in trainings_storage:
             return jsonify({"status": "error", "message": "Тренировка не найдена"}), 404
 
@@ -279,39 +786,204 @@ def join_training_endpoint(training_id):
         # Проверка авто-принятия
         if training['auto_accept']:
             join_training(training_id, data['user_id'], data['user_name'], data.get('user_photo'))
-            save_data()  # Сохраняем после добавления участника
             return jsonify({"status": "success", "message": "Вы присоединились к тренировке"})
         else:
+            request_join(training, data['user_id'], data['user_name'], data.get('user_photo'))
             return jsonify({"status": "success", "message": "Запрос на участие отправлен организатору"})
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
-def join_training(training_id, user_id, user_name, user_photo):
+@app.route('/api/trainings/joins:batch', methods=['POST'])
+def join_trainings_batch():
+    """Несколько присоединений: {"joins": [{"training_id", "user_id", "user_name", "user_photo"}, ...]}.
+
+    Проверка и применение идут под одной блокировкой: при любой ошибке
+    не применяется ничего. results - joined, already_joined или requested
+    (тренировка без авто-принятия) для каждого элемента.
+    """
+    try:
+        items, error = batch_items(request.get_json(silent=True), 'joins')
+        if error:
+            return jsonify({"status": "error", "message": error}), 400
+
+        sync_storage()
+        with storage_lock:
+            errors = []
+            for n, item in enumerate(items):
+                if not isinstance(item, dict):
+                    errors.append({"index": n, "message": "Join must be an object"})
+                elif not item.get('user_id') or not item.get('user_name'):
+                    errors.append({"index": n, "message": "Missing required field: user_id or user_name"})
+                elif item.get('training_id') not in trainings_storage:
+                    errors.append({"index": n, "message": "Тренировка не найдена"})
+            if errors:
+                return jsonify({"status": "error", "message": "Validation failed", "errors": errors}), 400
+
+            records = []
+            results = []
+            for item in items:
+                training_id = item['training_id']
+                training = trainings_storage[training_id]
+                if not training['auto_accept']:
+                    records.extend(add_request(training, item['user_id'], item['user_name'], item.get('user_photo')))
+                    results.append("requested")
+                    continue
+                joined = add_join(training_id, item['user_id'], item['user_name'], item.get('user_photo'))
+                records.extend(joined)
+                results.append("joined" if joined else "already_joined")
+            ticket = committer.submit(records)
+        with metrics.span('persist'):
+            ticket.wait()
+
+        return jsonify({"status": "success", "results": results})
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+def request_join(training, user_id, user_name, user_photo):
+    """Запрос на участие в тренировке без авто-принятия: запись в журнале
+    и событие join_requested, по которым бот уведомляет организатора"""
+    with storage_lock:
+        ticket = committer.submit(add_request(training, user_id, user_name, user_photo))
+    with metrics.span('persist'):
+        ticket.wait()
+
+
+def add_request(training, user_id, user_name, user_photo):
+    """Под storage_lock: запрос на участие. Возвращает записи журнала
+    (пустой список, если пользователь уже отправил запрос)"""
+    if str(user_id) in training_requests.get(training['id'], ()):
+        return []
+    join_request = {
+        "request_id": training_ids.next_id(REQUEST_PREFIX),
+        "id": training['id'],
+        "title": training['title'],
+        "organizer_id": training.get('user_id'),
+        "participant": {"user_id": user_id, "user_name": user_name, "user_photo": user_photo}
+    }
+    put_request(join_request)
+    publish_request(training, join_request)
+    return [{"op": "request", "id": training['id'], "request": join_request}]
+
+
+def publish_request(training, join_request):
+    training_hub.publish('join_requested', training['lat'], training['lng'], training.get('sport'), join_request)
+
+
+def join_training(training_id, user_id, user_name, user_photo, notify=True):
     """Вспомогательная функция для присоединения к тренировке"""
-    if training_id not in training_participants:
-        training_participants[training_id] = []
+    with storage_lock:
+        ticket = committer.submit(add_join(training_id, user_id, user_name, user_photo, notify))
+    with metrics.span('persist'):
+        ticket.wait()
 
-    # Проверяем, не является ли пользователь уже участником
-    for participant in training_participants[training_id]:
-        if participant['user_id'] == user_id:
-            return
 
-    training_participants[training_id].append({
+def add_join(training_id, user_id, user_name, user_photo, notify=True):
+    """Под storage_lock: добавить участника. Возвращает записи журнала
+    (пустой список, если пользователь уже участвует)"""
+    participant = {
         "user_id": user_id,
         "user_name": user_name,
         "user_photo": user_photo,
         "joined_at": datetime.now().isoformat()
-    })
+    }
+
+    if not add_participant(training_id, participant):
+        return []
+
+    training = trainings_storage.get(training_id)
+    if notify and training is not None and not training.get('is_premium'):
+        training_hub.publish('participant_joined', training['lat'], training['lng'], training.get('sport'), {
+            "id": training_id,
+            "participant": participant,
+            "participants_count": participants_count(training_id)
+        })
+    return [{"op": "join", "id": training_id, "participant": participant}]
+
+
+def recent_page_args():
+    """(after, since, limit) выборки по времени создания или сообщение об ошибке"""
+    after = request.args.get('after')
+    since = request.args.get('since', type=float)
+    limit = max(1, min(request.args.get('limit', default=DEFAULT_PAGE_SIZE, type=int), MAX_BATCH_SIZE))
+    if not after and since is None:
+        return None, "after or since is required"
+    return (after, since, limit), None
+
+
+def recent_page(order, after, since, limit, prefix):
+    """Под storage_lock: id из отсортированного order после after (или
+    созданные не раньше since) и курсор следующей страницы. id упорядочены
+    по времени, поэтому страница - срез списка, без разбора дат"""
+    if after:
+        start = bisect.bisect_right(order, after)
+    else:
+        start = bisect.bisect_left(order, training_ids.lower_bound(since, prefix))
+    page = order[start:start + limit]
+    return page, page[-1] if start + limit < len(order) else None
+
+
+@app.route('/api/trainings/recent', methods=['GET'])
+def get_recent_trainings():
+    """Тренировки по времени создания: after - id последней полученной
+    тренировки (next_cursor из ответа) или since - момент (epoch), limit -
+    размер страницы"""
+    try:
+        args, error = recent_page_args()
+        if error:
+            return jsonify({"status": "error", "message": error}), 400
+
+        sync_storage()
+        cleanup_old_trainings()
+        with storage_lock:
+            page, next_cursor = recent_page(training_order, *args, training_ids.prefix)
+            trainings = [dict(trainings_storage[training_id], participants_count=participants_count(training_id))
+                         for training_id in page]
+
+        return jsonify({"status": "success", "data": trainings, "next_cursor": next_cursor})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@app.route('/api/trainings/join-requests', methods=['GET'])
+def get_recent_join_requests():
+    """Запросы на участие по времени отправки, параметры как у
+    /api/trainings/recent; after - request_id последнего полученного.
+    Запросы живут, пока существует тренировка"""
+    try:
+        args, error = recent_page_args()
+        if error:
+            return jsonify({"status": "error", "message": error}), 400
+
+        sync_storage()
+        cleanup_old_trainings()
+        with storage_lock:
+            page, next_cursor = recent_page(request_order, *args, REQUEST_PREFIX)
+            requests = [join_requests[request_id] for request_id in page]
+
+        return jsonify({"status": "success", "data": requests, "next_cursor": next_cursor})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
 
 
 @app.route('/api/trainings/<training_id>/participants', methods=['GET'])
 def get_training_participants(training_id):
-    """Получить список участников тренировки"""
+    """Участники тренировки по страницам: cursor - next_cursor из ответа
+    (joined_at и user_id последнего участника страницы), limit - размер"""
     try:
-        participants = training_participants.get(training_id, [])
-        return jsonify({"status": "success", "data": participants})
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', default=DEFAULT_PAGE_SIZE, type=int)
+
+        sync_storage()
+        with storage_lock:
+            roster = training_participants.get(training_id) or Roster()
+            participants, next_cursor = roster.page(cursor, limit)
+            total = len(roster)
+
+        return jsonify({"status": "success", "data": participants, "total": total, "next_cursor": next_cursor})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -321,39 +993,101 @@ def update_user_location():
     """Обновить местоположение пользователя"""
     try:
         data = request.get_json()
+        set_user_location(data)
+        return jsonify({"status": "success", "message": "Location updated"})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-        user_locations[data['user_id']] = {
-            "user_id": data['user_id'],
-            "lat": data['lat'],
-            "lng": data['lng'],
-            "last_updated": datetime.now()
-        }
 
-        return jsonify({"status": "success", "message": "Location updated"})
+@app.route('/api/users/locations:batch', methods=['POST'])
+def update_user_locations_batch():
+    """Обновить местоположения нескольких пользователей: {"locations": [...]}"""
+    try:
+        items, error = batch_items(request.get_json(silent=True), 'locations')
+        if error:
+            return jsonify({"status": "error", "message": error}), 400
+
+        errors = [{"index": n, "message": "Fields user_id, lat and lng are required"}
+                  for n, item in enumerate(items)
+                  if not isinstance(item, dict) or item.get('user_id') is None
+                  or item.get('lat') is None or item.get('lng') is None]
+        if errors:
+            return jsonify({"status": "error", "message": "Validation failed", "errors": errors}), 400
+
+        for item in items:
+            set_user_location(item)
+        return jsonify({"status": "success", "message": f"Updated {len(items)} locations"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def set_user_location(data):
+    user_locations[data['user_id']] = {
+        "user_id": data['user_id'],
+        "lat": data['lat'],
+        "lng": data['lng'],
+        "last_updated": datetime.now()
+    }
+
+
 @app.route('/api/premium-training', methods=['GET'])
 def get_premium_training():
     """Получить премиум тренировку"""
-    return jsonify({"status": "success", "data": PREMIUM_TRAINING})
+    return cached_json(('premium',), lambda: {"status": "success", "data": PREMIUM_TRAINING}, STATIC_VERSION)
 
 
-@app.route('/api/debug/trainings', methods=['GET'])
-def debug_trainings():
-    """Отладочный endpoint для просмотра всех тренировок"""
-    return jsonify({
-        "status": "success",
-        "trainings_count": len(trainings_storage),
-        "trainings": trainings_storage,
-        "participants": training_participants
-    })
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Гистограммы запросов и участков в формате Prometheus"""
+    return Response(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.route('/metrics/profile', methods=['GET'])
+def get_profile():
+    """Свернутые стеки самых медленных запросов (PROFILE_SLOW_REQUESTS)"""
+    return Response(metrics.render_profile(), mimetype='text/plain')
 
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Расчет расстояния между точками (в км)"""
-    return ((lat1 - lat2) ** 2 + (lon1 - lon2) ** 2) ** 0.5 * 111
+@app.route('/api/debug/cache', methods=['GET'])
+def debug_cache():
+    """Попадания и промахи кэша ответов"""
+    return jsonify({"status": "success", "data": response_cache.stats()})
+
+
+@app.route('/api/debug/trainings', methods=['GET'])
+def debug_trainings():
+    """Отладочный endpoint для просмотра всех тренировок.
+
+    Ответ уходит потоком по записям, поэтому память не зависит от
+    числа тренировок; удаленные во время выдачи пропускаются.
+    """
+    sync_storage()
+    with storage_lock:
+        stored_ids = list(trainings_storage)
+
+    def encoded(encode):
+        for training_id in stored_ids:
+            with storage_lock:
+                value = encode(training_id)
+            if value is not None:
+                yield training_id, value
+
+    def encode_training(training_id):
+        training = trainings_storage.get(training_id)
+        return dumps(training) if training is not None else None
+
+    def encode_roster(training_id):
+        roster = training_participants.get(training_id)
+        return dumps(roster.to_list()) if roster is not None else None
+
+    def generate():
+        yield b'{"status":"success","trainings_count":' + str(len(stored_ids)).encode() + b',"trainings":'
+        yield from iter_object(encoded(encode_training))
+        yield b',"participants":'
+        yield from iter_object(encoded(encode_roster))
+        yield b'}'
+
+    return Response(generate(), mimetype='application/json')
 
 
 if __name__ == "__main__":
@@ -3,12 +3,24 @@ import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 
+from notifications import API_URL, Notifier
+from watcher import NOTIFY_RADIUS_KM, TrainingWatcher
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 BOT_TOKEN = os.environ.get("BOT_TOKEN", "7564444541:AAF4H4vv1m7JwE24v5Cqwe9SpQniZvUg8bo")
 WEB_APP_URL = "https://вашusername.github.io/вашрепозиторий"  # ЗАМЕНИТЕ
 
+# Уведомления: поток тренировок flask_app и поиск людей рядом в users-service.
+# Без TRAININGS_API_URL бот только отвечает на команды
+TRAININGS_API_URL = os.environ.get("TRAININGS_API_URL")
+USERS_API_URL = os.environ.get("USERS_API_URL")
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", API_URL)
+NOTIFY_RADIUS = float(os.environ.get("NOTIFY_RADIUS_KM", NOTIFY_RADIUS_KM))
+CONCURRENT_UPDATES = 32  # апдейтов, обрабатываемых одновременно
+CONNECTION_POOL_SIZE = 64  # соединений к Bot API у обработчиков апдейтов
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
@@ -51,8 +63,40 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+async def start_notifications(application: Application):
+    if not TRAININGS_API_URL:
+        logger.info("TRAININGS_API_URL is not set, notifications are disabled")
+        return
+
+    notifier = Notifier(BOT_TOKEN, api_url=TELEGRAM_API_URL)
+    watcher = TrainingWatcher(notifier, TRAININGS_API_URL, USERS_API_URL, radius_km=NOTIFY_RADIUS)
+    await notifier.start()
+    await watcher.start()
+    application.bot_data['notifier'] = notifier
+    application.bot_data['watcher'] = watcher
+
+
+async def stop_notifications(application: Application):
+    watcher = application.bot_data.pop('watcher', None)
+    if watcher is not None:
+        await watcher.close()
+    notifier = application.bot_data.pop('notifier', None)
+    if notifier is not None:
+        await notifier.close()
+
+
 def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+        # Апдейты разных пользователей обрабатываются параллельно
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .connection_pool_size(CONNECTION_POOL_SIZE)
+        .post_init(start_notifications)
+        .post_shutdown(stop_notifications)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CallbackQueryHandler(button_handler))
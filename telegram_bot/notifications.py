@@ -0,0 +1,254 @@
+# telegram_bot/notifications.py
+"""Очередь уведомлений Telegram
+
+Уведомления отправляют несколько задач-воркеров через общий пул
+HTTP-соединений. Частота ограничена по лимитам Telegram: не больше
+одного сообщения в секунду в чат и ~30 сообщений в секунду на бота.
+Уведомление с тем же ключом, что уже ждет отправки или недавно ушло,
+склеивается с ним. Ошибки сети и 5xx повторяются с экспоненциальной
+задержкой, на 429 бот ждет retry_after из ответа.
+"""
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+API_URL = "https://api.telegram.org"
+WORKERS = 8
+QUEUE_SIZE = 10000
+GLOBAL_RATE = 30  # сообщений в секунду на бота
+CHAT_INTERVAL = 1.0  # секунд между сообщениями в один чат
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.5  # секунд перед первым повтором, дальше вдвое больше
+BACKOFF_MAX = 30.0
+DEDUP_TTL = 600  # секунд, в течение которых повтор с тем же ключом не отправляется
+
+
+class Notification:
+    __slots__ = ('chat_id', 'text', 'key', 'attempts')
+
+    def __init__(self, chat_id, text, key):
+        self.chat_id = chat_id
+        self.text = text
+        self.key = key
+        self.attempts = 0
+
+
+class RateLimiter:
+    """Минимальный интервал между сообщениями в чат и общий темп бота.
+
+    Общий слот резервируется сразу, без ожидания между проверкой и
+    записью, поэтому в одном цикле asyncio блокировка для него не нужна.
+    Сообщения одного чата получают слоты по очереди: следующее ждет
+    chat_interval от фактического времени отправки предыдущего.
+    """
+
+    def __init__(self, rate=GLOBAL_RATE, chat_interval=CHAT_INTERVAL, clock=time.monotonic):
+        self.interval = 1 / rate
+        self.chat_interval = chat_interval
+        self.clock = clock
+        self._chat_next = {}
+        self._chat_locks = {}
+        self._global_next = 0.0
+
+    async def acquire(self, chat_id):
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = self._chat_locks[chat_id] = asyncio.Lock()
+        async with lock:
+            now = self.clock()
+            start = self._chat_next.get(chat_id, 0.0)
+            if start > now:
+                await asyncio.sleep(start - now)
+
+            # Общий слот берется, когда чат уже свободен: ожидание одного чата
+            # не сдвигает очередь остальных
+            now = self.clock()
+            start = max(now, self._global_next)
+            self._global_next = start + self.interval
+            if start > now:
+                await asyncio.sleep(start - now)
+            self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), self.clock() + self.chat_interval)
+
+    def pause_chat(self, chat_id, seconds):
+        """Telegram ответил 429: не писать в чат seconds секунд"""
+        self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), self.clock() + seconds)
+
+    def forget_idle(self):
+        """Удалить чаты, для которых ограничение уже не действует"""
+        now = self.clock()
+        for chat_id in [chat_id for chat_id, ready in self._chat_next.items() if ready <= now]:
+            del self._chat_next[chat_id]
+            lock = self._chat_locks.get(chat_id)
+            if lock is not None and not lock.locked():
+                del self._chat_locks[chat_id]
+
+
+class Notifier:
+    """Асинхронная отправка sendMessage с ограничениями и повторами.
+
+    submit() ставит уведомление в ограниченную очередь (и ждет места,
+    если она полна); start() / close() запускают и останавливают воркеров.
+    """
+
+    def __init__(self, token, api_url=API_URL, workers=WORKERS, queue_size=QUEUE_SIZE,
+                 limiter=None, max_attempts=MAX_ATTEMPTS, backoff_base=BACKOFF_BASE,
+                 dedup_ttl=DEDUP_TTL, client=None):
+        self.url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.workers = workers
+        self.limiter = limiter or RateLimiter()
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.dedup_ttl = dedup_ttl
+        self._client = client
+        self._own_client = client is None
+        self._queue = asyncio.Queue(queue_size)
+        # ключ -> уведомление, еще не отправленное (в очереди или ждет повтора)
+        self._pending = {}
+        # ключ -> момент отправки, для склейки повторов после отправки
+        self._sent_keys = {}
+        self._sent_limit = QUEUE_SIZE
+        self._tasks = []
+        self._retries = set()
+        self.stats = {"submitted": 0, "coalesced": 0, "sent": 0, "retried": 0, "failed": 0}
+
+    async def start(self):
+        if self._client is None:
+            # Один пул соединений на всех воркеров
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(10.0),
+                limits=httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers),
+            )
+        self._tasks = [asyncio.create_task(self._work(), name=f"notifier-{n}") for n in range(self.workers)]
+
+    async def close(self, timeout=10.0):
+        """Дождаться отправки очереди (не дольше timeout) и остановиться"""
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {len(self._pending)} undelivered notifications on shutdown")
+        for task in self._tasks + list(self._retries):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retries, return_exceptions=True)
+        self._tasks = []
+        if self._own_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def drain(self):
+        """Дождаться, пока не останется неотправленных уведомлений"""
+        while self._pending:
+            await self._queue.join()
+            if self._retries:
+                await asyncio.gather(*self._retries, return_exceptions=True)
+
+    async def submit(self, chat_id, text, key=None):
+        """Поставить уведомление в очередь. False, если оно склеено с уже
+        ожидающим (текст обновляется) или с недавно отправленным"""
+        self.stats["submitted"] += 1
+        if key is not None:
+            key = (chat_id, key)
+            pending = self._pending.get(key)
+            if pending is not None:
+                pending.text = text
+                self.stats["coalesced"] += 1
+                return False
+            sent_at = self._sent_keys.get(key)
+            if sent_at is not None and time.monotonic() - sent_at < self.dedup_ttl:
+                self.stats["coalesced"] += 1
+                return False
+
+        notification = Notification(chat_id, text, key)
+        self._pending[key or id(notification)] = notification
+        await self._queue.put(notification)
+        return True
+
+    async def _work(self):
+        while True:
+            notification = await self._queue.get()
+            try:
+                await self._deliver(notification)
+            except Exception as e:
+                logger.error(f"Error delivering notification to {notification.chat_id}: {str(e)}")
+                self._finish(notification, sent=False)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, notification):
+        await self.limiter.acquire(notification.chat_id)
+        notification.attempts += 1
+
+        try:
+            response = await self._client.post(self.url, json={
+                "chat_id": notification.chat_id,
+                "text": notification.text,
+                "disable_web_page_preview": True,
+            })
+        except httpx.TransportError as e:
+            self._retry(notification, self._backoff(notification), f"network error: {str(e)}")
+            return
+
+        if response.status_code == 200:
+            self._finish(notification, sent=True)
+        elif response.status_code == 429:
+            retry_after = self._retry_after(response)
+            self.limiter.pause_chat(notification.chat_id, retry_after)
+            self._retry(notification, retry_after, "rate limited")
+        elif response.status_code >= 500:
+            self._retry(notification, self._backoff(notification), f"HTTP {response.status_code}")
+        else:
+            # 400 / 403: чат недоступен или бот заблокирован - повтор не поможет
+            logger.warning(f"Telegram rejected notification to {notification.chat_id}: "
+                           f"HTTP {response.status_code} {response.text[:200]}")
+            self._finish(notification, sent=False)
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return float(response.json()["parameters"]["retry_after"])
+        except (ValueError, KeyError, TypeError):
+            return CHAT_INTERVAL
+
+    def _backoff(self, notification):
+        delay = min(self.backoff_base * 2 ** (notification.attempts - 1), BACKOFF_MAX)
+        return delay * random.uniform(0.5, 1.0)
+
+    def _retry(self, notification, delay, reason):
+        if notification.attempts >= self.max_attempts:
+            logger.error(f"Giving up on notification to {notification.chat_id} after "
+                         f"{notification.attempts} attempts: {reason}")
+            self._finish(notification, sent=False)
+            return
+
+        self.stats["retried"] += 1
+        logger.info(f"Retrying notification to {notification.chat_id} in {delay:.1f}s: {reason}")
+
+        async def later():
+            await asyncio.sleep(delay)
+            await self._queue.put(notification)
+
+        task = asyncio.create_task(later())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    def _finish(self, notification, sent):
+        self._pending.pop(notification.key or id(notification), None)
+        if sent:
+            self.stats["sent"] += 1
+            if notification.key is not None:
+                self._sent_keys[notification.key] = time.monotonic()
+                if len(self._sent_keys) > self._sent_limit:
+                    self._forget_sent()
+        else:
+            self.stats["failed"] += 1
+
+    def _forget_sent(self):
+        cutoff = time.monotonic() - self.dedup_ttl
+        self._sent_keys = {key: sent_at for key, sent_at in self._sent_keys.items() if sent_at >= cutoff}
+        # Следующая чистка - когда словарь снова вырастет вдвое
+        self._sent_limit = max(QUEUE_SIZE, 2 * len(self._sent_keys))
+        self.limiter.forget_idle()
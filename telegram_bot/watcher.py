@@ -0,0 +1,177 @@
+# telegram_bot/watcher.py
+"""Источник уведомлений: поток изменений тренировок flask_app
+
+Бот подписывается на /api/trainings/stream на весь земной шар и
+превращает события в уведомления:
+
+* training_created - пользователям рядом (users-service), у которых
+  совпадает вид спорта, кроме самого организатора;
+* join_requested - организатору тренировки без авто-принятия.
+
+Тренировки и запросы на участие, пропущенные, пока поток был разорван,
+догоняются по /api/trainings/recent и /api/trainings/join-requests после
+последнего полученного id. Если поток на сервере выключен
+(TRAININGS_STREAM), оба списка опрашиваются раз в POLL_INTERVAL.
+"""
+import asyncio
+import json
+import logging
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_RADIUS_KM = 10
+# Радиус подписки, покрывающий всю Землю (половина окружности, км)
+WORLD_RADIUS_KM = 20040
+RECONNECT_MIN = 1.0
+RECONNECT_MAX = 60.0
+# Сервер шлет keep-alive раз в 15 секунд; дольше тишины - разрыв
+STREAM_READ_TIMEOUT = 60.0
+# Секунд между опросами новых тренировок и запросов, когда поток выключен
+POLL_INTERVAL = 30.0
+RECENT_PAGE_SIZE = 100
+
+
+async def aiter_sse(lines):
+    """События (type, data) из строк text/event-stream (response.aiter_lines())"""
+    event = 'message'
+    data = []
+    async for line in lines:
+        if not line:
+            if data:
+                yield event, '\n'.join(data)
+            event = 'message'
+            data = []
+        elif line.startswith(':'):
+            continue
+        else:
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'event':
+                event = value
+            elif field == 'data':
+                data.append(value)
+
+
+class TrainingWatcher:
+    """Читает поток тренировок и ставит уведомления в Notifier"""
+
+    def __init__(self, notifier, trainings_url, users_url, radius_km=NOTIFY_RADIUS_KM, client=None):
+        self.notifier = notifier
+        self.trainings_url = trainings_url.rstrip('/')
+        self.users_url = users_url.rstrip('/') if users_url else None
+        self.radius_km = radius_km
+        self._client = client
+        self._own_client = client is None
+        self._task = None
+        # id последней разосланной тренировки и последнего запроса на
+        # участие; до первых - момент запуска
+        self._last_id = None
+        self._last_request_id = None
+        self._since = time.time()
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=STREAM_READ_TIMEOUT))
+        self._task = asyncio.create_task(self.run(), name='training-watcher')
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._own_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def run(self):
+        """Читать поток, переподключаясь с растущей паузой"""
+        delay = RECONNECT_MIN
+        params = {"lat": 0, "lng": 0, "radius": WORLD_RADIUS_KM}
+        while True:
+            try:
+                async with self._client.stream('GET', f"{self.trainings_url}/api/trainings/stream",
+                                               params=params) as response:
+                    polling = response.status_code == 404
+                    if not polling:
+                        response.raise_for_status()
+                        logger.info("Subscribed to training stream")
+                        delay = RECONNECT_MIN
+                        # Догон после подписки: тренировка из обоих источников
+                        # уведомляется один раз (ключ в Notifier)
+                        await self.catch_up()
+                        async for event, data in aiter_sse(response.aiter_lines()):
+                            await self.handle(event, json.loads(data))
+                if polling:
+                    await self.catch_up()
+                    await asyncio.sleep(POLL_INTERVAL)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Training stream interrupted: {str(e)}; reconnecting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX)
+
+    async def catch_up(self):
+        """Тренировки и запросы на участие после последних полученных"""
+        await self._catch_up('/api/trainings/recent', 'training_created', self._last_id)
+        await self._catch_up('/api/trainings/join-requests', 'join_requested', self._last_request_id)
+
+    async def _catch_up(self, path, event, last_id):
+        params = {"after": last_id} if last_id else {"since": self._since}
+        while True:
+            response = await self._client.get(f"{self.trainings_url}{path}",
+                                              params=dict(params, limit=RECENT_PAGE_SIZE))
+            response.raise_for_status()
+            result = response.json()
+            for item in result["data"]:
+                await self.handle(event, item)
+            if not result.get("next_cursor"):
+                return
+            params = {"after": result["next_cursor"]}
+
+    async def handle(self, event, data):
+        try:
+            if event == 'training_created':
+                if self._last_id is None or data['id'] > self._last_id:
+                    self._last_id = data['id']
+                await self.notify_nearby(data)
+            elif event == 'join_requested':
+                request_id = data.get('request_id')
+                if request_id and (self._last_request_id is None or request_id > self._last_request_id):
+                    self._last_request_id = request_id
+                await self.notify_organizer(data)
+            elif event == 'overflow':
+                logger.warning("Training stream overflowed, some notifications were lost")
+        except Exception as e:
+            logger.error(f"Error handling {event}: {str(e)}")
+
+    async def notify_nearby(self, training):
+        if self.users_url is None or training.get('is_premium'):
+            return
+
+        response = await self._client.get(f"{self.users_url}/api/users/nearby", params={
+            "lat": training['lat'], "lng": training['lng'], "radius": self.radius_km,
+        })
+        response.raise_for_status()
+
+        text = (f"🏃 Рядом новая тренировка: {training['title']}\n"
+                f"{training['sport']}, начало {training['start_time']}")
+        for user in response.json():
+            if str(user['id']) == str(training.get('user_id')):
+                continue
+            if user.get('sports') and training['sport'] not in user['sports']:
+                continue
+            await self.notifier.submit(user['id'], f"{text}\nВ {user['distance']} км от вас",
+                                       key=('training', training['id']))
+
+    async def notify_organizer(self, data):
+        participant = data['participant']
+        await self.notifier.submit(
+            data['organizer_id'],
+            f"👋 {participant['user_name']} хочет присоединиться к тренировке «{data['title']}»",
+            key=('join', data['id'], str(participant['user_id'])),
+        )
@@ -0,0 +1,37 @@
+# tests/conftest.py
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path[:0] = [os.path.join(ROOT, 'backend'), os.path.join(ROOT, 'telegram_bot'), ROOT]
+
+
+def load_module(name, path):
+    """Импорт main.py сервиса под уникальным именем: у сервисов оно совпадает"""
+    sys.path.insert(0, os.path.dirname(path))
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(os.path.dirname(path))
+    return module
+
+
+@pytest.fixture(scope='session')
+def flask_app(tmp_path_factory):
+    """flask_app с файлами хранилища во временном каталоге.
+
+    Модуль пишет снапшот и журнал по относительным путям при импорте и
+    после него, поэтому каталог остается текущим до конца сессии.
+    """
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('flask_app'))
+    os.environ.pop('STORAGE_URL', None)
+    import flask_app
+    yield flask_app
+    os.chdir(cwd)
@@ -0,0 +1,178 @@
+# tests/test_bootstrap.py
+"""gateway-service /api/bootstrap поверх flask_app, events-service и users-service
+
+flask_app отвечает по HTTP на 127.0.0.1, events-service и users-service -
+ASGI в памяти через httpx.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from shared.cache import snap
+
+from conftest import ROOT, load_module
+
+MOSCOW = (55.7558, 37.6173)
+SPORTS = ['бег', 'велоспорт', 'лыжи', 'йога', 'плавание', 'футбол']
+# Координаты на сетке snap(): gateway передает сервисам такие же
+PARAMS = {"lat": MOSCOW[0] + 0.0002, "lng": MOSCOW[1] - 0.0003, "radius": 10, "events_radius": 50}
+
+
+def delayed_asgi(app, delay):
+    """ASGI-приложение, отвечающее на delay секунд позже (сеть до сервиса)"""
+    async def wrapper(scope, receive, send):
+        if scope['type'] == 'http':
+            await asyncio.sleep(delay)
+        await app(scope, receive, send)
+    return wrapper
+
+
+def moscow_feed(path, count, rng):
+    """Лента orgeo из записей примера, перенесенных в окрестности Москвы"""
+    with open(os.path.join(ROOT, 'backend', 'events-service', 'orgeo.json'), encoding='utf-8') as f:
+        sample = json.load(f)
+    records = []
+    for n in range(count):
+        record = dict(sample[n % len(sample)], url=f"https://orgeo.ru/event/{900000 + n}")
+        record['coordinates'] = [{"lat": MOSCOW[0] + rng.gauss(0, 0.1), "lng": MOSCOW[1] + rng.gauss(0, 0.15)}]
+        records.append(record)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False)
+
+
+@pytest.fixture(scope='module')
+def services(flask_app, tmp_path_factory):
+    from werkzeug.serving import make_server
+
+    rng = random.Random(1)
+    start = datetime.now() + timedelta(hours=2)
+    response = flask_app.app.test_client().post('/api/trainings:batch', json={"trainings": [{
+        "user_id": n + 1, "user_name": f"user{n}", "title": f"Тренировка {n}", "sport": rng.choice(SPORTS),
+        "lat": MOSCOW[0] + rng.gauss(0, 0.05), "lng": MOSCOW[1] + rng.gauss(0, 0.08),
+        "start_time": start.isoformat(),
+    } for n in range(50)]})
+    assert response.status_code == 200
+    flask_server = make_server('127.0.0.1', 0, flask_app.app, threaded=True)
+    threading.Thread(target=flask_server.serve_forever, daemon=True).start()
+
+    saved = {key: os.environ.get(key) for key in
+             ('EVENTS_SNAPSHOT', 'TRAININGS_API_URL', 'EVENTS_API_URL', 'USERS_API_URL')}
+    os.environ['EVENTS_SNAPSHOT'] = ''
+    os.environ['TRAININGS_API_URL'] = f"http://127.0.0.1:{flask_server.server_port}"
+    os.environ['EVENTS_API_URL'] = 'http://events'
+    os.environ['USERS_API_URL'] = 'http://users'
+    try:
+        events = load_module('events_main', os.path.join(ROOT, 'backend', 'events-service', 'main.py'))
+        feed = str(tmp_path_factory.mktemp('events') / 'orgeo.json')
+        moscow_feed(feed, 200, random.Random(2))
+        events.ingestor.run(feed)
+        users = load_module('users_main', os.path.join(ROOT, 'backend', 'users-service', 'main.py'))
+        gateway = load_module('gateway_main', os.path.join(ROOT, 'backend', 'gateway-service', 'main.py'))
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    async def add_users():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=users.app), base_url='http://users') as client:
+            response = await client.post('/api/users/locations:batch', json={"locations": [{
+                "user_id": n, "lat": MOSCOW[0] + rng.gauss(0, 0.05), "lng": MOSCOW[1] + rng.gauss(0, 0.08),
+                "sports": rng.sample(SPORTS, 2),
+            } for n in range(200)]})
+            response.raise_for_status()
+
+    asyncio.run(add_users())
+    yield gateway, events, users
+    flask_server.shutdown()
+    flask_server.server_close()
+
+
+def bootstrap(services, users_delay=0.0, timeout=None, events_url=None):
+    """(ответ /api/bootstrap, те же источники отдельными запросами, секунды)"""
+    gateway, events, users = services
+    from fanout import Fanout
+
+    async def run():
+        mounts = {
+            'http://events': httpx.ASGITransport(app=events.app),
+            'http://users': httpx.ASGITransport(app=delayed_asgi(users.app, users_delay)),
+        }
+        saved = gateway.fanout, gateway.BOOTSTRAP_TIMEOUT, gateway.EVENTS_API_URL
+        gateway.fanout = Fanout(client=httpx.AsyncClient(mounts=mounts))
+        gateway.BOOTSTRAP_TIMEOUT = timeout or gateway.BOOTSTRAP_TIMEOUT
+        gateway.EVENTS_API_URL = events_url or gateway.EVENTS_API_URL
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=gateway.app),
+                                         base_url='http://gateway') as front:
+                started = time.perf_counter()
+                response = await front.get('/api/bootstrap', params=PARAMS, headers={"Accept-Encoding": "gzip"})
+                elapsed = time.perf_counter() - started
+
+            expected = {}
+            for source in gateway.bootstrap_sources(snap(PARAMS["lat"]), snap(PARAMS["lng"]), 10, None, 50):
+                # Медленный и недоступный сервисы не опрашиваются напрямую
+                if (source.name == 'users' and users_delay) or (source.name == 'events' and events_url):
+                    continue
+                source_response = await gateway.fanout.client.get(source.url, params=source.params)
+                source_response.raise_for_status()
+                data = source_response.json()
+                expected[source.name] = data["data"] if source.envelope else data
+            await gateway.fanout.client.aclose()
+        finally:
+            gateway.fanout, gateway.BOOTSTRAP_TIMEOUT, gateway.EVENTS_API_URL = saved
+        return response, expected, elapsed
+
+    return asyncio.run(run())
+
+
+def test_bootstrap_matches_the_services(services):
+    response, expected, _ = bootstrap(services)
+    payload = response.json()
+    assert payload["status"] == "success", payload["errors"]
+    assert set(payload["timings"]) == set(expected)
+    for name, value in expected.items():
+        assert payload["data"][name] == value, f"{name} differs from the service response"
+    assert payload["data"]["trainings"] and payload["data"]["events"] and payload["data"]["users"]
+    assert response.headers.get('content-encoding') == 'gzip'
+    assert response.headers.get('cache-control') == 'no-store'
+
+
+def test_slow_source_is_null_after_timeout(services):
+    response, expected, elapsed = bootstrap(services, users_delay=5.0, timeout=0.3)
+    payload = response.json()
+    assert payload["status"] == "partial"
+    assert payload["errors"] == {"users": "timeout"}
+    assert payload["data"]["users"] is None
+    assert payload["data"]["trainings"] == expected["trainings"]
+    assert elapsed < 0.3 + 1.0
+
+
+def test_unavailable_service_gives_partial_answer(services):
+    # Порт 9 (discard) закрыт
+    response, _, _ = bootstrap(services, events_url='http://127.0.0.1:9')
+    payload = response.json()
+    assert payload["status"] == "partial"
+    assert set(payload["errors"]) == {"events"}
+    assert payload["data"]["events"] is None
+    assert payload["data"]["users"] is not None and payload["data"]["premium"] is not None
+
+
+def test_bootstrap_validates_coordinates(services):
+    gateway = services[0]
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=gateway.app),
+                                     base_url='http://gateway') as front:
+            return [(await front.get('/api/bootstrap', params=params)).status_code
+                    for params in ({"lat": 91, "lng": 0}, {"lat": 0, "lng": 0, "radius": 0})]
+
+    assert asyncio.run(run()) == [400, 400]
@@ -0,0 +1,129 @@
+# tests/test_geocode.py
+"""Обратное геокодирование: ReverseGeocoder по settlements.csv и фильтр
+city в /api/events events-service"""
+import asyncio
+import json
+import os
+import random
+
+import httpx
+import pytest
+
+from shared.geo import calculate_distance
+from shared.geocode import MAX_DISTANCE_KM, ReverseGeocoder, load_places
+
+from conftest import ROOT, load_module
+
+GAZETTEER = os.path.join(ROOT, 'backend', 'events-service', 'settlements.csv')
+
+# Точка -> (город, регион) ближайшего пункта справочника
+FIXED_POINTS = [
+    ((55.7558, 37.6173), ("Москва", "Москва")),
+    ((55.80, 49.15), ("Казань", "Республика Татарстан")),
+    ((48.477631, 135.059448), ("Хабаровск", "Хабаровский край")),
+    ((55.92, 37.86), ("Королёв", "Московская область")),
+    ((43.60, 39.73), ("Сочи", "Краснодарский край")),
+]
+# Дальше MAX_DISTANCE_KM от любого пункта: середина Охотского моря
+NOWHERE = (55.0, 148.0)
+
+
+@pytest.fixture(scope='module')
+def places():
+    return load_places(GAZETTEER)
+
+
+def full_scan(places, lat, lng):
+    best = None
+    for place in places:
+        distance = calculate_distance(lat, lng, place.lat, place.lng)
+        if distance <= MAX_DISTANCE_KM and (best is None or distance < best[1]):
+            best = (place, distance)
+    return best
+
+
+def test_lookup_finds_nearest_settlement(places):
+    geocoder = ReverseGeocoder(places)
+    for (lat, lng), (name, region) in FIXED_POINTS:
+        place, distance = geocoder.lookup(lat, lng)
+        assert (place.name, place.region) == (name, region)
+        assert distance <= MAX_DISTANCE_KM
+    assert geocoder.lookup(*NOWHERE) is None
+
+    # Повторная точка из той же клетки округления берется из памяти
+    geocoder.lookup(55.7559, 37.6174)
+    assert geocoder.stats()["hits"] == 1
+
+
+def test_grid_matches_full_scan(places):
+    rng = random.Random(42)
+    # Без округления: сетка дает ровно тот же пункт, что перебор
+    geocoder = ReverseGeocoder(places, quantum=1e-9, memo_size=1)
+    for _ in range(500):
+        if rng.random() < 0.5:
+            place = rng.choice(places)
+            lat, lng = place.lat + rng.uniform(-0.3, 0.3), place.lng + rng.uniform(-0.5, 0.5)
+        else:
+            lat, lng = rng.uniform(42, 70), rng.uniform(20, 180)
+        expected = full_scan(places, lat, lng)
+        found = geocoder.lookup(lat, lng)
+        assert (expected and expected[0]) is (found and found[0]), (lat, lng)
+
+
+def test_resolve_ignores_swapped_coordinates(places):
+    geocoder = ReverseGeocoder(places)
+    # Вторая точка с перепутанными lat / lng никуда не попадает
+    assert geocoder.resolve([(55.80, 49.15), (49.15, 55.80)]).name == "Казань"
+    assert geocoder.resolve([NOWHERE]) is None
+
+
+@pytest.fixture(scope='module')
+def events(tmp_path_factory):
+    saved = os.environ.get('EVENTS_SNAPSHOT')
+    os.environ['EVENTS_SNAPSHOT'] = ''
+    try:
+        events = load_module('events_geocode', os.path.join(ROOT, 'backend', 'events-service', 'main.py'))
+    finally:
+        if saved is None:
+            os.environ.pop('EVENTS_SNAPSHOT', None)
+        else:
+            os.environ['EVENTS_SNAPSHOT'] = saved
+
+    feed = str(tmp_path_factory.mktemp('geocode') / 'orgeo.json')
+    points = [point for point, _ in FIXED_POINTS] + [NOWHERE]
+    with open(feed, 'w', encoding='utf-8') as f:
+        json.dump([{
+            "title": f"Старт {n}", "date": "01.10.2030", "location": "", "type": "бег",
+            "url": f"https://orgeo.ru/event/{800000 + n}", "coordinates": [{"lat": lat, "lng": lng}],
+        } for n, (lat, lng) in enumerate(points)], f, ensure_ascii=False)
+    events.ingestor.run(feed)
+    return events
+
+
+def get_events(events, **params):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=events.app),
+                                     base_url='http://events') as client:
+            response = await client.get('/api/events', params=params)
+            response.raise_for_status()
+            return response.json()
+    return asyncio.run(run())
+
+
+def test_events_carry_city_and_region(events):
+    by_title = {event["title"]: event for event in get_events(events)}
+    for n, (_, (name, region)) in enumerate(FIXED_POINTS):
+        event = by_title[f"Старт {n}"]
+        assert (event["city"], event["region"]) == (name, region)
+    nowhere = by_title[f"Старт {len(FIXED_POINTS)}"]
+    assert nowhere["city"] is None and nowhere["region"] is None
+    # Пустое место проведения заполняется подписью города
+    assert by_title["Старт 1"]["location"] == "Казань, Республика Татарстан"
+    assert by_title["Старт 0"]["location"] == "Москва"
+
+
+def test_events_filter_by_city(events):
+    assert [event["city"] for event in get_events(events, city="Казань")] == ["Казань"]
+    # Без учета регистра и ё
+    assert [event["city"] for event in get_events(events, city="КОРОЛЕВ")] == ["Королёв"]
+    assert get_events(events, city="Атлантида") == []
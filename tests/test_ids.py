@@ -0,0 +1,117 @@
+# tests/test_ids.py
+"""Генератор id: потоки и процессы без коллизий, номера процессов из хранилища"""
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from shared.ids import MAX_WORKER, IdGenerator
+from shared.storage import RedisStorage, SQLiteStorage
+
+PREFIX = 'training_'
+THREADS = 4
+PER_THREAD = 5000
+
+
+def generate(threads=THREADS, per_thread=PER_THREAD, storage_path=None):
+    """Id всех потоков одного процесса, по списку на поток"""
+    storage = SQLiteStorage(storage_path) if storage_path else None
+    generator = IdGenerator(PREFIX, lease=storage.lease_worker if storage else None)
+    results = [None] * threads
+    barrier = threading.Barrier(threads)
+
+    def run(n):
+        barrier.wait()
+        results[n] = [generator.next_id() for _ in range(per_thread)]
+
+    workers = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # Аренда остается до конца проверки: номер не достанется другому процессу
+    return results
+
+
+def check_batches(batches, started, finished):
+    generator = IdGenerator(PREFIX, worker=0)
+    seen = set()
+    total = 0
+    for ids in batches:
+        total += len(ids)
+        seen.update(ids)
+        assert ids == sorted(ids), "ids of one thread are not increasing"
+        for created in (generator.timestamp(ids[0]), generator.timestamp(ids[-1])):
+            # Счетчик может уйти вперед часов, если миллисекунда исчерпана
+            assert created is not None and started - 0.001 <= created <= finished + 1
+    assert len(seen) == total, f"{total - len(seen)} duplicate ids out of {total}"
+
+
+@pytest.mark.parametrize('method', ['spawn', 'fork'])
+def test_no_collisions_between_threads_and_processes(method, tmp_path):
+    storage_path = str(tmp_path / 'trainings.db')
+    SQLiteStorage(storage_path).close()
+    started = time.time()
+    # fork: дочерние процессы наследуют генератор родителя
+    parent = IdGenerator(PREFIX)
+    parent.next_id()
+    with multiprocessing.get_context(method).Pool(4) as pool:
+        per_process = pool.starmap(generate, [(THREADS, PER_THREAD, storage_path)] * 4)
+    finished = time.time()
+    check_batches([ids for process in per_process for ids in process], started, finished)
+
+
+def test_clock_going_back_keeps_ids_increasing():
+    now = [1000.0]
+    generator = IdGenerator(PREFIX, worker=1, clock=lambda: now[0])
+    first = generator.next_id()
+    now[0] -= 5
+    assert generator.next_id() > first
+
+
+def test_lower_bound_orders_ids_by_creation_time():
+    now = [1000.0]
+    generator = IdGenerator(PREFIX, worker=MAX_WORKER, clock=lambda: now[0])
+    before = generator.next_id()
+    now[0] = 1000.002
+    after = generator.next_id()
+    bound = generator.lower_bound(1000.001)
+    assert before < bound <= after
+    assert generator.timestamp(after) == pytest.approx(1000.002)
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def storages(request, tmp_path):
+    """Фабрика хранилищ разных процессов над одними данными"""
+    if request.param == 'sqlite':
+        path = str(tmp_path / 'trainings.db')
+        yield lambda: SQLiteStorage(path)
+    else:
+        fakeredis = pytest.importorskip('fakeredis')
+        server = fakeredis.FakeServer()
+        yield lambda: RedisStorage(fakeredis.FakeRedis(server=server))
+
+
+def test_leased_workers_are_unique(storages):
+    first, second, third = storages(), storages(), storages()
+    workers = [storage.lease_worker(None, 60, 8) for storage in (first, second, third)]
+    assert len(set(workers)) == 3
+    # Продление оставляет номер за тем же процессом
+    assert first.lease_worker(workers[0], 60, 8) == workers[0]
+    # Чужой номер не продлевается: процесс получает свободный
+    assert second.lease_worker(workers[2], 60, 8) not in (workers[0], workers[2])
+
+    third.close()
+    assert storages().lease_worker(None, 60, 8) == workers[2]
+    with pytest.raises(RuntimeError):
+        for _ in range(8):
+            storages().lease_worker(None, 60, 8)
+
+
+def test_expired_lease_is_given_to_another_process(storages):
+    first, second = storages(), storages()
+    worker = first.lease_worker(None, 0.05, 4)
+    time.sleep(0.1)
+    assert second.lease_worker(None, 60, 4) == worker
+    assert first.lease_worker(worker, 60, 4) != worker
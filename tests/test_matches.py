@@ -0,0 +1,140 @@
+# tests/test_matches.py
+"""Подбор напарников: GridIndex.nearest против перебора и
+/api/users/matches users-service"""
+import asyncio
+import os
+import random
+
+import httpx
+import pytest
+
+from shared.geo import calculate_distance
+from shared.spatial import GridIndex
+
+from conftest import ROOT, load_module
+
+MOSCOW = (55.7558, 37.6173)
+KM = 1 / 111.195  # градусов широты в километре
+
+
+def brute_force(points, lat, lng, k, radius_km, weight):
+    scored = []
+    for item_id, (item_lat, item_lng) in points.items():
+        divisor = weight(item_id)
+        distance = calculate_distance(lat, lng, item_lat, item_lng)
+        if divisor is not None and distance <= radius_km:
+            scored.append((distance / divisor, item_id))
+    scored.sort()
+    return [score for score, _ in scored[:k]]
+
+
+@pytest.mark.parametrize('cell_size', [0.05, 0.5])
+def test_nearest_matches_brute_force(cell_size):
+    rng = random.Random(7)
+    index = GridIndex(cell_size)
+    points = {}
+    # Скопления у городов, разреженный фон и точки у 180-го меридиана
+    centers = [MOSCOW, (59.9343, 30.3351), (64.7, 177.5), (64.7, -179.8)]
+    for item_id in range(3000):
+        if rng.random() < 0.8:
+            lat, lng = rng.choice(centers)
+            lat, lng = lat + rng.gauss(0, 0.2), lng + rng.gauss(0, 0.3)
+        else:
+            lat, lng = rng.uniform(40, 70), rng.uniform(20, 60)
+        lng = (lng + 180) % 360 - 180
+        points[item_id] = (lat, lng)
+        index.add(item_id, lat, lng)
+    weights = {item_id: rng.choice([None, 1, 2, 3]) for item_id in points}
+
+    for _ in range(100):
+        lat, lng = rng.choice(centers)
+        lat, lng = lat + rng.gauss(0, 0.3), (lng + rng.gauss(0, 0.4) + 180) % 360 - 180
+        k = rng.choice([1, 5, 20])
+        radius = rng.choice([5, 50, 300])
+        for weight, max_weight in ((None, 1.0), (weights.get, 3.0)):
+            expected = brute_force(points, lat, lng, k, radius, weight or (lambda item_id: 1))
+            found = index.nearest(lat, lng, k, radius, weight, max_weight)
+            scores = [distance / (weight(item_id) if weight else 1) for item_id, distance in found]
+            # Равные оценки могут идти в другом порядке: сравниваются оценки
+            assert scores == pytest.approx(expected, abs=1e-9), (lat, lng, k, radius)
+
+
+def test_nearest_on_empty_index():
+    index = GridIndex()
+    assert index.nearest(*MOSCOW, 10, 50) == []
+    index.add('far', 48.4802, 135.0719)
+    # Единственная точка за радиусом
+    assert index.nearest(*MOSCOW, 10, 50) == []
+
+
+@pytest.fixture(scope='module')
+def users():
+    users = load_module('users_matches', os.path.join(ROOT, 'backend', 'users-service', 'main.py'))
+    # Смещения к северу от Москвы в километрах
+    locations = [
+        {"user_id": 1, "username": "Бегун", "lat": MOSCOW[0] + 4 * KM, "lng": MOSCOW[1], "sports": ["бег"]},
+        {"user_id": 2, "username": "Триатлет", "lat": MOSCOW[0] + 5 * KM, "lng": MOSCOW[1],
+         "sports": ["бег", "йога"]},
+        {"user_id": 3, "username": "Футболист", "lat": MOSCOW[0] + 1 * KM, "lng": MOSCOW[1],
+         "sports": ["футбол"]},
+        {"user_id": 4, "username": "Без видов", "lat": MOSCOW[0] + 2 * KM, "lng": MOSCOW[1]},
+        {"user_id": 5, "username": "Далеко", "lat": MOSCOW[0] + 80 * KM, "lng": MOSCOW[1], "sports": ["бег"]},
+    ]
+
+    async def add_users():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=users.app),
+                                     base_url='http://users') as client:
+            response = await client.post('/api/users/locations:batch', json={"locations": locations})
+            response.raise_for_status()
+
+    asyncio.run(add_users())
+    return users
+
+
+def get_matches(users, **params):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=users.app),
+                                     base_url='http://users') as client:
+            return await client.get('/api/users/matches', params=params)
+    return asyncio.run(run())
+
+
+def test_matches_rank_by_distance_without_sports(users):
+    response = get_matches(users, lat=MOSCOW[0], lng=MOSCOW[1], k=3)
+    assert response.status_code == 200
+    matches = response.json()
+    assert [match["id"] for match in matches] == [3, 4, 1]
+    assert [match["distance"] for match in matches] == [1.0, 2.0, 4.0]
+    assert all(match["shared_sports"] == [] for match in matches)
+
+
+def test_matches_rank_by_shared_sports(users):
+    # 5 км с двумя общими видами (5 / 3) лучше 4 км с одним (4 / 2);
+    # футболист и пользователь без видов спорта не подходят
+    matches = get_matches(users, lat=MOSCOW[0], lng=MOSCOW[1], sport=["бег", "йога"]).json()
+    assert [match["id"] for match in matches] == [2, 1]
+    assert matches[0]["shared_sports"] == ["бег", "йога"]
+    assert matches[1]["shared_sports"] == ["бег"]
+
+
+def test_matches_exclude_requesting_user(users):
+    # Координаты и виды спорта берутся у user_id, сам он в ответ не попадает
+    matches = get_matches(users, user_id=1).json()
+    assert [match["id"] for match in matches] == [2]
+    assert matches[0]["distance"] == 1.0
+    # С явным видом спорта и радиусом, накрывающим всех
+    matches = get_matches(users, user_id=1, sport="бег", radius=100).json()
+    assert [match["id"] for match in matches] == [2, 5]
+
+
+def test_matches_empty_ring(users):
+    # Вокруг Хабаровска никого: кольца обходятся до радиуса и пусты
+    assert get_matches(users, lat=48.4802, lng=135.0719, radius=500).json() == []
+    # Вид спорта, который не указал никто
+    assert get_matches(users, lat=MOSCOW[0], lng=MOSCOW[1], sport="керлинг").json() == []
+
+
+def test_matches_validate_arguments(users):
+    assert get_matches(users, lat=MOSCOW[0], lng=MOSCOW[1], k=0).status_code == 400
+    assert get_matches(users, lat=MOSCOW[0], lng=MOSCOW[1], radius=1000).status_code == 400
+    assert get_matches(users, user_id=999).status_code == 400
@@ -0,0 +1,216 @@
+# tests/test_notifications.py
+"""Уведомления бота на локальном поддельном Bot API
+
+Заглушка на 127.0.0.1 отвечает на sendMessage (429, 500 и 403 для
+отдельных чатов) и на /api/users/nearby users-service.
+"""
+import asyncio
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+from notifications import Notifier, RateLimiter
+import watcher
+from watcher import TrainingWatcher
+
+TOKEN = 'TEST:TOKEN'
+RATE = 10
+CHAT_INTERVAL = 1.0
+RATE_LIMITED_CHAT = 1
+FLAKY_CHAT = 2
+BLOCKED_CHAT = 3
+CHATS = 15
+
+ORGANIZER = 500
+NEARBY_USERS = [
+    {"id": 100, "sports": ["бег"], "distance": 0.4},
+    {"id": 101, "sports": ["йога"], "distance": 0.9},
+    {"id": 102, "sports": [], "distance": 2.5},
+    {"id": ORGANIZER, "sports": ["бег"], "distance": 0.0},
+]
+
+
+class FakeTelegram(http.server.ThreadingHTTPServer):
+    """Bot API sendMessage и /api/users/nearby users-service"""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeHandler)
+        self.lock = threading.Lock()
+        self.messages = []  # (время, chat_id, текст)
+        self.attempts = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def chats(self):
+        with self.lock:
+            return sorted(chat_id for _, chat_id, _ in self.messages)
+
+
+class FakeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/api/users/nearby'):
+            self.reply(200, NEARBY_USERS)
+        else:
+            self.reply(404, {"detail": "Not Found"})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        data = json.loads(self.rfile.read(length))
+        if self.path != f"/bot{TOKEN}/sendMessage":
+            self.reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            return
+
+        chat_id = data['chat_id']
+        with self.server.lock:
+            attempt = self.server.attempts[chat_id] = self.server.attempts.get(chat_id, 0) + 1
+            if chat_id == BLOCKED_CHAT:
+                status = 403
+            elif attempt == 1 and chat_id in (RATE_LIMITED_CHAT, FLAKY_CHAT):
+                status = 429 if chat_id == RATE_LIMITED_CHAT else 500
+            else:
+                status = 200
+                self.server.messages.append((time.monotonic(), chat_id, data['text']))
+
+        if status == 200:
+            self.reply(200, {"ok": True, "result": {"message_id": attempt, "chat": {"id": chat_id}}})
+        elif status == 429:
+            self.reply(429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                             "parameters": {"retry_after": 1}})
+        elif status == 403:
+            self.reply(403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"})
+        else:
+            self.reply(500, {"ok": False, "error_code": 500, "description": "Internal Server Error"})
+
+
+@pytest.fixture
+def telegram():
+    server = FakeTelegram()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def flask_url(flask_app):
+    """flask_app по HTTP: TrainingWatcher читает поток через httpx"""
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, flask_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_notifier_delivers_each_notification_once_within_limits(telegram):
+    async def run():
+        notifier = Notifier(TOKEN, api_url=telegram.url, limiter=RateLimiter(RATE, CHAT_INTERVAL), backoff_base=0.2)
+        await notifier.start()
+        expected = set()
+        for chat_id in range(1, CHATS + 1):
+            for n in range(3):
+                # Каждое уведомление отправляется дважды: второе склеивается
+                for _ in range(2):
+                    await notifier.submit(chat_id, f"update {n} for {chat_id}", key=('update', n))
+                if chat_id != BLOCKED_CHAT:
+                    expected.add((chat_id, f"update {n} for {chat_id}"))
+        await notifier.close(timeout=120)
+        return notifier, expected
+
+    notifier, expected = asyncio.run(run())
+    with telegram.lock:
+        messages = list(telegram.messages)
+    delivered = [(chat_id, text) for _, chat_id, text in messages]
+
+    assert len(delivered) == len(set(delivered)), "some notifications were delivered more than once"
+    assert set(delivered) == expected
+    assert notifier.stats['coalesced'] == 3 * CHATS
+    assert telegram.attempts.get(BLOCKED_CHAT) == 3
+    assert notifier.stats['retried'] >= 2
+
+    times_by_chat = {}
+    for sent_at, chat_id, _ in messages:
+        times_by_chat.setdefault(chat_id, []).append(sent_at)
+    for chat_id, times in times_by_chat.items():
+        # Запрос доходит до сервера с небольшим разбросом задержки
+        assert all(b - a >= CHAT_INTERVAL - 0.05 for a, b in zip(times, times[1:])), f"chat {chat_id}"
+
+    times = sorted(sent_at for sent_at, _, _ in messages)
+    window = 0
+    for n, sent_at in enumerate(times):
+        while times[window] <= sent_at - 1:
+            window += 1
+        assert n - window + 1 <= RATE + 1, f"{n - window + 1} messages within one second"
+
+
+async def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+
+def watch(telegram, flask_app, flask_url, expected):
+    """Создать тренировку и запрос на участие, дождаться уведомлений"""
+    client = flask_app.app.test_client()
+
+    async def run():
+        notifier = Notifier(TOKEN, api_url=telegram.url, limiter=RateLimiter(RATE, CHAT_INTERVAL))
+        training_watcher = TrainingWatcher(notifier, flask_url, telegram.url)
+        await notifier.start()
+        await training_watcher.start()
+        # Подписка на поток устанавливается асинхронно
+        await asyncio.sleep(0.5)
+
+        training = {"user_id": ORGANIZER, "user_name": "Организатор", "title": "Утренняя пробежка",
+                    "sport": "бег", "lat": 55.75, "lng": 37.61, "start_time": "2030-01-01T08:00:00",
+                    "auto_accept": False}
+        response = await asyncio.to_thread(client.post, '/api/trainings', json=training)
+        training_id = response.get_json()['training_id']
+        await asyncio.to_thread(client.post, f'/api/trainings/{training_id}/join',
+                                json={"user_id": 100, "user_name": "Бегун"})
+
+        await wait_for(lambda: len(telegram.chats()) >= len(expected))
+        await asyncio.sleep(0.5)
+        await training_watcher.close()
+        await notifier.close()
+
+    asyncio.run(run())
+    return telegram.chats()
+
+
+def test_watcher_notifies_nearby_users_and_organizer(telegram, flask_app, flask_url, monkeypatch):
+    monkeypatch.setattr(flask_app, 'TRAININGS_STREAM', True)
+    # Поток замечает отключение клиента при следующем keep-alive
+    monkeypatch.setattr(flask_app, 'STREAM_HEARTBEAT', 0.2)
+    # 100 - тот же вид спорта, 102 - без предпочтений, 500 - запрос организатору
+    expected = [100, 102, ORGANIZER]
+    assert watch(telegram, flask_app, flask_url, expected) == expected
+
+
+def test_watcher_polls_trainings_and_join_requests_without_stream(telegram, flask_app, flask_url, monkeypatch):
+    monkeypatch.setattr(watcher, 'POLL_INTERVAL', 0.1)
+    # Без потока запрос на участие догоняется по /api/trainings/join-requests
+    expected = [100, 102, ORGANIZER]
+    assert watch(telegram, flask_app, flask_url, expected) == expected
@@ -0,0 +1,64 @@
+# tests/test_recent_trainings.py
+import time
+from datetime import datetime, timedelta
+
+
+def training(n):
+    return {
+        "user_id": n, "user_name": f"user{n}", "title": f"Тренировка {n}", "sport": "бег",
+        "lat": 55.75, "lng": 37.61, "start_time": (datetime.now() + timedelta(hours=2)).isoformat(),
+    }
+
+
+def test_recent_trainings_are_paged_by_id(flask_app):
+    client = flask_app.app.test_client()
+    since = time.time()
+    response = client.post('/api/trainings:batch', json={"trainings": [training(n) for n in range(1, 8)]})
+    created = response.get_json()["training_ids"]
+
+    assert client.get('/api/trainings/recent').status_code == 400
+    seen = []
+    params = {"since": since, "limit": 3}
+    while True:
+        result = client.get('/api/trainings/recent', query_string=params).get_json()
+        seen.extend(item["id"] for item in result["data"])
+        if not result["next_cursor"]:
+            break
+        params = {"after": result["next_cursor"], "limit": 3}
+    assert seen == created
+    assert all(item["participants_count"] == 1 for item in result["data"])
+
+    # После удаления тренировка пропадает из выборки
+    with flask_app.storage_lock:
+        flask_app.drop_training(created[3])
+    result = client.get('/api/trainings/recent', query_string={"after": created[1]}).get_json()
+    assert [item["id"] for item in result["data"]] == created[2:3] + created[4:]
+    assert client.get('/api/trainings/recent', query_string={"after": created[-1]}).get_json()["data"] == []
+
+
+def test_join_requests_are_paged_by_id(flask_app):
+    client = flask_app.app.test_client()
+    since = time.time()
+    response = client.post('/api/trainings', json=dict(training(1), auto_accept=False))
+    training_id = response.get_json()["training_id"]
+    for n in (2, 3, 2):
+        client.post(f'/api/trainings/{training_id}/join', json={"user_id": n, "user_name": f"user{n}"})
+
+    assert client.get('/api/trainings/join-requests').status_code == 400
+    result = client.get('/api/trainings/join-requests', query_string={"since": since, "limit": 1}).get_json()
+    assert [item["participant"]["user_id"] for item in result["data"]] == [2]
+    assert result["data"][0]["organizer_id"] == 1
+    result = client.get('/api/trainings/join-requests', query_string={"after": result["next_cursor"]}).get_json()
+    # Повторный запрос того же пользователя не записывается
+    assert [item["participant"]["user_id"] for item in result["data"]] == [3]
+    assert result["next_cursor"] is None
+
+    # Запросы пишутся в журнал и переживают перезапуск из снимка
+    with flask_app.storage_lock:
+        flask_app.restore_snapshot(flask_app.storage_snapshot())
+    result = client.get('/api/trainings/join-requests', query_string={"since": since}).get_json()
+    assert [item["id"] for item in result["data"]] == [training_id, training_id]
+
+    with flask_app.storage_lock:
+        flask_app.drop_training(training_id)
+    assert client.get('/api/trainings/join-requests', query_string={"since": since}).get_json()["data"] == []
@@ -0,0 +1,30 @@
+# tests/test_roster.py
+from shared.roster import Roster
+
+
+def collect(roster, limit):
+    items = []
+    cursor = None
+    while True:
+        page, cursor = roster.page(cursor, limit)
+        items.extend(page)
+        if cursor is None:
+            return items
+
+
+def test_pages_keep_participants_with_equal_joined_at():
+    # Пакетное вступление: у многих участников одно и то же время
+    participants = [{"user_id": n, "joined_at": "2026-01-01T10:00:00" if n % 4 else f"2026-01-01T09:{n:02d}:00"}
+                    for n in range(40)]
+    roster = Roster(reversed(participants))
+    for limit in (1, 3, 7, 50):
+        items = collect(roster, limit)
+        assert len(items) == len(participants)
+        assert sorted(item["user_id"] for item in items) == list(range(40))
+        assert [item["joined_at"] for item in items] == sorted(item["joined_at"] for item in items)
+
+
+def test_old_cursor_format_does_not_skip_participants():
+    roster = Roster([{"user_id": n, "joined_at": "2026-01-01T10:00:00"} for n in range(5)])
+    page, cursor = roster.page("2026-01-01T10:00:00", 10)
+    assert len(page) == 5 and cursor is None
@@ -0,0 +1,155 @@
+# tests/test_snapshot.py
+"""Колоночный снапшот мероприятий: открытие, чтение после замены файла и
+ответы query(), совпадающие с EventIndex в памяти"""
+import json
+import os
+import random
+import sys
+
+import pytest
+
+from shared.geo import calculate_distance
+from shared.geocode import ReverseGeocoder
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'backend', 'events-service'))
+
+from parser import Ingestor
+from snapshot import SnapshotIndex, write_snapshot
+
+GAZETTEER = os.path.join(ROOT, 'backend', 'events-service', 'settlements.csv')
+SAMPLE_FEED = os.path.join(ROOT, 'backend', 'events-service', 'orgeo.json')
+DAY = 86400
+CITIES = [(55.7558, 37.6173), (55.7963, 49.1088), (55.9162, 37.8545), (48.4802, 135.0719)]
+
+
+def write_feed(path, size, rng, changed=0.0):
+    """Лента из записей orgeo.json с новыми url и точками у городов"""
+    with open(SAMPLE_FEED, encoding='utf-8') as f:
+        samples = json.load(f)
+    records = []
+    for n in range(size):
+        record = dict(rng.choice(samples), url=f"https://orgeo.ru/event/{700000 + n}")
+        lat, lng = rng.choice(CITIES)
+        record['coordinates'] = [{"lat": lat + rng.gauss(0, 0.1), "lng": lng + rng.gauss(0, 0.15)}]
+        if n % 10 == 0:
+            # Место вне справочника: город не определяется
+            record['coordinates'] = [{"lat": 0.0, "lng": -150.0 + n * 0.01}]
+        if changed and n % int(1 / changed) == 0:
+            record['title'] += ' (перенос)'
+        records.append(record)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False)
+
+
+@pytest.fixture(scope='module')
+def geocoder():
+    return ReverseGeocoder.from_file(GAZETTEER)
+
+
+@pytest.fixture(scope='module')
+def feeds(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('feeds')
+    feed, changed = str(directory / 'orgeo.json'), str(directory / 'orgeo-changed.json')
+    write_feed(feed, 400, random.Random(1))
+    write_feed(changed, 400, random.Random(1), changed=0.05)
+    return feed, changed
+
+
+def queries(rng, index):
+    """Запросы по тексту, радиусу, датам и городу, по одному и в сочетаниях"""
+    events = list(index.events.values())
+    dated = sorted(event.starts_at for event in events if event.starts_at is not None)
+    found = [{}]
+    for _ in range(15):
+        event = rng.choice(events)
+        lat, lng = event.coordinates[0]
+        middle = rng.choice(dated)
+        words = event.title.split()
+        found += [
+            {"q": words[0]},
+            {"q": words[-1][:3]},
+            {"lat": lat, "lng": lng, "radius": rng.choice([5, 50, 300])},
+            {"date_from": middle - 10 * DAY, "date_to": middle + 10 * DAY},
+            {"date_from": middle},
+            {"date_to": middle},
+            {"city": (event.city or 'москва').upper()},
+            {"city": event.city, "q": words[-1], "date_to": middle + 90 * DAY},
+            {"lat": lat, "lng": lng, "radius": 200, "date_from": middle - 30 * DAY, "sport": event.sport},
+        ]
+    found += [{"city": "королев"}, {"city": "Атлантида"}, {"q": "zzzz"}, {"lat": 0.0, "lng": 0.0, "radius": 10}]
+    return found
+
+
+def assert_same_answers(expected_index, actual_index, params):
+    expected = list(expected_index.query(**params))
+    actual = list(actual_index.query(**params))
+    assert sorted(e.id for e in expected) == sorted(e.id for e in actual), params
+    by_id = {e.id: e.to_dict() for e in expected}
+    assert all(by_id[e.id] == e.to_dict() for e in actual), params
+
+    # Равные ключи порядка могут идти по-разному: сравниваются ключи
+    if "lat" in params:
+        def key(event):
+            return round(min(calculate_distance(params["lat"], params["lng"], lat, lng)
+                             for lat, lng in event.coordinates), 9)
+    elif "date_from" in params or "date_to" in params:
+        def key(event):
+            return event.starts_at
+    else:
+        return
+    assert [key(e) for e in expected] == [key(e) for e in actual], params
+
+
+def test_open_missing_or_foreign_file_gives_empty_index(tmp_path):
+    missing = SnapshotIndex.open(str(tmp_path / 'events.snapshot'))
+    assert len(missing) == 0 and list(missing.query()) == []
+
+    foreign = tmp_path / 'foreign.snapshot'
+    foreign.write_bytes(b'not a snapshot at all')
+    assert len(SnapshotIndex.open(str(foreign))) == 0
+    with pytest.raises(ValueError):
+        SnapshotIndex.load(str(foreign))
+
+    empty = tmp_path / 'empty.snapshot'
+    empty.write_bytes(b'')
+    assert len(SnapshotIndex.open(str(empty))) == 0
+
+
+def test_snapshot_matches_memory_index(geocoder, feeds, tmp_path):
+    path = str(tmp_path / 'events.snapshot')
+    memory = Ingestor(geocoder)
+    columns = Ingestor(geocoder, path)
+    rng = random.Random(42)
+    for feed in feeds:
+        memory.run(feed)
+        columns.run(feed)
+        # Снапшот, открытый заново (рестарт сервиса), отвечает так же
+        reopened = SnapshotIndex.open(path)
+        assert len(reopened) == len(memory.current) == 400
+        assert reopened.hashes == memory.current.hashes
+        for params in queries(rng, memory.current):
+            assert_same_answers(memory.current, reopened, params)
+            assert_same_answers(memory.current, columns.current, params)
+
+
+def test_reader_keeps_old_version_after_replace(geocoder, feeds, tmp_path):
+    path = str(tmp_path / 'events.snapshot')
+    feed, changed = feeds
+    ingestor = Ingestor(geocoder, path)
+    ingestor.run(feed)
+    old = ingestor.current
+    before = {event.id: event.to_dict() for event in old.query()}
+
+    # Загрузка с изменениями пишет новый файл и подменяет его через os.replace
+    ingestor.run(changed)
+    assert ingestor.current is not old
+    assert {event.id: event.to_dict() for event in old.query()} == before
+    assert sum(event.title.endswith('(перенос)') for event in ingestor.current.query()) == 20
+    assert not any(event["title"].endswith('(перенос)') for event in before.values())
+
+    # Чужая замена файла тоже не трогает отображенную версию
+    write_snapshot(path, [])
+    assert {event.id: event.to_dict() for event in old.query()} == before
+    assert len(SnapshotIndex.open(path)) == 0
@@ -0,0 +1,100 @@
+# tests/test_storage.py
+"""Общие хранилища: изменения одного воркера доходят до другого через poll"""
+import time
+
+import pytest
+
+from shared.pubsub import Subscription
+from shared.storage import RedisStorage, SQLiteStorage
+
+MOSCOW = (55.7558, 37.6173)
+
+
+def make_training(training_id):
+    return {
+        "id": training_id, "user_id": 1, "user_name": "user1", "title": "Пробежка", "sport": "бег",
+        "lat": MOSCOW[0], "lng": MOSCOW[1], "start_time": "2026-01-01T10:00:00",
+        "expires_at": time.time() + 3600,
+    }
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def workers(request, tmp_path):
+    """Фабрика хранилищ двух "воркеров" над одними данными"""
+    if request.param == 'sqlite':
+        path = str(tmp_path / 'trainings.db')
+        yield lambda: SQLiteStorage(path)
+    else:
+        fakeredis = pytest.importorskip('fakeredis')
+        server = fakeredis.FakeServer()
+        yield lambda: RedisStorage(fakeredis.FakeRedis(server=server))
+
+
+def test_poll_applies_changes_of_other_workers(workers):
+    snapshots = []
+    first, second = workers(), workers()
+    assert first.load(snapshots.append, None) is True
+    first.compact(lambda: {"trainings": {}, "participants": {}})
+    assert second.load(snapshots.append, None) is False
+    assert snapshots[-1] == {"trainings": {}, "participants": {}, "requests": []}
+
+    participant = {"user_id": 2, "user_name": "user2", "joined_at": "2026-01-01T09:00:00"}
+    join_request = {"request_id": "request_1", "id": "t1", "title": "Пробежка", "organizer_id": 1,
+                    "participant": {"user_id": 3, "user_name": "user3", "user_photo": None}}
+    first.append_many([
+        {"op": "create", "id": "t1", "training": make_training("t1")},
+        {"op": "join", "id": "t1", "participant": participant},
+        {"op": "request", "id": "t1", "request": join_request},
+    ])
+    applied = []
+    assert second.poll(snapshots.append, applied.append) == 3
+    assert [record["op"] for record in applied] == ["create", "join", "request"]
+    assert applied[1]["participant"] == participant
+    assert applied[2]["request"] == join_request
+    # Свои записи воркер не применяет повторно
+    assert first.poll(snapshots.append, applied.append) == 0
+
+    third = workers()
+    third.load(snapshots.append, None)
+    assert list(snapshots[-1]["trainings"]) == ["t1"]
+    assert snapshots[-1]["participants"] == {"t1": [participant]}
+    assert snapshots[-1]["requests"] == [join_request]
+
+    first.append('remove', id='t1')
+    applied.clear()
+    assert second.poll(snapshots.append, applied.append) == 1
+    assert applied == [{"op": "remove", "id": "t1"}]
+    third.load(snapshots.append, None)
+    assert snapshots[-1]["trainings"] == {}
+    assert snapshots[-1]["requests"] == []
+
+    for storage in (first, second, third):
+        storage.close()
+
+
+def test_apply_change_publishes_and_skips_unknown_trainings(flask_app):
+    subscription = flask_app.training_hub.subscribe(Subscription(*MOSCOW, 10))
+    try:
+        with flask_app.storage_lock:
+            flask_app.apply_change({"op": "create", "id": "remote_1", "training": make_training("remote_1")})
+            flask_app.apply_change({"op": "join", "id": "remote_1", "participant": {"user_id": 3}})
+            join_request = {"request_id": "request_remote_1", "id": "remote_1", "title": "Пробежка",
+                            "organizer_id": 1, "participant": {"user_id": 5}}
+            flask_app.apply_change({"op": "request", "id": "remote_1", "request": join_request})
+            # Повтор той же записи (догон после своего же poll) не публикуется дважды
+            flask_app.apply_change({"op": "request", "id": "remote_1", "request": join_request})
+            assert flask_app.join_requests["request_remote_1"] == join_request
+            flask_app.apply_change({"op": "remove", "id": "remote_1"})
+            # Запись о тренировке, удаленной раньше, не создает пустой список участников
+            flask_app.apply_change({"op": "join", "id": "remote_1", "participant": {"user_id": 4}})
+        assert "remote_1" not in flask_app.training_participants
+        assert "request_remote_1" not in flask_app.join_requests
+
+        messages = []
+        while (message := subscription._pop()) is not None:
+            messages.append(message)
+        assert [message["type"] for message in messages] == [
+            "training_created", "participant_joined", "join_requested", "training_expired"]
+        assert messages[1]["data"]["participants_count"] == 1
+    finally:
+        flask_app.training_hub.unsubscribe(subscription)
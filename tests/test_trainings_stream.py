@@ -0,0 +1,46 @@
+# tests/test_trainings_stream.py
+from datetime import datetime, timedelta
+
+MOSCOW = (55.7558, 37.6173)
+
+
+def training(user_id, lat, lng):
+    return {
+        "user_id": user_id, "user_name": f"user{user_id}", "title": "Пробежка", "sport": "бег",
+        "lat": lat, "lng": lng, "start_time": (datetime.now() + timedelta(hours=2)).isoformat(),
+    }
+
+
+def test_stream_is_disabled_by_default(flask_app):
+    client = flask_app.app.test_client()
+    response = client.get('/api/trainings/stream', query_string={"lat": MOSCOW[0], "lng": MOSCOW[1]})
+    assert response.status_code == 404
+
+
+def test_stream_delivers_trainings_in_viewport(flask_app, monkeypatch):
+    monkeypatch.setattr(flask_app, 'TRAININGS_STREAM', True)
+    monkeypatch.setattr(flask_app, 'STREAM_HEARTBEAT', 0.05)
+    client = flask_app.app.test_client()
+
+    response = client.get('/api/trainings/stream', buffered=False,
+                          query_string={"lat": MOSCOW[0], "lng": MOSCOW[1], "radius": 10})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    stream = response.response
+    try:
+        assert next(stream) == b": connected\n\n"
+
+        # Тренировка вне области не приходит, в области - приходит
+        assert client.post('/api/trainings', json=training(1, 59.9343, 30.3351)).status_code == 200
+        assert client.post('/api/trainings', json=training(2, *MOSCOW)).status_code == 200
+
+        chunk = next(stream)
+        while chunk == b": ping\n\n":
+            chunk = next(stream)
+        event, data = chunk.decode('utf-8').strip().split('\n')
+        assert event == "event: training_created"
+        assert '"user_id":2' in data.replace(' ', '')
+        assert len(flask_app.training_hub) == 1
+    finally:
+        response.close()
+    assert len(flask_app.training_hub) == 0
@@ -0,0 +1,158 @@
+# tests/test_wal.py
+"""Журнал изменений, снапшоты и групповая запись (shared/wal.py)"""
+import os
+import stat
+import threading
+
+import pytest
+
+from shared import wal
+from shared.wal import ChangeLog, GroupCommit, atomic_write
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_atomic_write_creates_file_with_umask_mode(tmp_path):
+    path = tmp_path / 'snapshot.json'
+    umask = os.umask(0o022)
+    os.umask(umask)
+    atomic_write(str(path), b'{}')
+    assert path.read_bytes() == b'{}'
+    assert mode(path) == 0o666 & ~umask
+    # Временные файлы не остаются
+    assert os.listdir(tmp_path) == ['snapshot.json']
+
+
+def test_atomic_write_keeps_mode_of_existing_file(tmp_path):
+    path = tmp_path / 'events.snapshot'
+    path.write_bytes(b'old')
+    os.chmod(path, 0o644)
+    atomic_write(str(path), b'new')
+    assert path.read_bytes() == b'new'
+    assert mode(path) == 0o644
+
+
+def records(n, start=0):
+    return [{"op": "join", "id": "t1", "participant": {"user_id": user_id}} for user_id in range(start, start + n)]
+
+
+def replay(tmp_path):
+    """Состояние из снапшота и лога, как при старте процесса"""
+    state = {"snapshot": None, "applied": []}
+    log = ChangeLog(str(tmp_path / 'snapshot.json'), str(tmp_path / 'changes.log'))
+    log.load(lambda snapshot: state.update(snapshot=snapshot), state["applied"].append)
+    return log, state
+
+
+def test_replay_ignores_truncated_last_record(tmp_path):
+    log, _ = replay(tmp_path)
+    log.append_many(records(3))
+    log.close()
+    # Процесс упал посреди append: последняя строка без перевода строки
+    with open(tmp_path / 'changes.log', 'ab') as f:
+        f.write(b'{"op":"join","id":"t1","partic')
+
+    log, state = replay(tmp_path)
+    assert state["applied"] == records(3)
+    # Хвост отрезан: следующая запись не склеивается с битой строкой
+    log.append_many(records(1, start=3))
+    log.close()
+    assert replay(tmp_path)[1]["applied"] == records(4)
+
+
+def test_replay_stops_at_corrupted_last_line(tmp_path):
+    log, _ = replay(tmp_path)
+    log.append_many(records(2))
+    log.close()
+    with open(tmp_path / 'changes.log', 'ab') as f:
+        f.write(b'\x00\x00garbage\n')
+
+    _, state = replay(tmp_path)
+    assert state["applied"] == records(2)
+    assert (tmp_path / 'changes.log').read_bytes().count(b'\n') == 2
+
+
+def test_crash_between_rotation_and_snapshot(tmp_path, monkeypatch):
+    log, state = replay(tmp_path)
+    assert state["snapshot"] is None
+    log.compact(lambda: {"applied": 0})
+    log.append_many(records(2))
+
+    def crash(path, data):
+        raise OSError("power lost")
+
+    # Лог уже переименован в changes.log.1, снапшот не записан
+    monkeypatch.setattr(wal, 'atomic_write', crash)
+    with pytest.raises(OSError):
+        log.compact(lambda: {"applied": 2})
+    monkeypatch.undo()
+    log.close()
+    assert not (tmp_path / 'changes.log').exists()
+    assert (tmp_path / 'changes.log.1').exists()
+
+    # Старый снапшот + ротированный лог: ничего не потеряно
+    log, state = replay(tmp_path)
+    assert state["snapshot"] == {"applied": 0}
+    assert state["applied"] == records(2)
+
+    # Записи после сбоя идут в свежий лог, следующая компакция склеивает оба
+    log.append_many(records(1, start=2))
+    assert replay(tmp_path)[1]["applied"] == records(3)
+    log.compact(lambda: {"applied": 3})
+    log.close()
+    assert sorted(os.listdir(tmp_path)) == ['snapshot.json']
+    _, state = replay(tmp_path)
+    assert state == {"snapshot": {"applied": 3}, "applied": []}
+
+
+def test_group_commit_wakes_all_writers_after_one_fsync(tmp_path, monkeypatch):
+    log, _ = replay(tmp_path)
+    fsyncs = []
+    real_fsync = os.fsync
+
+    def fsync(fd):
+        fsyncs.append(fd)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', fsync)
+    committer = GroupCommit(log, window=0.05)
+
+    # submit под блокировкой состояния только ставит в очередь: порядок
+    # в журнале - порядок submit, а не порядок пробуждения писателей
+    tickets = [committer.submit(records(1, start=n)) for n in range(8)]
+    errors = []
+
+    def wait(ticket):
+        try:
+            ticket.wait()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=wait, args=(ticket,)) for ticket in tickets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    log.close()
+
+    assert not errors and all(ticket.done.is_set() for ticket in tickets)
+    assert len(fsyncs) == 1
+    assert (committer.flushes, committer.records) == (1, 8)
+    assert replay(tmp_path)[1]["applied"] == records(8)
+
+
+def test_group_commit_error_reaches_every_writer(tmp_path):
+    class BrokenStorage:
+        def append_many(self, records):
+            raise OSError("disk full")
+
+    committer = GroupCommit(BrokenStorage(), window=0)
+    tickets = [committer.submit(records(1, start=n)) for n in range(3)]
+    for ticket in tickets:
+        with pytest.raises(OSError, match="disk full"):
+            ticket.wait()
+    assert committer.flushes == 1
+    # Пустой пакет не ждет записи
+    assert committer.submit([]).done.is_set()